@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Per-asset preprocessing cache
+Keeps expensive per-input encodings (VAE latents of reference images, audio
+feature embeddings) keyed by content hash, in a memory tier backed by an
+optional disk tier, so a repeated image or audio file skips its encoder pass
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from result_cache import disk_entries, evict_lru
+
+EVICTION_POLICIES = ('lru', 'lfu', 'fifo')
+
+
+def file_digest(path, chunk_bytes=1024 * 1024):
+    """SHA-256 of a file, read in blocks"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def estimate_nbytes(value):
+    """Approximate memory footprint of a cached value (tensors, arrays, containers)"""
+    if hasattr(value, 'element_size') and hasattr(value, 'nelement'):
+        return value.element_size() * value.nelement()
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values()) + sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in value) + sys.getsizeof(value)
+    return sys.getsizeof(value)
+
+
+def to_cpu(value):
+    """Move tensors to host memory so cached entries do not pin GPU memory"""
+    if hasattr(value, 'detach') and hasattr(value, 'cpu'):
+        return value.detach().cpu()
+    if isinstance(value, dict):
+        return {k: to_cpu(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(to_cpu(v) for v in value)
+    return value
+
+
+def encode_entry(value):
+    """
+    Split a cached value into a JSON layout and a dict of numpy arrays for an
+    .npz file. Arrays, tensors, bytes, JSON scalars and dicts/lists/tuples of
+    them are supported; anything else raises TypeError. Nothing is pickled,
+    so loading an entry never runs code from the cache directory.
+    """
+    arrays = {}
+
+    def add(array):
+        name = f"a{len(arrays)}"
+        arrays[name] = array
+        return name
+
+    def encode(v):
+        if hasattr(v, 'detach') and hasattr(v, 'cpu'):
+            import torch
+            # Raw bytes also cover dtypes numpy has no equivalent for (bfloat16)
+            t = v.detach().cpu().contiguous()
+            raw = t.reshape(-1).view(torch.uint8).numpy()
+            return {"t": "tensor", "k": add(raw), "dtype": str(t.dtype).replace('torch.', ''),
+                    "shape": list(t.shape)}
+        if isinstance(v, np.ndarray):
+            if v.dtype.hasobject:
+                raise TypeError("object arrays cannot be stored in the asset cache")
+            return {"t": "array", "k": add(v)}
+        if isinstance(v, (bytes, bytearray)):
+            return {"t": "bytes", "k": add(np.frombuffer(bytes(v), dtype=np.uint8))}
+        if v is None or isinstance(v, (bool, int, float, str)):
+            return {"t": "json", "v": v}
+        if isinstance(v, dict):
+            if not all(isinstance(k, str) for k in v):
+                raise TypeError("only str dict keys can be stored in the asset cache")
+            return {"t": "dict", "v": {k: encode(item) for k, item in v.items()}}
+        if isinstance(v, (list, tuple)):
+            return {"t": type(v).__name__, "v": [encode(item) for item in v]}
+        raise TypeError(f"{type(v).__name__} values cannot be stored in the asset cache")
+
+    layout = encode(value)
+    return layout, arrays
+
+
+def decode_entry(layout, arrays):
+    """Rebuild a value written by encode_entry()"""
+    kind = layout["t"]
+    if kind == "json":
+        return layout["v"]
+    if kind == "array":
+        return arrays[layout["k"]]
+    if kind == "bytes":
+        return arrays[layout["k"]].tobytes()
+    if kind == "tensor":
+        import torch
+        raw = torch.from_numpy(arrays[layout["k"]].copy())
+        return raw.view(getattr(torch, layout["dtype"])).reshape(layout["shape"])
+    if kind == "dict":
+        return {k: decode_entry(item, arrays) for k, item in layout["v"].items()}
+    if kind in ("list", "tuple"):
+        items = [decode_entry(item, arrays) for item in layout["v"]]
+        return tuple(items) if kind == "tuple" else items
+    raise ValueError(f"unknown asset cache entry type {kind!r}")
+
+
+class AssetCache:
+    """
+    Two-tier cache: an in-memory tier bounded by entry count and bytes, and an
+    optional on-disk tier (.npz files) bounded by bytes. Entries evicted
+    from memory stay on disk and are promoted back on the next hit.
+
+    policy selects which memory entry is evicted first: 'lru' (least recently
+    used), 'lfu' (least frequently used) or 'fifo' (oldest insert). The disk
+    tier always evicts by least recent access (file mtime).
+    """
+
+    def __init__(self, memory_items=64, memory_bytes=2 * 1024 ** 3, disk_dir=None,
+                 disk_max_bytes=20 * 1024 ** 3, policy='lru'):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{policy}', expected one of {EVICTION_POLICIES}")
+
+        self.memory_items = memory_items
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.policy = policy
+
+        # key -> [value, nbytes, use_count]
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                entry[2] += 1
+                if self.policy != 'fifo':
+                    self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[0]
+
+        value = self._disk_get(key)
+        with self._lock:
+            self.stats["disk_hits" if value is not None else "misses"] += 1
+        if value is not None:
+            self._memory_put(key, value)
+        return value
+
+    def put(self, key, value):
+        """Store value in the memory tier and, when configured, on disk"""
+        value = to_cpu(value)
+        self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    def get_or_compute(self, kind, digest, compute):
+        """
+        Return the cached encoding of an asset, running compute() on a miss.
+        kind separates encoders (and their settings) that share a digest.
+        """
+        key = f"{kind}-{digest}"
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _memory_put(self, key, value):
+        nbytes = estimate_nbytes(value)
+        if nbytes > self.memory_bytes:
+            return
+
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_used -= old[1]
+            self._memory[key] = [value, nbytes, 1]
+            self._memory_used += nbytes
+
+            while len(self._memory) > self.memory_items or self._memory_used > self.memory_bytes:
+                self._memory_used -= self._memory.pop(self._victim(key))[1]
+
+    def _victim(self, new_key):
+        """Key of the memory entry to evict under the configured policy"""
+        if self.policy == 'lfu':
+            # The entry just inserted has the lowest count, but evicting it would defeat the put
+            return min((k for k in self._memory if k != new_key), key=lambda k: self._memory[k][2])
+        # OrderedDict order is recency for lru and insertion order for fifo
+        return next(iter(self._memory))
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            value = decode_entry(json.loads(arrays.pop('__layout__').tobytes()), arrays)
+            now = time.time()
+            os.utime(path, (now, now))
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ Dropping unreadable asset cache entry {key}: {e}")
+            os.remove(path)
+            return None
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            layout, arrays = encode_entry(value)
+            arrays['__layout__'] = np.frombuffer(json.dumps(layout).encode('utf-8'), dtype=np.uint8)
+            # A file object keeps np.savez from appending its own suffix
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ Could not write asset cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._disk_evict()
+
+    def _disk_evict(self):
+        evict_lru(disk_entries(self.disk_dir, '.npz'), self.disk_max_bytes)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+
+"""
+Asyncio client for the RunPod Serverless Wan2.2-S2V-14B endpoint
+One pooled keep-alive aiohttp session carries every submit, poll and cancel,
+and a semaphore bounds how many jobs are in flight, so a backfill of
+thousands of videos is limited by the endpoint rather than by the client.
+
+Jobs go to /run and are polled on /status with exponential backoff plus
+jitter. Failed jobs (and 429/5xx answers to a submit) are retried while a
+retry budget allows it; the budget is a fraction of all jobs, so an outage
+does not turn into a retry storm. generate_many() yields results in
+completion order.
+
+Requires aiohttp (pip install aiohttp).
+
+Usage:
+    python async_runpod_client.py --endpoint https://api.runpod.ai/v2/ID --api-key KEY \\
+        --manifest jobs.jsonl --concurrency 32 --output-dir videos/
+
+Each manifest line is a JSON object with "audio" and "image" paths and
+optionally "prompt", "resolution" and any other handler input fields.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import tempfile
+import argparse
+from typing import Optional
+
+from runpod_client_examples import RunPodClient, TERMINAL_STATUSES, job_output
+from client_streaming import PayloadBody, VideoResponseDecoder, DECODE_CHUNK_BYTES
+from input_normalizer import normalize_inputs
+
+# Answers to a submit that are worth retrying
+RETRYABLE_HTTP_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class RetryBudget:
+    """
+    Allow retries up to ratio * jobs submitted, plus min_retries so a small
+    batch can still retry (the scheme gRPC and Finagle use)
+    """
+
+    def __init__(self, ratio: float = 0.1, min_retries: int = 10):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.requests = 0
+        self.retries = 0
+
+    def record_request(self):
+        self.requests += 1
+
+    def try_spend(self) -> bool:
+        if self.retries < self.min_retries + self.ratio * self.requests:
+            self.retries += 1
+            return True
+        return False
+
+
+def backoff_delay(attempt: int, initial: float, maximum: float) -> float:
+    """Exponential backoff with equal jitter: half fixed, half random"""
+    delay = min(maximum, initial * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class AsyncRunPodClient:
+    """Asyncio client for RunPod Serverless Wan2.2-S2V-14B API"""
+
+    def __init__(self,
+                 endpoint_url: str,
+                 api_key: Optional[str] = None,
+                 max_concurrency: int = 16,
+                 max_connections: Optional[int] = None,
+                 poll_interval: float = 1.0,
+                 max_poll_interval: float = 15.0,
+                 max_attempts: int = 3,
+                 retry_budget: Optional[RetryBudget] = None,
+                 request_timeout: float = 120.0):
+        """
+        Args:
+            endpoint_url: Endpoint URL (any of .../ID, .../ID/run, .../ID/runsync)
+            api_key: RunPod API key (optional if endpoint is public)
+            max_concurrency: Jobs in flight at once
+            max_connections: Connection pool size (default max_concurrency)
+            poll_interval / max_poll_interval: First and largest /status backoff
+            max_attempts: Attempts per job, including the first
+            retry_budget: Shared RetryBudget (default 10% of jobs)
+            request_timeout: Timeout of a single HTTP request (seconds)
+        """
+        # Reuse the sync client's URL handling and headers
+        sync_client = RunPodClient(endpoint_url, api_key)
+        self.base_url = sync_client.base_url
+        self.headers = sync_client.headers
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections or max_concurrency
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_attempts = max_attempts
+        self.retry_budget = retry_budget or RetryBudget()
+        self.request_timeout = request_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.session = None
+        self.transient_errors = (OSError, asyncio.TimeoutError)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        try:
+            import aiohttp
+        except ImportError:
+            raise RuntimeError("AsyncRunPodClient requires aiohttp (pip install aiohttp)")
+        # Connection resets, refused connections and malformed responses
+        self.transient_errors = (aiohttp.ClientError, OSError, asyncio.TimeoutError)
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _request(self, method: str, path: str, payload=None, output_path: Optional[str] = None) -> tuple:
+        """
+        Return (HTTP status, parsed JSON or error text). payload is a dict or
+        a PayloadBody; with output_path, an inline video in the response is
+        decoded straight into that file.
+        """
+        if self.session is None:
+            await self.open()
+        if isinstance(payload, PayloadBody):
+            kwargs = {"data": payload.aiter(), "headers": {"Content-Length": str(len(payload))}}
+        else:
+            kwargs = {"json": payload}
+        async with self.session.request(method, f"{self.base_url}{path}", **kwargs) as response:
+            if response.status != 200:
+                return response.status, await response.text()
+            if output_path is None:
+                return response.status, await response.json(content_type=None)
+            decoder = VideoResponseDecoder(output_path)
+            async for chunk in response.content.iter_chunked(DECODE_CHUNK_BYTES):
+                decoder.feed(chunk)
+            return response.status, decoder.finish()
+
+    async def submit(self, payload) -> dict:
+        """
+        POST a payload to /run; returns {"id": ...} or {"status": "FAILED", ...}.
+        Connection errors and 429/5xx are retried with backoff within the retry budget.
+        """
+        attempt = 0
+        while True:
+            try:
+                status, body = await self._request('POST', '/run', payload)
+                if status == 200:
+                    return body
+                error = f"HTTP {status}: {body}"
+                retryable = status in RETRYABLE_HTTP_STATUSES
+            except self.transient_errors as e:
+                error = f"{type(e).__name__}: {e}"
+                retryable = True
+
+            attempt += 1
+            if not retryable or attempt >= self.max_attempts or not self.retry_budget.try_spend():
+                return {"status": "FAILED", "error": error}
+            await asyncio.sleep(backoff_delay(attempt, self.poll_interval, self.max_poll_interval))
+
+    async def get_status(self, job_id: str, output_path: Optional[str] = None) -> dict:
+        status, body = await self._request('GET', f"/status/{job_id}", output_path=output_path)
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}: {body}")
+        return body
+
+    async def cancel(self, job_id: str) -> dict:
+        status, body = await self._request('POST', f"/cancel/{job_id}")
+        return body if status == 200 else {"error": f"HTTP {status}: {body}"}
+
+    async def wait_for_job(self, job_id: str, timeout: Optional[float] = None,
+                           output_path: Optional[str] = None) -> dict:
+        """Poll /status with exponential backoff and jitter until the job finishes"""
+        start = time.monotonic()
+        attempt = 0
+        status = {"id": job_id}
+        while True:
+            try:
+                status = await self.get_status(job_id, output_path=output_path)
+                if status.get("status") in TERMINAL_STATUSES:
+                    return status
+            except Exception as e:
+                # A failed poll is not a failed job; try again on the next tick
+                print(f"⚠️ Status poll for {job_id} failed: {e}")
+
+            delay = backoff_delay(attempt, self.poll_interval, self.max_poll_interval)
+            if timeout is not None and time.monotonic() - start + delay > timeout:
+                await self.cancel(job_id)
+                return {**status, "id": job_id, "status": "TIMED_OUT", "error": "client gave up waiting"}
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def run_job(self, payload, timeout: Optional[float] = None, output_path: Optional[str] = None) -> dict:
+        """
+        Submit a payload (dict or PayloadBody) and wait for it, retrying failed
+        jobs within the retry budget. Returns the final /status answer plus
+        "attempts". With output_path, an inline video is decoded straight into
+        that file and the output has "video_file" instead of "video_base64".
+        """
+        async with self.semaphore:
+            self.retry_budget.record_request()
+            attempts = 0
+            while True:
+                attempts += 1
+                submitted = await self.submit(payload)
+                if "id" not in submitted:
+                    result = submitted
+                else:
+                    result = await self.wait_for_job(submitted["id"], timeout=timeout, output_path=output_path)
+
+                output = job_output(result)
+                failed = result.get("status") != "COMPLETED" or output.get("success") is False
+                if (not failed or result.get("status") == "CANCELLED"
+                        or attempts >= self.max_attempts or not self.retry_budget.try_spend()):
+                    return {**result, "attempts": attempts}
+                print(f"🔁 Retrying job {result.get('id', '')} ({result.get('error') or output.get('error')})")
+                await asyncio.sleep(backoff_delay(attempts, self.poll_interval, self.max_poll_interval))
+
+    async def generate_many(self, payloads, timeout: Optional[float] = None, output_path_for=None):
+        """
+        Run many jobs with at most max_concurrency in flight and yield
+        (index, result) as each finishes. payloads may be a generator; items
+        are payload dicts, PayloadBody instances (encoded while sent), or
+        zero-argument callables returning either, which are built in a thread
+        only when a slot opens. output_path_for(index), if given, names the
+        file each job's inline video is decoded into.
+        """
+        async def run(index, item):
+            payload = await asyncio.to_thread(item) if callable(item) else item
+            output_path = output_path_for(index) if output_path_for else None
+            return index, await self.run_job(payload, timeout=timeout, output_path=output_path)
+
+        pending = set()
+        items = enumerate(payloads)
+        exhausted = False
+        try:
+            while pending or not exhausted:
+                while not exhausted and len(pending) < self.max_concurrency:
+                    try:
+                        index, item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(run(index, item)))
+
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def manifest_payloads(path: str, client: RunPodClient, normalize_dir: Optional[str] = None):
+    """
+    Yield a streamed request body for each line of a JSON-lines manifest.
+    With normalize_dir, yield builders that first normalize each job's inputs
+    into normalize_dir/<index> (run in a thread when the job's slot opens).
+    """
+    with open(path) as f:
+        entries = (json.loads(line) for line in f if line.strip())
+        for index, entry in enumerate(entries):
+            audio, image = entry.pop("audio"), entry.pop("image")
+            prompt = entry.pop("prompt", "A person speaking")
+            resolution = entry.pop("resolution", "1024*704")
+            if normalize_dir is None:
+                yield client.payload_body(audio, image, prompt, resolution, **entry)
+                continue
+
+            def build(index=index, audio=audio, image=image, prompt=prompt, resolution=resolution, options=entry):
+                work_dir = os.path.join(normalize_dir, str(index))
+                os.makedirs(work_dir, exist_ok=True)
+                audio, image = normalize_inputs(audio, image, resolution, work_dir)
+                return client.payload_body(audio, image, prompt, resolution, **options)
+            yield build
+
+
+async def run_manifest(args):
+    sync_client = RunPodClient(args.endpoint, args.api_key)
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path_for = lambda index: os.path.join(args.output_dir, f"{index:06d}.mp4")
+    completed = failed = 0
+    start = time.time()
+    normalize_dir = tempfile.mkdtemp(prefix='wan_normalize_') if args.normalize else None
+
+    async with AsyncRunPodClient(args.endpoint, args.api_key, max_concurrency=args.concurrency,
+                                 max_attempts=args.max_attempts,
+                                 retry_budget=RetryBudget(args.retry_ratio)) as client:
+        payloads = manifest_payloads(args.manifest, sync_client, normalize_dir)
+        async for index, result in client.generate_many(payloads, timeout=args.timeout,
+                                                        output_path_for=output_path_for):
+            if normalize_dir:
+                shutil.rmtree(os.path.join(normalize_dir, str(index)), ignore_errors=True)
+            output = job_output(result)
+            if result.get("status") == "COMPLETED" and output.get("success"):
+                await asyncio.to_thread(sync_client.save_video, output, output_path_for(index))
+                completed += 1
+            else:
+                failed += 1
+                print(f"❌ Job {index} failed after {result['attempts']} attempt(s): "
+                      f"{result.get('error') or output.get('error')}")
+
+    if normalize_dir:
+        shutil.rmtree(normalize_dir, ignore_errors=True)
+    elapsed = time.time() - start
+    print(f"\n✅ {completed} completed, ❌ {failed} failed in {elapsed:.0f}s "
+          f"({client.retry_budget.retries} retries used)")
+    return 0 if failed == 0 else 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run a manifest of jobs against a RunPod endpoint')
+    parser.add_argument('--endpoint', required=True, help='Endpoint URL, e.g. https://api.runpod.ai/v2/ID')
+    parser.add_argument('--api-key', default=os.getenv('RUNPOD_API_KEY'))
+    parser.add_argument('--manifest', required=True, help='JSON-lines file of jobs')
+    parser.add_argument('--output-dir', default='videos')
+    parser.add_argument('--concurrency', type=int, default=16, help='Jobs in flight at once')
+    parser.add_argument('--max-attempts', type=int, default=3, help='Attempts per job')
+    parser.add_argument('--retry-ratio', type=float, default=0.1,
+                        help='Retries allowed as a fraction of jobs submitted')
+    parser.add_argument('--timeout', type=float, help='Give up on (and cancel) a job after this many seconds')
+    parser.add_argument('--normalize', action='store_true',
+                        help='Resample audio to 16 kHz mono and resize images to the resolution before upload')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run_manifest(parse_args())))
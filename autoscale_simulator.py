@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+
+"""
+Discrete-event simulator of the RunPod worker pool
+Replays a request-arrival trace (recorded or synthetic) through a model of
+the serverless scaling settings in runpod.toml and reports p95 end-to-end
+latency, cold starts, GPU-seconds billed and cost. A parameter sweep finds
+the latency vs cost Pareto frontier.
+
+Scaling model (an approximation of RunPod's queue-based scaler):
+- min_replicas workers are kept warm at all times.
+- The desired number of workers is ceil((busy + queued) * 100 /
+  target_utilization), clamped to [min_replicas, max_workers] (max_workers
+  is also capped by max_replicas). A scale-up fires once at least
+  target_queue_size jobs are queued and the shortfall has persisted for
+  scale_up_delay seconds.
+- A new worker bills from the moment it starts, including its cold start.
+- A worker idle for idle_timeout seconds shuts down, but never within
+  scale_down_delay seconds of the last scale-up and never below
+  min_replicas.
+- Jobs beyond max_queue_size are rejected. Jobs that wait longer than
+  request_timeout are dropped. Jobs that run longer than
+  max_execution_time are killed (and billed).
+
+Traces can be the JSON written by load_test.py --output, the JSON-lines
+metrics written by the handler (WAN_METRICS_JSONL), or a CSV/text file of
+"arrival_seconds[,execution_seconds]" lines.
+
+Usage:
+    python autoscale_simulator.py --rate 0.02 --duration 86400 --execution lognormal:180:0.3
+    python autoscale_simulator.py --trace load.json --sweep idle_timeout=5,30,60,300 --sweep max_workers=1,2,4
+"""
+
+import sys
+import json
+import math
+import heapq
+import random
+import argparse
+import itertools
+
+from runpod_config import load_runpod_config, config_value
+from benchmark_handler import percentile
+
+# RTX 4090 serverless price, as in the handler's preflight cost model
+DEFAULT_GPU_COST_PER_SECOND = 0.0012
+
+SWEEPABLE = ('min_replicas', 'max_workers', 'idle_timeout', 'scale_up_delay', 'scale_down_delay',
+             'target_queue_size', 'target_utilization', 'max_queue_size')
+
+
+def scaling_settings(config):
+    """Scaling parameters from runpod.toml, with RunPod-like defaults"""
+    max_workers = config_value(config, 'scaling', 'max_workers', 1)
+    max_replicas = config_value(config, 'scaling', 'max_replicas', max_workers)
+    return {
+        "min_replicas": config_value(config, 'scaling', 'min_replicas', 0),
+        "max_workers": min(max_workers, max_replicas),
+        "target_queue_size": config_value(config, 'scaling', 'target_queue_size', 1),
+        "idle_timeout": config_value(config, 'scaling', 'idle_timeout', 5),
+        "scale_up_delay": config_value(config, 'autoscaling', 'scale_up_delay', 0),
+        "scale_down_delay": config_value(config, 'autoscaling', 'scale_down_delay', 0),
+        "target_utilization": config_value(config, 'autoscaling', 'target_utilization', 100),
+        "max_queue_size": config_value(config, 'queue', 'max_queue_size', 1000),
+        "max_execution_time": config_value(config, 'timeout', 'max_execution_time', 600),
+        "request_timeout": config_value(config, 'timeout', 'request_timeout', 3600),
+    }
+
+
+class Distribution:
+    """
+    Parsed from 'constant:X', 'uniform:A:B', 'exponential:MEAN' or
+    'lognormal:MEDIAN:SIGMA' (seconds)
+    """
+
+    def __init__(self, spec):
+        kind, *params = spec.split(':')
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        expected = {'constant': 1, 'uniform': 2, 'exponential': 1, 'lognormal': 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"bad distribution '{spec}' (expected one of {', '.join(expected)})")
+
+    def sample(self, rng):
+        if self.kind == 'constant':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return rng.uniform(*self.params)
+        if self.kind == 'exponential':
+            return rng.expovariate(1.0 / self.params[0])
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma)
+
+
+def load_trace(path):
+    """Return [(arrival seconds from trace start, execution seconds or None), ...]"""
+    with open(path) as f:
+        text = f.read()
+
+    jobs = []
+    document = None
+    if text.lstrip().startswith('{'):
+        try:
+            document = json.loads(text)
+        except ValueError:
+            pass  # JSON-lines
+
+    if isinstance(document, dict) and "records" in document:
+        # load_test.py --output
+        for record in document["records"]:
+            execution = record["execution_ms"] / 1000.0 if record.get("execution_ms") is not None else None
+            jobs.append((record["intended_start"], execution))
+    elif text.lstrip().startswith('{'):
+        # Handler metrics JSON-lines: "time" is when the job finished
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            total = record.get("total_seconds")
+            if total is None:
+                continue
+            jobs.append((record["time"] - total, total))
+    else:
+        for line in text.splitlines():
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            fields = [v.strip() for v in line.split(',')]
+            try:
+                arrival = float(fields[0])
+            except ValueError:
+                continue  # header row
+            jobs.append((arrival, float(fields[1]) if len(fields) > 1 and fields[1] else None))
+
+    jobs.sort()
+    start = jobs[0][0] if jobs else 0.0
+    return [(arrival - start, execution) for arrival, execution in jobs]
+
+
+def synthetic_trace(rate, duration, rng):
+    """Poisson arrivals at rate jobs/second for duration seconds"""
+    jobs = []
+    t = rng.expovariate(rate)
+    while t < duration:
+        jobs.append((t, None))
+        t += rng.expovariate(rate)
+    return jobs
+
+
+class Simulation:
+    """One replay of a trace through the worker pool model"""
+
+    def __init__(self, settings, jobs, cold_start, seed=0, gpu_cost_per_second=DEFAULT_GPU_COST_PER_SECOND):
+        self.s = settings
+        self.jobs = jobs                      # [(arrival, execution seconds)]
+        self.cold_start = cold_start
+        self.rng = random.Random(seed)
+        self.gpu_cost_per_second = gpu_cost_per_second
+
+        self.events = []
+        self.sequence = itertools.count()
+        self.now = 0.0
+        self.queue = []                       # job indexes, FIFO
+        self.workers = {}                     # id -> dict(state, started, idle_since, job, cold)
+        self.worker_ids = itertools.count()
+        self.last_scale_up = -math.inf
+        self.scale_check_pending = False
+
+        self.latencies = []
+        self.queue_waits = []
+        self.cold_started_jobs = 0
+        self.cold_starts = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.killed = 0
+        self.gpu_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    def schedule(self, at, kind, *data):
+        heapq.heappush(self.events, (at, next(self.sequence), kind, data))
+
+    # Worker pool
+
+    def active_workers(self):
+        return [w for w in self.workers.values() if w["state"] != 'stopped']
+
+    def start_worker(self, warm=False):
+        worker_id = next(self.worker_ids)
+        delay = 0.0 if warm else self.cold_start.sample(self.rng)
+        self.workers[worker_id] = {"state": 'starting', "started": self.now, "idle_since": None,
+                                   "job": None, "cold": not warm}
+        if not warm:
+            self.cold_starts += 1
+        self.schedule(self.now + delay, 'ready', worker_id)
+
+    def stop_worker(self, worker_id):
+        worker = self.workers[worker_id]
+        worker["state"] = 'stopped'
+        self.gpu_seconds += self.now - worker["started"]
+
+    def desired_workers(self):
+        busy = sum(1 for w in self.workers.values() if w["state"] == 'busy')
+        demand = busy + len(self.queue)
+        desired = math.ceil(demand * 100.0 / max(1, self.s["target_utilization"]))
+        return max(self.s["min_replicas"], min(self.s["max_workers"], desired))
+
+    def maybe_scale_up(self):
+        if len(self.queue) < self.s["target_queue_size"]:
+            return
+        if self.desired_workers() <= len(self.active_workers()) or self.scale_check_pending:
+            return
+        self.scale_check_pending = True
+        self.schedule(self.now + self.s["scale_up_delay"], 'scale_up')
+
+    def dispatch(self):
+        for worker_id, worker in self.workers.items():
+            if not self.queue:
+                return
+            if worker["state"] != 'idle':
+                continue
+            job = self.queue.pop(0)
+            arrival, execution = self.jobs[job]
+            self.queue_waits.append(self.now - arrival)
+            if worker["cold"]:
+                self.cold_started_jobs += 1
+                worker["cold"] = False
+
+            worker["state"] = 'busy'
+            worker["job"] = job
+            run_for = min(execution, self.s["max_execution_time"])
+            self.schedule(self.now + run_for, 'done', worker_id, job, execution > self.s["max_execution_time"])
+
+    # Event loop
+
+    def run(self):
+        for _ in range(self.s["min_replicas"]):
+            self.start_worker(warm=True)
+        for index, (arrival, _) in enumerate(self.jobs):
+            self.schedule(arrival, 'arrival', index)
+
+        while self.events:
+            self.now, _, kind, data = heapq.heappop(self.events)
+            getattr(self, f"on_{kind}")(*data)
+
+        for worker_id, worker in self.workers.items():
+            if worker["state"] != 'stopped':
+                self.stop_worker(worker_id)
+        return self.results()
+
+    def on_arrival(self, job):
+        if len(self.queue) >= self.s["max_queue_size"]:
+            self.rejected += 1
+            return
+        self.queue.append(job)
+        self.schedule(self.now + self.s["request_timeout"], 'queue_timeout', job)
+        self.dispatch()
+        self.maybe_scale_up()
+
+    def on_queue_timeout(self, job):
+        if job in self.queue:
+            self.queue.remove(job)
+            self.dropped += 1
+
+    def on_scale_up(self):
+        self.scale_check_pending = False
+        if len(self.queue) < self.s["target_queue_size"]:
+            return
+        shortfall = self.desired_workers() - len(self.active_workers())
+        for _ in range(max(0, shortfall)):
+            self.start_worker()
+        if shortfall > 0:
+            self.last_scale_up = self.now
+
+    def on_ready(self, worker_id):
+        worker = self.workers[worker_id]
+        worker["state"] = 'idle'
+        worker["idle_since"] = self.now
+        self.dispatch()
+        self.schedule_idle_check(worker_id)
+
+    def on_done(self, worker_id, job, killed):
+        worker = self.workers[worker_id]
+        arrival, execution = self.jobs[job]
+        self.busy_seconds += min(execution, self.s["max_execution_time"])
+        if killed:
+            self.killed += 1
+        else:
+            self.latencies.append(self.now - arrival)
+
+        worker["state"] = 'idle'
+        worker["job"] = None
+        worker["idle_since"] = self.now
+        self.dispatch()
+        if worker["state"] == 'idle':
+            self.schedule_idle_check(worker_id)
+        self.maybe_scale_up()
+
+    def schedule_idle_check(self, worker_id):
+        at = max(self.now + self.s["idle_timeout"], self.last_scale_up + self.s["scale_down_delay"])
+        self.schedule(at, 'idle_check', worker_id, self.workers[worker_id]["idle_since"])
+
+    def on_idle_check(self, worker_id, idle_since):
+        worker = self.workers[worker_id]
+        if worker["state"] != 'idle' or worker["idle_since"] != idle_since:
+            return  # picked up work since
+        if self.now < self.last_scale_up + self.s["scale_down_delay"]:
+            self.schedule(self.last_scale_up + self.s["scale_down_delay"], 'idle_check', worker_id, idle_since)
+            return
+        if len(self.active_workers()) <= self.s["min_replicas"]:
+            return
+        self.stop_worker(worker_id)
+
+    def results(self):
+        total = len(self.jobs)
+        return {
+            "jobs": total,
+            "completed": len(self.latencies),
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "killed": self.killed,
+            "drop_rate": round((self.rejected + self.dropped) / total, 4) if total else 0.0,
+            "p50_latency": percentile(self.latencies, 50),
+            "p95_latency": percentile(self.latencies, 95),
+            "p99_latency": percentile(self.latencies, 99),
+            "p95_queue_wait": percentile(self.queue_waits, 95),
+            "cold_starts": self.cold_starts,
+            "cold_started_jobs": self.cold_started_jobs,
+            "gpu_seconds": round(self.gpu_seconds, 1),
+            "utilization": round(self.busy_seconds / self.gpu_seconds, 4) if self.gpu_seconds else None,
+            "cost": round(self.gpu_seconds * self.gpu_cost_per_second, 4),
+        }
+
+
+def pareto_frontier(rows):
+    """Rows not dominated on (p95 latency, cost); both lower is better"""
+    frontier = []
+    for row in rows:
+        if row["p95_latency"] is None:
+            continue
+        dominated = any(
+            other is not row and other["p95_latency"] is not None
+            and other["p95_latency"] <= row["p95_latency"] and other["cost"] <= row["cost"]
+            and (other["p95_latency"] < row["p95_latency"] or other["cost"] < row["cost"])
+            for other in rows
+        )
+        if not dominated:
+            frontier.append(row)
+    return sorted(frontier, key=lambda r: r["cost"])
+
+
+def prepare_jobs(trace, execution, rng):
+    """Fill in execution times the trace does not have"""
+    return [(arrival, seconds if seconds is not None else execution.sample(rng)) for arrival, seconds in trace]
+
+
+def parse_sweep(values):
+    grid = {}
+    for value in values or []:
+        name, _, options = value.partition('=')
+        if name not in SWEEPABLE:
+            raise ValueError(f"cannot sweep '{name}' (choose from {', '.join(SWEEPABLE)})")
+        grid[name] = [float(v) if '.' in v else int(v) for v in options.split(',')]
+    return grid
+
+
+def format_row(row, keys):
+    def fmt(value):
+        if value is None:
+            return '-'
+        if isinstance(value, float):
+            return f"{value:.1f}" if abs(value) >= 10 else f"{value:.3f}"
+        return str(value)
+    return "  ".join(f"{fmt(row.get(k)):>{max(12, len(k))}}" for k in keys)
+
+
+def format_header(keys):
+    return "  ".join(f"{k:>{max(12, len(k))}}" for k in keys)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Simulate RunPod autoscaling for a request trace')
+    parser.add_argument('--config', help='runpod.toml to read (default: the repo copy)')
+    parser.add_argument('--trace', help='Trace file (load_test.py JSON, handler metrics JSONL, or CSV)')
+    parser.add_argument('--rate', type=float, help='Synthetic Poisson arrival rate (jobs/second)')
+    parser.add_argument('--duration', type=float, default=3600.0, help='Synthetic trace length (seconds)')
+    parser.add_argument('--execution', default='lognormal:180:0.25',
+                        help='Execution time distribution when the trace has none')
+    parser.add_argument('--cold-start', default='lognormal:60:0.3', help='Cold start time distribution')
+    parser.add_argument('--gpu-cost-per-second', type=float, default=DEFAULT_GPU_COST_PER_SECOND)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override a scaling setting')
+    parser.add_argument('--sweep', action='append', metavar='NAME=V1,V2,...',
+                        help='Sweep a scaling setting (repeat for a grid)')
+    parser.add_argument('--max-drop-rate', type=float, default=0.01,
+                        help='Sweep: ignore configurations that reject or drop more queued jobs than this')
+    parser.add_argument('--output', help='Write all results as JSON here')
+    args = parser.parse_args()
+    if not args.trace and not args.rate:
+        parser.error("give --trace or --rate")
+    return args
+
+
+def main():
+    args = parse_args()
+    config = load_runpod_config(args.config)
+    base = scaling_settings(config)
+    for override in args.set:
+        name, _, value = override.partition('=')
+        if name not in base:
+            raise SystemExit(f"unknown setting '{name}'")
+        base[name] = float(value) if '.' in value else int(value)
+
+    rng = random.Random(args.seed)
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(args.rate, args.duration, rng)
+    jobs = prepare_jobs(trace, Distribution(args.execution), rng)
+    cold_start = Distribution(args.cold_start)
+
+    print("🧮 RunPod autoscaling simulation")
+    print("=" * 50)
+    print(f"📥 {len(jobs)} jobs over {jobs[-1][0] if jobs else 0:.0f}s")
+    print(f"⚙️  {json.dumps(base)}")
+
+    grid = parse_sweep(args.sweep)
+    names = list(grid)
+    rows = []
+    for values in itertools.product(*grid.values()) if grid else [()]:
+        settings = dict(base, **dict(zip(names, values)))
+        result = Simulation(settings, jobs, cold_start, seed=args.seed,
+                            gpu_cost_per_second=args.gpu_cost_per_second).run()
+        rows.append({**dict(zip(names, values)), **result})
+
+    keys = names + ["p95_latency", "cold_starts", "gpu_seconds", "cost", "utilization", "drop_rate", "killed"]
+    print("\n" + format_header(keys))
+    for row in rows:
+        print(format_row(row, keys))
+
+    if grid:
+        eligible = [r for r in rows if r["drop_rate"] <= args.max_drop_rate]
+        frontier = pareto_frontier(eligible)
+        print(f"\n🏆 Pareto frontier (p95 latency vs cost, drop rate <= {args.max_drop_rate:g}):")
+        print(format_header(keys))
+        for row in frontier:
+            print(format_row(row, keys))
+        if not frontier:
+            print("   (no configuration met the drop rate limit; raise --max-drop-rate or max_workers)")
+    else:
+        frontier = []
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"settings": base, "results": rows, "frontier": frontier}, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
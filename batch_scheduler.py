@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Micro-batching scheduler
+Collects compatible jobs (same batch key, e.g. resolution and clip length)
+that arrive within a short window and runs them as one batch on a single
+background thread, so the GPU only ever sees one batch at a time
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class BatchScheduler:
+    """
+    run_batch(items) must return one result per item, in order.
+    max_batch_size_fn(key), when given, caps the batch size for a key (e.g.
+    from free GPU memory); the configured max_batch_size is the upper bound.
+    """
+
+    def __init__(self, run_batch, window_seconds=0.25, max_batch_size=4, max_batch_size_fn=None):
+        self.run_batch = run_batch
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self.max_batch_size_fn = max_batch_size_fn
+
+        # key -> list of (item, future, arrival time), oldest key first
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.batches_run = 0
+        self.items_run = 0
+
+        self._thread = threading.Thread(target=self._loop, name='batch-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, item, key):
+        """Queue an item; returns a concurrent.futures.Future for its result"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchScheduler is closed")
+            self._pending.setdefault(key, []).append((item, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def batch_limit(self, key):
+        limit = self.max_batch_size
+        if self.max_batch_size_fn is not None:
+            try:
+                limit = min(limit, self.max_batch_size_fn(key))
+            except Exception as e:
+                print(f"⚠️ Batch size estimate failed ({e}), running jobs one at a time")
+                limit = 1
+        return max(1, limit)
+
+    def _next_batch(self):
+        """Block until a batch is ready; returns (key, entries) or None when closed"""
+        with self._cond:
+            while True:
+                if not self._pending:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+
+                # Serve the key whose oldest job has waited longest
+                key, entries = next(iter(self._pending.items()))
+                limit = self.batch_limit(key)
+                remaining = entries[0][2] + self.window_seconds - time.monotonic()
+
+                if len(entries) >= limit or remaining <= 0 or self._closed:
+                    batch, rest = entries[:limit], entries[limit:]
+                    if rest:
+                        self._pending[key] = rest
+                        self._pending.move_to_end(key)
+                    else:
+                        del self._pending[key]
+                    return key, batch
+
+                self._cond.wait(timeout=remaining)
+
+    def _loop(self):
+        while True:
+            next_batch = self._next_batch()
+            if next_batch is None:
+                return
+            key, entries = next_batch
+            items = [item for item, _, _ in entries]
+            futures = [future for _, future, _ in entries]
+
+            if len(items) > 1:
+                print(f"📦 Running batch of {len(items)} jobs for {key}")
+
+            try:
+                results = self.run_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"run_batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.items_run += len(items)
+            for future, result in zip(futures, results):
+                future.set_result(result)
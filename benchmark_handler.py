@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+"""
+Offline benchmark of the RunPod handler
+Drives runpod_handler.handler in-process with synthetic audio/image payloads
+on the mock generation path, so everything except the model (decode, temp
+files, preflight, caching, delivery, cleanup) can be measured without a GPU.
+
+Reports p50/p95/p99 latency per stage and end to end, peak RSS, and the peak
+bytes allocated per stage (tracemalloc, on a separate pass so it does not
+skew the latencies), which approximates how many copies of a payload a stage
+holds at once. Results can be saved as a JSON baseline; later runs compare
+against it and exit with status 1 on a regression.
+
+Usage:
+    python benchmark_handler.py --iterations 50 --save-baseline
+    python benchmark_handler.py --iterations 50                 # compare with the baseline
+    python benchmark_handler.py --audio-seconds 5 60 --image-size 512x512 2048x2048
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import math
+import wave
+import zlib
+import base64
+import struct
+import argparse
+import platform
+import resource
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+PERCENTILES = (50, 95, 99)
+
+
+def make_wav(seconds, sample_rate=16000, channels=1):
+    """16-bit PCM WAV of random noise (incompressible, like real speech payloads)"""
+    frames = int(seconds * sample_rate)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(os.urandom(frames * channels * 2))
+    return buffer.getvalue()
+
+
+def make_png(width, height):
+    """RGB PNG of random pixels, so the payload is as large as a real photo"""
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    row_bytes = width * 3
+    noise = os.urandom(row_bytes * height)
+    raw = b''.join(b'\x00' + noise[y * row_bytes:(y + 1) * row_bytes] for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 1))
+            + chunk(b'IEND', b''))
+
+
+def percentile(values, p):
+    """Linear-interpolated percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100.0
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values):
+    return {f"p{p}": round(percentile(values, p), 6) for p in PERCENTILES}
+
+
+def peak_rss_bytes():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def configure_environment(args):
+    """Handler settings are read at import time, so set them before importing it"""
+    os.environ.setdefault('WAN_RESULT_CACHE', 'False')
+    os.environ['WAN_METRICS'] = 'True'
+    os.environ['WAN_METRICS_JSONL'] = ''
+    os.environ['WAN_METRICS_PROMETHEUS'] = ''
+    os.environ['WAN_MOCK_STEP_SECONDS'] = str(args.step_seconds)
+    os.environ['WAN_WORKER_MODE'] = args.worker_mode
+    # The repo's generate.py, wherever the benchmark is run from
+    os.environ.setdefault('WAN_GENERATE_SCRIPT', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              'generate.py'))
+
+
+def load_handler():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import runpod_handler
+    from metrics import StageTimings
+
+    class TracedTimings(StageTimings):
+        """StageTimings that also keeps the peak bytes allocated inside each stage"""
+
+        def __init__(self):
+            super().__init__()
+            self.peak_bytes = {}
+
+        @contextmanager
+        def stage(self, name):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.add(name, time.perf_counter() - start)
+                peak = tracemalloc.get_traced_memory()[1] - base
+                self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak)
+
+    return runpod_handler, TracedTimings
+
+
+def run_once(handler, event, verbose):
+    start = time.perf_counter()
+    if verbose:
+        response = handler(event)
+    else:
+        with redirect_stdout(io.StringIO()):
+            response = handler(event)
+    elapsed = time.perf_counter() - start
+
+    if not response.get('success'):
+        raise RuntimeError(f"handler failed: {response.get('error')} {response.get('details', '')}")
+    return elapsed, response.get('timings') or {}
+
+
+def run_scenario(runpod_handler, traced_timings, name, audio_seconds, width, height, args):
+    print(f"🏁 Scenario {name}: {audio_seconds}s audio, {width}x{height} image")
+    audio = base64.b64encode(make_wav(audio_seconds)).decode('ascii')
+    image = base64.b64encode(make_png(width, height)).decode('ascii')
+    event = {"input": {
+        "audio_file": audio,
+        "image_file": image,
+        "resolution": args.resolution,
+        "output_sink": args.output_sink,
+        "use_cache": False,
+    }}
+
+    for _ in range(args.warmup):
+        run_once(runpod_handler.handler, event, args.verbose)
+
+    totals = []
+    stages = {}
+    for _ in range(args.iterations):
+        elapsed, timings = run_once(runpod_handler.handler, event, args.verbose)
+        totals.append(elapsed)
+        for stage, seconds in timings.get('stages', {}).items():
+            stages.setdefault(stage, []).append(seconds)
+
+    # Allocation pass: tracemalloc slows every allocation, so it gets its own iterations
+    peak_bytes = {}
+    if args.memory_iterations:
+        new_timings = runpod_handler.new_timings
+        tracemalloc.start()
+        try:
+            for _ in range(args.memory_iterations):
+                timings = traced_timings()
+                runpod_handler.new_timings = lambda: timings
+                run_once(runpod_handler.handler, event, args.verbose)
+                for stage, nbytes in timings.peak_bytes.items():
+                    peak_bytes[stage] = max(peak_bytes.get(stage, 0), nbytes)
+        finally:
+            tracemalloc.stop()
+            runpod_handler.new_timings = new_timings
+
+    result = {
+        "audio_seconds": audio_seconds,
+        "image_size": f"{width}x{height}",
+        "payload_bytes": len(audio) + len(image),
+        "iterations": args.iterations,
+        "latency_seconds": {"total": summarize(totals),
+                            **{stage: summarize(values) for stage, values in stages.items()}},
+        "peak_alloc_bytes": peak_bytes,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    print_scenario(result)
+    return result
+
+
+def print_scenario(result):
+    print(f"   payload {result['payload_bytes'] / 1024 / 1024:.1f} MB base64, "
+          f"peak RSS {result['peak_rss_bytes'] / 1024 / 1024:.0f} MB")
+    print(f"   {'stage':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak alloc':>14}")
+    for stage, stats in result["latency_seconds"].items():
+        alloc = result["peak_alloc_bytes"].get(stage)
+        alloc_text = f"{alloc / 1024:.0f} KB" if alloc is not None else '-'
+        print(f"   {stage:<16}{stats['p50'] * 1000:>10.2f}{stats['p95'] * 1000:>10.2f}"
+              f"{stats['p99'] * 1000:>10.2f}{alloc_text:>14}")
+
+
+def compare(results, baseline, max_regression, min_delta_ms, min_delta_bytes):
+    """Return a list of human-readable regressions against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            print(f"ℹ️  No baseline for scenario {name}")
+            continue
+
+        for stage, stats in result["latency_seconds"].items():
+            base_stats = base["latency_seconds"].get(stage)
+            if base_stats is None:
+                continue
+            # p99 over a few dozen iterations is too noisy to gate on
+            for key in ("p50", "p95"):
+                now, before = stats[key], base_stats[key]
+                if now > before * (1 + max_regression) and (now - before) * 1000 > min_delta_ms:
+                    regressions.append(f"{name} {stage} {key}: {before * 1000:.2f} ms -> {now * 1000:.2f} ms")
+
+        for stage, nbytes in result["peak_alloc_bytes"].items():
+            before = base.get("peak_alloc_bytes", {}).get(stage)
+            if before is None:
+                continue
+            if nbytes > before * (1 + max_regression) and nbytes - before > min_delta_bytes:
+                regressions.append(f"{name} {stage} peak alloc: {before} -> {nbytes} bytes")
+
+    return regressions
+
+
+def parse_image_size(value):
+    width, height = value.lower().replace('*', 'x').split('x')
+    return int(width), int(height)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Offline benchmark of runpod_handler.handler (mock generation)')
+    parser.add_argument('--iterations', type=int, default=30, help='Measured iterations per scenario')
+    parser.add_argument('--warmup', type=int, default=2, help='Unmeasured iterations per scenario')
+    parser.add_argument('--memory-iterations', type=int, default=1,
+                        help='Extra iterations under tracemalloc for per-stage allocations (0 to skip)')
+    parser.add_argument('--audio-seconds', type=float, nargs='+', default=[5.0, 30.0])
+    parser.add_argument('--image-size', type=parse_image_size, nargs='+', default=[(512, 512), (2048, 2048)])
+    parser.add_argument('--resolution', default='512*512', help='Requested output resolution')
+    parser.add_argument('--output-sink', default='inline')
+    parser.add_argument('--worker-mode', default='inprocess', choices=['inprocess', 'subprocess'])
+    parser.add_argument('--step-seconds', type=float, default=0.0,
+                        help='Sleep per mock denoising step (0 measures handler overhead only)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed relative slowdown or allocation growth before failing')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                        help='Ignore latency regressions smaller than this (timer noise)')
+    parser.add_argument('--min-delta-bytes', type=int, default=64 * 1024,
+                        help='Ignore allocation regressions smaller than this')
+    parser.add_argument('--output', help='Also write the results JSON here')
+    parser.add_argument('--verbose', action='store_true', help='Show handler logs')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+    runpod_handler, traced_timings = load_handler()
+
+    print("📊 Handler benchmark (mock generation)")
+    print("=" * 50)
+
+    results = {}
+    for audio_seconds in args.audio_seconds:
+        for width, height in args.image_size:
+            name = f"audio{audio_seconds:g}s-image{width}x{height}"
+            results[name] = run_scenario(runpod_handler, traced_timings, name, audio_seconds, width, height, args)
+
+    report = {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "worker_mode": args.worker_mode,
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️  No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.max_regression, args.min_delta_ms, args.min_delta_bytes)
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) against {args.baseline}:")
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+
+    print(f"✅ No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Checkpoint manifest
+One JSON file per checkpoint directory listing its weight shards (path,
+size, mtime, format), a tensor -> shard index with dtypes and shapes, and
+content hashes. Built once; later loads stat the recorded shards and list
+the recorded directories instead of walking the tree, and re-read only the
+shards that changed. A shard whose mtime alone changed (image layer
+extraction, copies) is re-checked by its sampled hash, not rebuilt.
+
+Verification runs over all shards in parallel. Quick mode checks sizes,
+safetensors headers against the file length (a partial download fails this
+immediately) and a hash of sampled blocks. Full mode hashes every byte.
+
+Usage:
+    python checkpoint_manifest.py /workspace/wan-s2v-14b/Wan2.2/Wan2.2-S2V-14B --build [--full]
+    python checkpoint_manifest.py /workspace/wan-s2v-14b/Wan2.2/Wan2.2-S2V-14B --verify [--full]
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = 'wan_manifest.json'
+
+# Fallback location when the checkpoint directory is read-only
+FALLBACK_MANIFEST_DIR = os.path.join(tempfile.gettempdir(), 'wan_manifests')
+
+SHARD_EXTENSIONS = ('.safetensors', '.bin', '.pt', '.pth')
+# Left behind by interrupted downloads (huggingface_hub, wget, curl)
+PARTIAL_EXTENSIONS = ('.incomplete', '.part', '.partial')
+
+# Blocks hashed for the quick (sampled) hash, and the read size for full hashes
+SAMPLE_BLOCK_BYTES = 1024 * 1024
+HASH_READ_BYTES = 8 * 1024 * 1024
+
+DEFAULT_VERIFY_WORKERS = min(8, os.cpu_count() or 4)
+
+
+class CheckpointError(RuntimeError):
+    """Raised when a checkpoint is missing shards, truncated or corrupted"""
+
+
+def manifest_locations(ckpt_dir):
+    """Where the manifest of ckpt_dir is looked for, preferred first"""
+    ckpt_dir = os.path.abspath(ckpt_dir)
+    key = hashlib.sha256(ckpt_dir.encode('utf-8')).hexdigest()[:16]
+    override = os.environ.get('WAN_MANIFEST_DIR')
+    if override:
+        return [os.path.join(override, f"{key}.json")]
+    return [os.path.join(ckpt_dir, MANIFEST_NAME), os.path.join(FALLBACK_MANIFEST_DIR, f"{key}.json")]
+
+
+# Per-shard inspection
+
+def sample_hash(path, size):
+    """blake2b of the size and the first, middle and last blocks (three reads per shard)"""
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(struct.pack('<Q', size))
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - SAMPLE_BLOCK_BYTES // 2), max(0, size - SAMPLE_BLOCK_BYTES)}):
+            f.seek(offset)
+            hasher.update(f.read(SAMPLE_BLOCK_BYTES))
+    return hasher.hexdigest()
+
+
+def full_hash(path):
+    hasher = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(HASH_READ_BYTES)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def read_safetensors_header(path, size):
+    """
+    Tensor table of a safetensors file: {name: {"dtype", "shape", "data_offsets"}}
+    Raises CheckpointError when the header is corrupt or the file is shorter
+    than the tensors it declares
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(8)
+        if len(prefix) < 8:
+            raise CheckpointError(f"{path}: truncated safetensors header")
+        header_len = struct.unpack('<Q', prefix)[0]
+        if header_len > size - 8:
+            raise CheckpointError(f"{path}: header of {header_len} bytes in a {size}-byte file")
+        try:
+            header = json.loads(f.read(header_len))
+        except ValueError:
+            raise CheckpointError(f"{path}: corrupt safetensors header")
+
+    header.pop('__metadata__', None)
+    data_end = max((info["data_offsets"][1] for info in header.values()), default=0)
+    expected = 8 + header_len + data_end
+    if size < expected:
+        raise CheckpointError(f"{path}: {size} bytes, tensors need {expected} (partial download?)")
+    return header
+
+
+def inspect_shard(ckpt_dir, relpath, with_full_hash=False):
+    """(manifest entry, tensor table) of one shard"""
+    path = os.path.join(ckpt_dir, relpath)
+    stat = os.stat(path)
+    entry = {
+        "path": relpath,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "format": os.path.splitext(relpath)[1].lstrip('.'),
+        "sample_hash": sample_hash(path, stat.st_size),
+        "full_hash": full_hash(path) if with_full_hash else None,
+    }
+    tensors = {}
+    if entry["format"] == 'safetensors':
+        for name, info in read_safetensors_header(path, stat.st_size).items():
+            tensors[name] = {"shard": relpath, "dtype": info["dtype"], "shape": info["shape"],
+                             "bytes": info["data_offsets"][1] - info["data_offsets"][0]}
+    entry["tensor_count"] = len(tensors)
+    return entry, tensors
+
+
+def same_content(path, stat, entry):
+    """
+    True when a shard still matches its entry: same size, and same mtime or,
+    failing that, the same sampled hash (copies and layer extraction reset mtimes)
+    """
+    if stat.st_size != entry["size"]:
+        return False
+    if stat.st_mtime_ns == entry["mtime_ns"]:
+        return True
+    try:
+        return sample_hash(path, stat.st_size) == entry["sample_hash"]
+    except OSError:
+        return False
+
+
+def shard_problems(ckpt_dir, entry, full=False):
+    """Problems found re-checking one shard against its manifest entry (empty when intact)"""
+    path = os.path.join(ckpt_dir, entry["path"])
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return [f"{entry['path']}: missing"]
+    if size != entry["size"]:
+        return [f"{entry['path']}: {size} bytes, manifest says {entry['size']}"]
+
+    problems = []
+    try:
+        if entry["format"] == 'safetensors':
+            read_safetensors_header(path, size)
+        if sample_hash(path, size) != entry["sample_hash"]:
+            problems.append(f"{entry['path']}: sampled content hash mismatch")
+        if full:
+            digest = full_hash(path)
+            if entry.get("full_hash") and digest != entry["full_hash"]:
+                problems.append(f"{entry['path']}: content hash mismatch")
+            entry["full_hash"] = digest
+    except CheckpointError as e:
+        problems.append(str(e))
+    except OSError as e:
+        problems.append(f"{entry['path']}: {e}")
+    return problems
+
+
+# Building, loading and validating
+
+def relevant_entries(dirs, files):
+    """What a directory listing is compared on: subdirectories, shards and partial downloads"""
+    return sorted([f"{name}/" for name in dirs] +
+                  [name for name in files if name.endswith(SHARD_EXTENSIONS + PARTIAL_EXTENSIONS)])
+
+
+def list_directory(path):
+    dirs, files = [], []
+    for item in os.scandir(path):
+        (dirs if item.is_dir() else files).append(item.name)
+    return relevant_entries(dirs, files)
+
+
+def scan_checkpoint(ckpt_dir):
+    """One walk of the tree: (shard relpaths, partial-download relpaths, directory listings)"""
+    shards, partial, directories = [], [], {}
+    for root, dirs, files in os.walk(ckpt_dir):
+        rel_root = os.path.relpath(root, ckpt_dir)
+        directories[rel_root] = relevant_entries(dirs, files)
+        for name in files:
+            relpath = os.path.normpath(os.path.join(rel_root, name))
+            if name.endswith(PARTIAL_EXTENSIONS):
+                partial.append(relpath)
+            elif name.endswith(SHARD_EXTENSIONS):
+                shards.append(relpath)
+    return sorted(shards), sorted(partial), directories
+
+
+def index_json_tensors(ckpt_dir):
+    """tensor -> shard from *.index.json weight maps (the only index .bin shards have)"""
+    index = {}
+    for name in os.listdir(ckpt_dir):
+        if name.endswith('.index.json'):
+            try:
+                with open(os.path.join(ckpt_dir, name)) as f:
+                    index.update(json.load(f).get("weight_map", {}))
+            except (OSError, ValueError):
+                continue
+    return index
+
+
+def manifest_hash(shards):
+    """Identity of the checkpoint contents: changes whenever any shard does"""
+    hasher = hashlib.sha256()
+    for entry in shards:
+        hasher.update(f"{entry['path']}:{entry['size']}:{entry['sample_hash']};".encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def build_manifest(ckpt_dir, with_full_hash=False, workers=DEFAULT_VERIFY_WORKERS, previous=None):
+    """
+    Walk ckpt_dir once and describe every shard; entries of shards whose size
+    and mtime match previous (an older manifest) are reused without reading them
+    """
+    ckpt_dir = os.path.abspath(ckpt_dir)
+    start = time.perf_counter()
+    shards, partial, directories = scan_checkpoint(ckpt_dir)
+
+    known, known_tensors = {}, {}
+    if previous is not None:
+        known = {entry["path"]: entry for entry in previous["shards"]}
+        for name, info in previous["tensors"].items():
+            known_tensors.setdefault(info["shard"], {})[name] = info
+
+    def describe(relpath):
+        old = known.get(relpath)
+        path = os.path.join(ckpt_dir, relpath)
+        stat = os.stat(path)
+        if old and (old.get("full_hash") or not with_full_hash) and same_content(path, stat, old):
+            return {**old, "mtime_ns": stat.st_mtime_ns}, known_tensors.get(relpath, {})
+        return inspect_shard(ckpt_dir, relpath, with_full_hash)
+
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        described = list(pool.map(describe, shards))
+
+    entries = [entry for entry, _ in described]
+    tensors = {name: {"shard": shard} for name, shard in index_json_tensors(ckpt_dir).items()}
+    for _, table in described:
+        tensors.update(table)
+
+    return {
+        "version": MANIFEST_VERSION,
+        "ckpt_dir": ckpt_dir,
+        "built_at": time.time(),
+        "build_seconds": round(time.perf_counter() - start, 3),
+        "hash": manifest_hash(entries),
+        "total_bytes": sum(entry["size"] for entry in entries),
+        "directories": directories,
+        "partial_files": partial,
+        "shards": entries,
+        "tensors": tensors,
+    }
+
+
+def read_manifest(ckpt_dir):
+    """The stored manifest of ckpt_dir, or None"""
+    for path in manifest_locations(ckpt_dir):
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if manifest.get("version") == MANIFEST_VERSION and \
+                manifest.get("ckpt_dir") == os.path.abspath(ckpt_dir):
+            return manifest
+    return None
+
+
+def write_manifest(manifest):
+    """Store the manifest atomically; returns the path used, or None if no location was writable"""
+    for path in manifest_locations(manifest["ckpt_dir"]):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(temp_path, path)
+            return path
+        except OSError:
+            continue
+    print("⚠️ Could not write the checkpoint manifest anywhere")
+    return None
+
+
+def stale_entries(manifest, refreshed=None):
+    """
+    Cheap validation: list the recorded directories (one read each, no walk)
+    and stat the recorded shards. Returns what changed (empty when the
+    manifest is current). Added or removed shards and subdirectories show in
+    the listings; an edited shard changes its size or sampled hash. Shards
+    whose mtime alone changed get the new mtime in their entry and are
+    appended to refreshed.
+    """
+    ckpt_dir = manifest["ckpt_dir"]
+    changed = []
+    for rel_root, listing in manifest["directories"].items():
+        try:
+            if list_directory(os.path.join(ckpt_dir, rel_root)) != listing:
+                changed.append(f"{rel_root}/")
+        except OSError:
+            changed.append(f"{rel_root}/ (missing)")
+    for entry in manifest["shards"]:
+        path = os.path.join(ckpt_dir, entry["path"])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            changed.append(f"{entry['path']} (missing)")
+            continue
+        if not same_content(path, stat, entry):
+            changed.append(entry["path"])
+        elif stat.st_mtime_ns != entry["mtime_ns"]:
+            entry["mtime_ns"] = stat.st_mtime_ns
+            if refreshed is not None:
+                refreshed.append(entry["path"])
+    return changed
+
+
+def get_manifest(ckpt_dir, workers=DEFAULT_VERIFY_WORKERS):
+    """
+    The manifest of ckpt_dir: the stored one when still current, otherwise
+    (re)built and stored. Returns None when ckpt_dir does not exist.
+    """
+    if not os.path.isdir(ckpt_dir):
+        return None
+
+    manifest = read_manifest(ckpt_dir)
+    if manifest is not None:
+        refreshed = []
+        changed = stale_entries(manifest, refreshed)
+        if not changed:
+            if refreshed:
+                # Store the new mtimes so the next start is stat-only again
+                print(f"🕒 {len(refreshed)} shard(s) have new mtimes but the same content")
+                write_manifest(manifest)
+            return manifest
+        print(f"🔄 Checkpoint changed ({', '.join(changed[:3])}{'...' if len(changed) > 3 else ''}), "
+              f"updating manifest")
+
+    manifest = build_manifest(ckpt_dir, workers=workers, previous=manifest)
+    path = write_manifest(manifest)
+    print(f"🗂️ Manifest of {len(manifest['shards'])} shard(s), {manifest['total_bytes'] / 1024 ** 3:.1f} GB "
+          f"built in {manifest['build_seconds']:.1f}s" + (f" -> {path}" if path else ""))
+    return manifest
+
+
+def verify_manifest(manifest, full=False, workers=DEFAULT_VERIFY_WORKERS):
+    """
+    Re-check every shard in parallel; returns a list of problems (empty when
+    the checkpoint is intact). full=True hashes every byte and records the
+    full hashes in the manifest.
+    """
+    problems = [f"{path}: partial download" for path in manifest.get("partial_files", [])]
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        for shard in pool.map(lambda entry: shard_problems(manifest["ckpt_dir"], entry, full),
+                              manifest["shards"]):
+            problems.extend(shard)
+    return problems
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build or verify a checkpoint manifest')
+    parser.add_argument('ckpt_dir')
+    parser.add_argument('--build', action='store_true', help='Rebuild the manifest from scratch')
+    parser.add_argument('--verify', action='store_true', help='Check every shard against the manifest')
+    parser.add_argument('--full', action='store_true', help='Hash every byte (build or verify)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_VERIFY_WORKERS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not os.path.isdir(args.ckpt_dir):
+        print(f"❌ Checkpoint directory not found: {args.ckpt_dir}")
+        return 1
+
+    if args.build:
+        manifest = build_manifest(args.ckpt_dir, with_full_hash=args.full, workers=args.workers)
+        path = write_manifest(manifest)
+        print(f"🗂️ {len(manifest['shards'])} shard(s), {len(manifest['tensors'])} tensor(s), "
+              f"{manifest['total_bytes'] / 1024 ** 3:.2f} GB in {manifest['build_seconds']:.1f}s -> {path}")
+    else:
+        manifest = get_manifest(args.ckpt_dir, workers=args.workers)
+
+    if args.verify:
+        start = time.perf_counter()
+        problems = verify_manifest(manifest, full=args.full, workers=args.workers)
+        elapsed = time.perf_counter() - start
+        if args.full and not problems:
+            write_manifest(manifest)
+        if problems:
+            print(f"❌ {len(problems)} problem(s) in {elapsed:.1f}s:")
+            for problem in problems:
+                print(f"   {problem}")
+            return 1
+        print(f"✅ {len(manifest['shards'])} shard(s) verified in {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
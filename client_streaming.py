@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Streaming request bodies and response parsing for the RunPod clients
+PayloadBody base64-encodes input files block by block while the request is
+being sent, and VideoResponseDecoder decodes a response's video_base64
+straight into a file as it is received. Neither the encoded inputs nor the
+encoded video are ever held in memory whole.
+"""
+
+import os
+import json
+import base64
+import codecs
+
+# Input bytes read per block when base64-encoding (multiple of 3, so blocks
+# concatenate); the same as output_sinks, repeated so the clients need no
+# server-side module
+ENCODE_CHUNK_BYTES = 3 * 256 * 1024
+
+# Response bytes read per block
+DECODE_CHUNK_BYTES = 256 * 1024
+
+
+def base64_length(size):
+    return 4 * ((size + 2) // 3)
+
+
+class PayloadBody:
+    """
+    JSON body {"input": {**fields, <file field>: <base64 of file>, ...}}
+    produced block by block. It has a length, so it is sent with a
+    Content-Length rather than chunked, and it can be iterated again for a retry.
+    """
+
+    def __init__(self, files, fields, chunk_bytes=ENCODE_CHUNK_BYTES):
+        """files maps input field -> path; fields are the other input values"""
+        self.files = dict(files)
+        self.chunk_bytes = chunk_bytes
+        # '{"input": {"prompt": "..."}}' without the closing braces
+        self.head = json.dumps({"input": fields})[:-2].encode('ascii')
+        self.has_fields = bool(fields)
+        self.sizes = {key: os.path.getsize(path) for key, path in self.files.items()}
+
+    def _prefix(self, index, key):
+        separator = ', ' if index or self.has_fields else ''
+        return f'{separator}{json.dumps(key)}: "'.encode('ascii')
+
+    def __len__(self):
+        length = len(self.head) + 2
+        for index, key in enumerate(self.files):
+            length += len(self._prefix(index, key)) + base64_length(self.sizes[key]) + 1
+        return length
+
+    def __iter__(self):
+        yield self.head
+        for index, (key, path) in enumerate(self.files.items()):
+            yield self._prefix(index, key)
+            with open(path, 'rb') as f:
+                while True:
+                    block = f.read(self.chunk_bytes)
+                    if not block:
+                        break
+                    yield base64.b64encode(block)
+            yield b'"'
+        yield b'}}'
+
+    async def aiter(self):
+        """The same blocks as an async iterator, for aiohttp"""
+        for block in self:
+            yield block
+
+
+class VideoResponseDecoder:
+    """
+    Incremental JSON parser for a handler response. The value of the first
+    video_base64 field is decoded into output_path while the response is
+    being read; everything else is kept and parsed at the end, where the
+    field is replaced by "video_file": output_path.
+    """
+
+    def __init__(self, output_path, key='video_base64'):
+        self.output_path = output_path
+        self.key = key
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.parts = []
+        self.file = None
+        self.video_bytes = 0
+        self.pending_base64 = ''
+        self.in_video = False
+        self.video_done = False
+        # Scanner state outside the video value
+        self.in_string = False
+        self.escape = False
+        self.string_head = []
+        self.expect = None          # ':' then '"' after a string equal to key
+
+    def feed(self, data):
+        text = self.utf8.decode(data)
+        i = 0
+        while i < len(text):
+            if self.in_video:
+                end = text.find('"', i)
+                self._write_base64(text[i:] if end < 0 else text[i:end])
+                if end < 0:
+                    return
+                self._close_video()
+                i = end + 1
+                continue
+
+            # Outside the video value the response is small; walk it character by character
+            ch = text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if not self.video_done and ''.join(self.string_head) == self.key:
+                        self.expect = ':'
+                if self.in_string and len(self.string_head) <= len(self.key):
+                    self.string_head.append(ch)
+                self.parts.append(ch)
+            elif ch in ' \t\r\n':
+                self.parts.append(ch)
+            elif self.expect == ':' and ch == ':':
+                self.expect = '"'
+                self.parts.append(ch)
+            elif self.expect == '"' and ch == '"':
+                self.expect = None
+                self._open_video()
+            else:
+                self.expect = None
+                if ch == '"':
+                    self.in_string = True
+                    self.string_head = []
+                self.parts.append(ch)
+            i += 1
+
+    def _open_video(self):
+        self.in_video = True
+        self.file = open(self.output_path, 'wb')
+        self.parts.append('null')
+
+    def _write_base64(self, segment):
+        # Some encoders escape '/' as '\/'; base64 itself never contains a backslash
+        self.pending_base64 += segment.replace('\\', '')
+        usable = len(self.pending_base64) // 4 * 4
+        if usable:
+            block = base64.b64decode(self.pending_base64[:usable])
+            self.file.write(block)
+            self.video_bytes += len(block)
+            self.pending_base64 = self.pending_base64[usable:]
+
+    def _close_video(self):
+        if self.pending_base64:
+            raise ValueError("truncated video_base64 in response")
+        self.file.close()
+        self.file = None
+        self.in_video = False
+        self.video_done = True
+
+    def _replace_field(self, value):
+        if isinstance(value, dict):
+            if self.key in value and value[self.key] is None:
+                del value[self.key]
+                value["video_file"] = self.output_path
+            for item in value.values():
+                self._replace_field(item)
+        elif isinstance(value, list):
+            for item in value:
+                self._replace_field(item)
+
+    def finish(self):
+        """Parse the rest of the response; returns the result dict"""
+        if self.file is not None:
+            self.file.close()
+            raise ValueError("response ended inside video_base64")
+        result = json.loads(''.join(self.parts) + self.utf8.decode(b'', final=True))
+        if self.video_done:
+            self._replace_field(result)
+        return result
+
+
+def decode_response(chunks, output_path):
+    """Run an iterable of response blocks through a VideoResponseDecoder"""
+    decoder = VideoResponseDecoder(output_path)
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder.finish()
@@ -0,0 +1,2 @@
+# The test_*endpoint.py scripts exercise a live RunPod endpoint and are run by hand
+collect_ignore = ["test_fixed_endpoint.py", "test_runpod_endpoint.py", "test_working_endpoint.py"]
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Per-job deadlines and cancellation
+A Deadline travels with a job from the handler into the pipeline, which
+checks it between denoising steps and clips so an overrunning or cancelled
+job stops cleanly and the worker stays warm
+"""
+
+import time
+import threading
+
+
+class GenerationCancelled(Exception):
+    """Raised when a job is cancelled by the client"""
+
+
+class DeadlineExceeded(GenerationCancelled):
+    """Raised when a job runs out of time budget"""
+
+
+class Deadline:
+    """
+    Time budget plus cancellation flag for one job
+    seconds=None means no time limit (cancellation still works)
+    """
+
+    def __init__(self, seconds=None, cancel_event=None):
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + seconds if seconds is not None else None
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self.missed = False
+
+    def remaining(self):
+        """Seconds left, or float('inf') without a time limit"""
+        if self.expires_at is None:
+            return float('inf')
+        return self.expires_at - time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def can_fit(self, seconds):
+        """True when another `seconds` of work still fits in the budget"""
+        return not self.cancelled() and self.remaining() >= seconds
+
+    def check(self, where=''):
+        """Raise if the job was cancelled or its time is up"""
+        suffix = f" during {where}" if where else ''
+        if self.cancelled():
+            raise GenerationCancelled(f"job cancelled{suffix}")
+        if self.remaining() <= 0:
+            self.miss(f"deadline exceeded after {self.elapsed():.1f}s{suffix}")
+
+    def miss(self, reason):
+        """Give up on the deadline, e.g. when the remaining work will not fit"""
+        self.missed = True
+        raise DeadlineExceeded(reason)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+One resident pipeline worker per device
+Enumerates the devices a pod can use (every visible GPU, or N CPU "devices"
+for exercising the scheduling without one) and keeps one pipeline and one
+job thread per device. Each job goes to the least-loaded device: among the
+devices with memory headroom for it, the one with the fewest queued and
+running jobs (most headroom on a tie). When no device has room, the shortest
+queue wins and the job waits there for memory to free up.
+"""
+
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import torch
+except ImportError:  # CPU devices work without torch
+    torch = None
+
+# Simulated memory of each CPU device
+DEFAULT_CPU_DEVICE_MEMORY_BYTES = 24 * 1024 ** 3
+
+
+class Device:
+    """A GPU (kind 'cuda') or a simulated CPU device (kind 'cpu')"""
+
+    def __init__(self, kind, index, memory_bytes=DEFAULT_CPU_DEVICE_MEMORY_BYTES):
+        self.kind = kind
+        self.index = index
+        self.memory_bytes = memory_bytes
+
+    @property
+    def name(self):
+        return f"{self.kind}:{self.index}"
+
+    def __repr__(self):
+        return self.name
+
+
+def enumerate_devices(spec='auto', cpu_memory_bytes=DEFAULT_CPU_DEVICE_MEMORY_BYTES):
+    """
+    Devices for a spec: 'auto' (every visible GPU, else one CPU device),
+    'cuda' (every visible GPU), a list like 'cuda:0,cuda:2', or 'cpu:N'
+    (N CPU devices). GPU indices are relative to CUDA_VISIBLE_DEVICES.
+    """
+    spec = (spec or 'auto').strip().lower()
+    gpus = torch.cuda.device_count() if torch is not None and torch.cuda.is_available() else 0
+
+    if spec == 'auto':
+        if gpus:
+            return [Device('cuda', i) for i in range(gpus)]
+        return [Device('cpu', 0, cpu_memory_bytes)]
+    if spec == 'cuda':
+        if not gpus:
+            raise ValueError("WAN_DEVICES=cuda but no GPU is visible")
+        return [Device('cuda', i) for i in range(gpus)]
+    if spec.startswith('cpu'):
+        _, _, count = spec.partition(':')
+        return [Device('cpu', i, cpu_memory_bytes) for i in range(int(count or 1))]
+
+    devices = []
+    for item in spec.split(','):
+        kind, _, index = item.strip().partition(':')
+        if kind != 'cuda' or not index.isdigit():
+            raise ValueError(f"Invalid device '{item}', expected cuda:N")
+        if int(index) >= gpus:
+            raise ValueError(f"Device {item} is not visible ({gpus} GPU(s))")
+        devices.append(Device('cuda', int(index)))
+    return devices
+
+
+class DeviceWorker:
+    """
+    One device's pipeline, job thread and load counters. The counters are
+    only changed under lock, which the pool shares with its placement.
+    """
+
+    def __init__(self, device, lock=None):
+        self.device = device
+        self.lock = lock if lock is not None else threading.Lock()
+        self.pipeline = None
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix=f"wan-{device.kind}{device.index}",
+                                           initializer=self._bind_device)
+        self.queued = 0
+        self.active = 0
+        self.queued_bytes = 0
+        self.active_bytes = 0
+        self.jobs = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+
+    def _bind_device(self):
+        # Everything on this thread (model load, generation) defaults to this GPU
+        if self.device.kind == 'cuda':
+            torch.cuda.set_device(self.device.index)
+
+    def memory(self):
+        """(free, total) bytes; a CPU device's free memory is its capacity minus the running job"""
+        if self.device.kind == 'cuda':
+            return torch.cuda.mem_get_info(self.device.index)
+        return self.device.memory_bytes - self.active_bytes, self.device.memory_bytes
+
+    def headroom(self):
+        """Free memory not yet promised to jobs queued here"""
+        return self.memory()[0] - self.queued_bytes
+
+    def execute(self, fn, args, bytes_needed):
+        """Runs on the device thread: fn(self, *args), with the load counters kept up to date"""
+        with self.lock:
+            self.queued -= 1
+            self.queued_bytes -= bytes_needed
+            self.active += 1
+            self.active_bytes += bytes_needed
+        start = time.perf_counter()
+        failed = False
+        try:
+            return fn(self, *args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            with self.lock:
+                self.busy_seconds += time.perf_counter() - start
+                self.active -= 1
+                self.active_bytes -= bytes_needed
+                self.jobs += 1
+                self.failures += failed
+
+
+class DevicePool:
+    """
+    Route jobs to per-device workers. pipeline_factory(device) builds (and
+    loads) a device's pipeline; all devices load in parallel, each on its
+    own thread.
+    """
+
+    def __init__(self, devices, pipeline_factory=None):
+        if not devices:
+            raise ValueError("DevicePool needs at least one device")
+        self.lock = threading.Lock()
+        self.workers = [DeviceWorker(device, self.lock) for device in devices]
+        self.started_at = time.perf_counter()
+        if pipeline_factory is not None:
+            self.each(lambda worker: setattr(worker, 'pipeline', pipeline_factory(worker.device)))
+
+    def each(self, fn):
+        """Run fn(worker) on every device's thread at once; returns the results in device order"""
+        futures = [worker.executor.submit(fn, worker) for worker in self.workers]
+        return [future.result() for future in futures]
+
+    def place(self, bytes_needed=0):
+        """Pick the least-loaded device for a job needing bytes_needed and reserve a queue slot"""
+        with self.lock:
+            candidates = [(worker, worker.headroom()) for worker in self.workers]
+            fits = [c for c in candidates if c[1] >= bytes_needed]
+            if not fits:
+                print(f"⚠️ No device has {bytes_needed / 1024 ** 3:.1f} GB free, queueing on the shortest queue")
+            worker, _ = min(fits or candidates, key=lambda c: (c[0].queued + c[0].active, -c[1]))
+            worker.queued += 1
+            worker.queued_bytes += bytes_needed
+            return worker
+
+    def submit(self, fn, *args, bytes_needed=0):
+        """Queue fn(worker, *args) on the least-loaded device; returns (worker, concurrent future)"""
+        worker = self.place(bytes_needed)
+        return worker, worker.executor.submit(worker.execute, fn, args, bytes_needed)
+
+    async def run(self, fn, *args, bytes_needed=0):
+        """Async submit(); returns (worker, fn's result)"""
+        worker, future = self.submit(fn, *args, bytes_needed=bytes_needed)
+        return worker, await asyncio.wrap_future(future)
+
+    def stats(self):
+        """Per-device utilization, queue length, jobs and free memory"""
+        elapsed = time.perf_counter() - self.started_at
+        stats = {}
+        with self.lock:
+            for worker in self.workers:
+                free, total = worker.memory()
+                stats[worker.device.name] = {
+                    "utilization": round(worker.busy_seconds / elapsed, 4) if elapsed else 0.0,
+                    "queued": worker.queued,
+                    "active": worker.active,
+                    "jobs": worker.jobs,
+                    "failures": worker.failures,
+                    "free_gb": round(free / 1024 ** 3, 2),
+                    "total_gb": round(total / 1024 ** 3, 2),
+                }
+        return stats
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.executor.shutdown(wait=False)
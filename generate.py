@@ -8,20 +8,88 @@ import os
 import sys
 import argparse
 import json
-import torch
+import time
+import struct
+import tempfile
+import zlib
+import math
+from contextlib import contextmanager
 from pathlib import Path
 
+from asset_cache import AssetCache, file_digest
+from deadline import Deadline, DeadlineExceeded, GenerationCancelled
+from metrics import stage_timer
+from media_probe import MediaProbeError, probe_audio
+from checkpoint_manifest import CheckpointError, get_manifest, verify_manifest
+from weight_cache import WeightCache
+from offload_planner import OffloadPlanError, OffloadPlanner, Prefetcher, module_specs
+
+try:
+    import torch
+except ImportError:  # mock generation works without torch
+    torch = None
+
+def str2bool(value):
+    """Parse 'True'/'False' style command line flags"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('true', '1', 'yes', 'y')
+
+def parse_offload_mode(value):
+    """--offload_model: 'auto' (plan from the memory budget), or True/False for all or nothing"""
+    if str(value).strip().lower() == 'auto':
+        return 'auto'
+    return str2bool(value)
+
+@contextmanager
+def phase_timer(timings, name):
+    """Record the wall-clock seconds of a block in timings[name]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - start, 4)
+
+def notify(progress, **event):
+    """Send a progress event to the callback, if there is one"""
+    if progress is not None:
+        progress(event)
+
+def add_timing(samples, name, seconds):
+    """Charge a stage shared by a batch to the timings of every sample in it"""
+    for sample in samples:
+        if sample["timings"] is not None:
+            sample["timings"].add(name, seconds)
+
+def parse_size(size):
+    """Parse a '1024*704' resolution string into (width, height)"""
+    width, height = str(size).lower().replace('x', '*').split('*')
+    return int(width), int(height)
+
+def audio_duration_seconds(audio_path):
+    """Duration of a WAV, MP3 or FLAC file from its headers, or None if unknown"""
+    try:
+        return probe_audio(audio_path)["duration_seconds"]
+    except (MediaProbeError, OSError):
+        return None
+
 def parse_args():
     parser = argparse.ArgumentParser(description='WAN S2V Generation')
     parser.add_argument('--task', type=str, default='s2v-14B', help='Task type')
     parser.add_argument('--size', type=str, default='512*512', help='Output resolution')
     parser.add_argument('--ckpt_dir', type=str, required=True, help='Checkpoint directory')
-    parser.add_argument('--offload_model', type=str, default='True', help='Offload model to save memory')
+    parser.add_argument('--offload_model', type=str, default='auto',
+                        help='auto (offload only what the GPU memory cannot hold), True or False')
+    parser.add_argument('--gpu_memory_gb', type=float, default=None, help='Plan offloading for this memory budget instead of the measured one')
     parser.add_argument('--convert_model_dtype', action='store_true', help='Convert model dtype')
     parser.add_argument('--prompt', type=str, required=True, help='Text prompt')
     parser.add_argument('--image', type=str, required=True, help='Input image path')
     parser.add_argument('--audio', type=str, required=True, help='Input audio path')
     parser.add_argument('--output', type=str, required=True, help='Output video path')
+    parser.add_argument('--asset_cache_dir', type=str, default=None, help='Disk tier for cached image latents and audio features')
+    parser.add_argument('--timeout', type=float, default=None, help='Stop generation after this many seconds')
+    parser.add_argument('--allow_partial', action='store_true', help='On timeout, keep the clips finished so far')
+    parser.add_argument('--motion_video', type=str, default=None, help="Previous segment's tail frames to continue from")
     return parser.parse_args()
 
 def setup_model_environment():
@@ -43,28 +111,40 @@ def setup_model_environment():
             print(f"   Added {path} to Python path")
 
 def find_model_files(ckpt_dir):
-    """Find and validate model files"""
-    print(f"🔍 Searching for model files in {ckpt_dir}...")
+    """
+    Find the model files through the checkpoint manifest (built on first use,
+    then validated by size and mtime); returns the manifest, or None when
+    there are no model files
+    """
+    print(f"🔍 Reading checkpoint manifest of {ckpt_dir}...")
     
-    if not os.path.exists(ckpt_dir):
+    manifest = get_manifest(ckpt_dir)
+    if manifest is None:
         print(f"❌ Checkpoint directory not found: {ckpt_dir}")
-        return False
-    
-    # Look for common model files
-    model_files = []
-    for root, dirs, files in os.walk(ckpt_dir):
-        for file in files:
-            if file.endswith(('.bin', '.safetensors', '.pt', '.pth')):
-                model_files.append(os.path.join(root, file))
-    
-    if model_files:
-        print(f"✅ Found {len(model_files)} model files")
-        for f in model_files[:5]:  # Show first 5
-            print(f"   {f}")
-        return True
+        return None
+    
+    if manifest["shards"]:
+        print(f"✅ Found {len(manifest['shards'])} model files "
+              f"({manifest['total_bytes'] / 1024 ** 3:.1f} GB, {len(manifest['tensors'])} tensors)")
+        for shard in manifest["shards"][:5]:  # Show first 5
+            print(f"   {shard['path']}")
+        return manifest
     else:
         print("❌ No model files found")
-        return False
+        return None
+
+def verify_model_files(manifest, mode='quick'):
+    """
+    Check the shards against the manifest before loading them; raises
+    CheckpointError on a truncated or corrupted download. mode is 'quick'
+    (sizes, headers, sampled hashes), 'full' (every byte) or 'off'.
+    """
+    if mode == 'off':
+        return
+    problems = verify_manifest(manifest, full=(mode == 'full'))
+    if problems:
+        raise CheckpointError(f"Checkpoint {manifest['ckpt_dir']} failed verification: " + "; ".join(problems[:5]))
+    print(f"✅ {len(manifest['shards'])} model files verified ({mode})")
 
 def validate_inputs(args):
     """Validate input files"""
@@ -77,6 +157,9 @@ def validate_inputs(args):
     if not os.path.exists(args.audio):
         raise FileNotFoundError(f"Audio file not found: {args.audio}")
     
+    if getattr(args, 'motion_video', None) and not os.path.exists(args.motion_video):
+        raise FileNotFoundError(f"Motion video not found: {args.motion_video}")
+    
     # Check file sizes
     image_size = os.path.getsize(args.image)
     audio_size = os.path.getsize(args.audio)
@@ -92,6 +175,36 @@ def validate_inputs(args):
     
     print("✅ Input validation passed")
 
+def write_silent_wav(path, seconds=0.25, sample_rate=16000):
+    """Write a mono 16-bit PCM WAV of silence (used for warmup)"""
+    data_size = int(seconds * sample_rate) * 2
+    header = b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE'
+    header += b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    header += b'data' + struct.pack('<I', data_size)
+    
+    with open(path, 'wb') as f:
+        f.write(header + b'\x00' * data_size)
+
+def write_blank_png(path, width=64, height=64):
+    """Write a grey RGB PNG (used for warmup)"""
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    
+    raw = b''.join(b'\x00' + b'\x80' * (width * 3) for _ in range(height))
+    png = b'\x89PNG\r\n\x1a\n'
+    png += chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    png += chunk(b'IDAT', zlib.compress(raw))
+    png += chunk(b'IEND', b'')
+    
+    with open(path, 'wb') as f:
+        f.write(png)
+
+def write_mock_ts_segment(path, packets=64):
+    """Write an MPEG-TS segment of null packets (placeholder for an encoded clip)"""
+    null_packet = b'\x47\x1f\xff\x10' + b'\xff' * 184
+    with open(path, 'wb') as f:
+        f.write(null_packet * packets)
+
 def mock_generation(args):
     """
     Mock video generation for testing
@@ -112,18 +225,606 @@ def mock_generation(args):
     
     return True
 
-def try_real_generation(args):
+class S2VPipeline:
     """
-    Attempt to run the real model generation
-    Falls back to mock generation if model is not available
+    Resident WAN S2V pipeline
+
+    Load the model once with load(), then call generate() for every request.
+    The RunPod handler keeps one instance alive for the life of the worker so
+    warm jobs only pay for generation, not for imports and weight loading.
     """
-    print("🚀 Attempting real model generation...")
+
+    # Output frame rate, frames generated per model clip and denoising steps per clip
+    FPS = 16
+    INFER_FRAMES = 80
+    SAMPLE_STEPS = 40
+
+    # Simulated seconds per denoising step in mock generation (0 = instant)
+    MOCK_STEP_SECONDS = float(os.environ.get('WAN_MOCK_STEP_SECONDS', 0))
+
+    # Checkpoint check before loading: quick, full or off
+    VERIFY_CHECKPOINT = os.environ.get('WAN_VERIFY_CHECKPOINT', 'quick').lower()
+
+    # Peak VAE decoder memory per output pixel (a few frames of 128-channel bf16 feature maps)
+    VAE_DECODE_BYTES_PER_PIXEL = 4 * 128 * 2 * 3
+
+    # Simulated device memory budget for offload planning (e.g. on CPU); unset = measured
+    GPU_MEMORY_GB = float(os.environ.get('WAN_GPU_MEMORY_GB', 0))
+
+    # Keep --convert_model_dtype weights as a memory-mapped snapshot on the volume
+    WEIGHT_CACHE = os.environ.get('WAN_WEIGHT_CACHE', 'true').lower() in ('true', '1', 'yes')
+
+    # Rough denoiser working memory per latent token (hidden size x bf16 x buffers),
+    # used to cap batch sizes by free GPU memory
+    ACTIVATION_BYTES_PER_TOKEN = 5120 * 2 * 6
+
+    def __init__(self, ckpt_dir, task='s2v-14B', offload_model=True, convert_model_dtype=False,
+                 asset_cache=None, device='cuda', memory_budget=None):
+        self.ckpt_dir = ckpt_dir
+        # Torch device the weights live on ('cuda', 'cuda:1', ...); one pipeline per GPU
+        self.device = device
+        self.task = task
+        self.offload_model = parse_offload_mode(offload_model)
+        # Device memory to plan offloading for, in bytes; None measures the GPU
+        self.memory_budget = memory_budget or (int(self.GPU_MEMORY_GB * 1024 ** 3) or None)
+        self.planner = None
+        self.prefetcher = None
+        self.convert_model_dtype = convert_model_dtype
+        # Reference-image latents and audio features, keyed by content hash
+        self.asset_cache = asset_cache if asset_cache is not None else AssetCache()
+        self.model = None
+        self.manifest = None
+        # True when the converted weights were memory-mapped from the weight cache
+        self.weights_cached = False
+        self.model_available = False
+        self.loaded = False
+        self.warmed_up = False
+        # Seconds spent in each load phase, reported in the cold-start profile
+        self.load_timings = {}
+
+    def load(self):
+        """Resolve paths and load the model weights (only the first call does work)"""
+        if self.loaded:
+            return self
+        
+        with phase_timer(self.load_timings, 'environment'):
+            setup_model_environment()
+        
+        with phase_timer(self.load_timings, 'model_discovery'):
+            self.manifest = find_model_files(self.ckpt_dir)
+            self.model_available = self.manifest is not None
+        
+        if self.model_available:
+            with phase_timer(self.load_timings, 'checkpoint_verify'):
+                verify_model_files(self.manifest, self.VERIFY_CHECKPOINT)
+            # Module sizes as loaded: bfloat16 after --convert_model_dtype
+            self.planner = OffloadPlanner(module_specs(self.manifest, 2 if self.convert_model_dtype else None),
+                                          mode=self.offload_model)
+            self.model = self._load_real_model()
+        else:
+            print("⚠️  Model files not found, using mock generation")
+        
+        self.loaded = True
+        return self
+
+    def _load_real_model(self):
+        """
+        Load the real WAN S2V model
+        Returns None when the model is not available, which selects mock generation
+        """
+        print("🚀 Attempting real model load...")
+        
+        # This is where you'd import your actual WAN S2V model code; the shard
+        # read and the --convert_model_dtype pass are timed separately. With a
+        # converted snapshot the model can be built on the meta device, since
+        # load_converted() supplies every weight
+        with phase_timer(self.load_timings, 'weight_read'):
+            model = None
+        
+        with phase_timer(self.load_timings, 'dtype_conversion'):
+            if model is not None and self.convert_model_dtype:
+                model = self.load_converted(model)
+        
+        # Offloaded modules stay on the host; apply_offload_plan() places the
+        # rest once the first job's resolution is known
+        with phase_timer(self.load_timings, 'to_device'):
+            if model is not None and self.offload_model is False:
+                model = model.to(self.device)
+        
+        print("⚠️  Real model not implemented yet, using mock generation")
+        return None
+
+    def load_converted(self, model, dtype=None):
+        """
+        Give model its weights in dtype (bfloat16 by default), memory-mapped
+        from the converted snapshot of this checkpoint; the first load writes
+        the snapshot. Falls back to converting in place when the cache is off.
+        """
+        dtype = dtype or torch.bfloat16
+        if not self.WEIGHT_CACHE or not self.manifest:
+            return model.to(dtype)
+        
+        state, self.weights_cached = WeightCache().load(self.manifest, dtype)
+        missing, _ = model.load_state_dict(state, strict=False, assign=True)
+        if missing:
+            print(f"⚠️  {len(missing)} weights not in the checkpoint, converting them in place")
+            model = model.to(dtype)
+        return model
+
+    def warmup(self, size='512*512'):
+        """
+        Run one tiny dummy generation so kernel selection and allocator growth
+        happen before the first real job
+        """
+        if not self.loaded:
+            self.load()
+        
+        print("🔥 Running warmup generation...")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            audio_path = os.path.join(temp_dir, 'warmup_audio.wav')
+            image_path = os.path.join(temp_dir, 'warmup_image.png')
+            output_path = os.path.join(temp_dir, 'warmup_video.mp4')
+            
+            write_silent_wav(audio_path)
+            write_blank_png(image_path)
+            
+            with phase_timer(self.load_timings, 'first_step'):
+                success = self.generate(
+                    prompt='warmup',
+                    image=image_path,
+                    audio=audio_path,
+                    output=output_path,
+                    size=size
+                )
+        
+        self.warmed_up = success
+        print(f"✅ Warmup finished in {self.load_timings['first_step']:.2f}s")
+        return success
+
+    def preprocess(self, image, audio, size, timings=None):
+        """
+        CPU side of input preparation: validation, then decoding and resizing
+        the reference image and resampling the audio for the encoders. It
+        touches no GPU state, so the handler can run it for the next job on a
+        CPU thread while another job is denoising. Returns the prepared
+        inputs for render().
+        """
+        with stage_timer(timings, 'validate'):
+            validate_inputs(argparse.Namespace(image=image, audio=audio))
+        with stage_timer(timings, 'load_inputs'):
+            if self.model is not None:
+                # This is where you'd decode + resize the image to size and
+                # decode + resample the audio to the audio encoder's rate
+                return {"size": size, "image": self.model.load_image(image, size),
+                        "audio": self.model.load_audio(audio)}
+            return {"size": size, "image": None, "audio": None}
+
+    def encode_reference_image(self, image_path, size, digest=None, pixels=None):
+        """
+        VAE latents of the reference image, reused for repeated images.
+        A cache hit also avoids moving the VAE back onto the GPU when offloading.
+        pixels are the preprocessed image from preprocess(), when available.
+        """
+        digest = digest or file_digest(image_path)
+        return self.asset_cache.get_or_compute(
+            f"image_latents-{size.replace('*', 'x')}", digest,
+            lambda: self._encode_image(image_path, size, pixels)
+        )
+
+    def extract_audio_features(self, audio_path, digest=None, waveform=None):
+        """
+        Audio feature embeddings of the driving audio, reused for repeated audio.
+        waveform is the resampled audio from preprocess(), when available.
+        """
+        digest = digest or file_digest(audio_path)
+        return self.asset_cache.get_or_compute(
+            'audio_features', digest,
+            lambda: self._encode_audio(audio_path, waveform)
+        )
+
+    def _encode_image(self, image_path, size, pixels=None):
+        print("🖼️  Encoding reference image...")
+        if self.model is not None:
+            # This is where you'd run the WAN VAE encoder on the resized reference image
+            return self.model.encode_image(pixels if pixels is not None else image_path, size)
+        return {"size": size, "num_bytes": os.path.getsize(image_path)}
+
+    def _encode_audio(self, audio_path, waveform=None):
+        print("🎵 Extracting audio features...")
+        if self.model is not None:
+            # This is where you'd run the audio encoder on the resampled waveform
+            return self.model.encode_audio(waveform if waveform is not None else audio_path)
+        return {"num_bytes": os.path.getsize(audio_path)}
+
+    def num_clips(self, audio_path):
+        """Number of model clips needed for the audio, or None if its length is unknown"""
+        duration = audio_duration_seconds(audio_path)
+        if duration is None:
+            return None
+        return max(1, math.ceil(duration * self.FPS / self.INFER_FRAMES))
+
+    def batch_key(self, size, audio_path):
+        """
+        Jobs with equal keys (same resolution and clip count) can share one
+        denoiser pass; audio of unknown length gets a key of its own
+        """
+        clips = self.num_clips(audio_path)
+        return (size, clips if clips is not None else audio_path)
+
+    def estimate_sample_bytes(self, size):
+        """Approximate denoiser working memory for one sample at this resolution"""
+        width, height = parse_size(size)
+        tokens = (width // 16) * (height // 16) * (self.INFER_FRAMES // 4 + 1)
+        return tokens * self.ACTIVATION_BYTES_PER_TOKEN
+
+    def activation_bytes(self, size):
+        """Peak activation memory per model component at this resolution (the encoders' are negligible)"""
+        width, height = parse_size(size)
+        return {'dit': self.estimate_sample_bytes(size), 'vae': width * height * self.VAE_DECODE_BYTES_PER_PIXEL}
+
+    def device_budget(self):
+        """Device memory the model may use: the simulated budget, or free GPU memory plus what it already holds"""
+        if self.memory_budget:
+            return self.memory_budget
+        if not self.uses_cuda():
+            return None
+        free_bytes, _ = torch.cuda.mem_get_info(torch.device(self.device))
+        placed = self.prefetcher.plan.resident_bytes if self.prefetcher and self.prefetcher.plan else 0
+        return free_bytes + placed
+
+    def offload_plan(self, size):
+        """The placement plan for size on this device (cached), or None when there is nothing to plan"""
+        if self.planner is None:
+            return None
+        budget = self.device_budget()
+        if budget is None:
+            return None
+        activation = self.activation_bytes(size)
+        try:
+            return self.planner.plan(self.device, size, budget, activation)
+        except OffloadPlanError as e:
+            # The budget is an estimate; let the job try with the whole model
+            # on the device rather than fail every job at this size up front
+            print(f"⚠️  {e}; keeping every module resident")
+            return self.planner.plan(self.device, size, budget, activation, mode=False)
+
+    def apply_offload_plan(self, size):
+        """Place the model's modules for size: resident ones on the device, the rest streamed from the host"""
+        plan = self.offload_plan(size)
+        if plan is not None and self.model is not None and self.uses_cuda():
+            if self.prefetcher is None:
+                # This is where you'd map the plan's module names ('text_encoder', 'vae',
+                # 'audio_encoder', 'dit.blocks.N', ...) onto the model's torch modules
+                self.prefetcher = Prefetcher(self.model.offload_modules(), self.device)
+            self.prefetcher.apply(plan)
+        return plan
+
+    def uses_cuda(self):
+        return torch is not None and torch.cuda.is_available() and str(self.device).startswith('cuda')
+
+    def max_batch_size(self, size, limit):
+        """Largest batch (up to limit) that fits in free GPU memory"""
+        if not self.uses_cuda():
+            return limit
+        free_bytes, _ = torch.cuda.mem_get_info(torch.device(self.device))
+        return max(1, min(limit, int(free_bytes * 0.9 // self.estimate_sample_bytes(size))))
+
+    def _make_args(self, prompt, image, audio, output, size, motion_video=None):
+        return argparse.Namespace(
+            task=self.task,
+            size=size,
+            ckpt_dir=self.ckpt_dir,
+            prompt=prompt,
+            image=image,
+            audio=audio,
+            output=output,
+            motion_video=motion_video
+        )
+
+    def generate_batch(self, requests):
+        """
+        Generate several compatible videos (same size and clip count) in one
+        denoiser pass. requests is a list of generate() keyword dicts, which may
+        also carry progress, segment_dir, deadline, allow_partial and timings;
+        each keeps the single-job semantics of generate(). Returns one (success,
+        error details) pair per request.
+        """
+        if not self.loaded:
+            self.load()
+        
+        samples = []
+        for request in requests:
+            args = self._make_args(request['prompt'], request['image'], request['audio'],
+                                   request['output'], request.get('size', '512*512'),
+                                   motion_video=request.get('motion_video'))
+            sample = self._new_sample(args, request)
+            try:
+                self._condition(sample, request.get('image_digest'), request.get('audio_digest'))
+            except Exception as e:
+                sample["error"] = e
+            samples.append(sample)
+        
+        self._denoise([sample for sample in samples if "error" not in sample])
+        
+        results = []
+        for sample in samples:
+            if "error" in sample:
+                if isinstance(sample["error"], GenerationCancelled):
+                    print(f"🛑 Generation stopped: {sample['error']}")
+                results.append((False, str(sample["error"])))
+                continue
+            try:
+                success = self.write_video(sample["rendered"], progress=sample["progress"],
+                                           timings=sample["timings"])
+                results.append((success, None if success else "Pipeline returned no output"))
+            except Exception as e:
+                results.append((False, str(e)))
+        
+        if any(isinstance(sample.get("error"), GenerationCancelled) for sample in samples):
+            self.release_memory()
+        return results
+
+    def _new_sample(self, args, options):
+        """One job's state through conditioning and denoising"""
+        return {
+            "args": args,
+            "progress": options.get('progress'),
+            "segment_dir": options.get('segment_dir'),
+            "deadline": options.get('deadline'),
+            "allow_partial": bool(options.get('allow_partial', False)),
+            "timings": options.get('timings'),
+            "prepared": options.get('prepared'),
+        }
+
+    def _condition(self, sample, image_digest=None, audio_digest=None):
+        """Preprocessing, offload placement and the image and audio encoders for one sample"""
+        args, progress, timings = sample["args"], sample["progress"], sample["timings"]
+        prepared = sample["prepared"]
+        if prepared is None:
+            notify(progress, type='stage', stage='validate')
+            prepared = self.preprocess(args.image, args.audio, args.size, timings=timings)
+        
+        with stage_timer(timings, 'offload_plan'):
+            self.apply_offload_plan(args.size)
+        
+        notify(progress, type='stage', stage='encode_image')
+        with stage_timer(timings, 'encode_image'):
+            sample["image_latents"] = self.encode_reference_image(args.image, args.size, digest=image_digest,
+                                                                  pixels=prepared["image"])
+        
+        notify(progress, type='stage', stage='encode_audio')
+        with stage_timer(timings, 'encode_audio'):
+            sample["audio_features"] = self.extract_audio_features(args.audio, digest=audio_digest,
+                                                                   waveform=prepared["audio"])
+        
+        if sample["deadline"] is not None:
+            sample["deadline"].check('encoding')
+        sample["num_clips"] = self.num_clips(args.audio) or 1
+        return sample
+
+    def _denoise(self, samples):
+        """
+        Run the denoiser once over samples, setting each sample's "rendered"
+        (for write_video()) or its "error"
+        """
+        if not samples:
+            return
+        for sample in samples:
+            notify(sample["progress"], type='stage', stage='denoise')
+        
+        if self.model is None:
+            self._mock_denoise(samples)
+            return
+        
+        # The real model should take the deadlines and timings into its sampling loop
+        # and return the decoded frames, leaving the muxing to write_video(). With
+        # args.motion_video, its frames replace the reference image's motion frames
+        # as the first clip's conditioning, so the segment continues the previous one.
+        # When offloading, its last step should call self.prefetcher.before_decode()
+        start = time.perf_counter()
+        try:
+            written = try_real_generation_batch(self.model, samples)
+        except Exception as e:
+            for sample in samples:
+                sample["error"] = e
+            return
+        add_timing(samples, 'generate', time.perf_counter() - start)
+        for sample, success in zip(samples, written):
+            sample["rendered"] = {"args": sample["args"], "clips": sample["num_clips"],
+                                  "num_clips": sample["num_clips"], "written": success}
+
+    def _write_segment(self, segment_dir, clip, num_clips, progress=None):
+        """
+        Encode one finished clip as an MPEG-TS segment and announce it, so it can
+        be streamed before the whole video is done. TS segments concatenate into
+        a playable stream, which lets clients append them as they arrive.
+        """
+        path = os.path.join(segment_dir, f"segment_{clip:04d}.ts")
+        # This is where you'd pipe the decoded clip frames through ffmpeg
+        # (-f mpegts) for the real model
+        write_mock_ts_segment(path)
+        notify(progress, type='segment', index=clip, num_clips=num_clips, path=path,
+               format='mpegts', duration_seconds=self.INFER_FRAMES / self.FPS)
+        return path
+
+    def _truncate(self, clips_done, num_clips, progress=None):
+        """Stop after clips_done clips because the deadline cannot fit the rest"""
+        print(f"⏰ Deadline reached, keeping {clips_done}/{num_clips} clips")
+        notify(progress, type='truncated', clips_done=clips_done, num_clips=num_clips)
+        return clips_done
+
+    def _decode_clip(self, clip):
+        """Decode one clip's latents to frames"""
+        if self.model is not None:
+            # This is where you'd run the WAN VAE decoder on the clip latents
+            return self.model.decode_latents(clip)
+        return None
+
+    def _mock_denoise(self, samples):
+        """
+        Step the samples through the denoising schedule of every clip in
+        lockstep, as one batched denoiser would, reporting progress per sample
+        Each deadline is checked before every step and every clip. A sample
+        whose deadline cannot fit the next clip stops there: with allow_partial
+        it keeps its finished clips (fewer than num_clips), otherwise it gets
+        the DeadlineExceeded as its "error". The others carry on.
+        """
+        active = list(samples)
+        clip_seconds = []
+        
+        def stop(sample, clip, error):
+            active.remove(sample)
+            if sample["allow_partial"] and clip > 1 and isinstance(error, DeadlineExceeded):
+                finish(sample, self._truncate(clip - 1, sample["num_clips"], sample["progress"]))
+            else:
+                sample["error"] = error
+        
+        def finish(sample, clips):
+            sample["rendered"] = {"args": sample["args"], "clips": clips,
+                                  "num_clips": sample["num_clips"], "written": None}
+        
+        for clip in range(1, max(sample["num_clips"] for sample in samples) + 1):
+            for sample in list(active):
+                deadline = sample["deadline"]
+                if clip > sample["num_clips"]:
+                    active.remove(sample)
+                    finish(sample, sample["num_clips"])
+                    continue
+                if deadline is None or not clip_seconds:
+                    continue
+                expected = sum(clip_seconds) / len(clip_seconds)
+                if deadline.can_fit(expected):
+                    continue
+                try:
+                    deadline.check('denoise')
+                    if not sample["allow_partial"]:
+                        deadline.miss(f"{deadline.remaining():.1f}s left cannot fit clip {clip}/{sample['num_clips']} "
+                                      f"(~{expected:.1f}s each)")
+                except GenerationCancelled as e:
+                    # An expired deadline still keeps the finished clips with allow_partial
+                    stop(sample, clip, e)
+                    continue
+                active.remove(sample)
+                finish(sample, self._truncate(clip - 1, sample["num_clips"], sample["progress"]))
+            if not active:
+                break
+            
+            clip_start = time.monotonic()
+            for step in range(1, self.SAMPLE_STEPS + 1):
+                for sample in list(active):
+                    if sample["deadline"] is not None:
+                        try:
+                            sample["deadline"].check(f"clip {clip} step {step}")
+                        except GenerationCancelled as e:
+                            stop(sample, clip, e)
+                if not active:
+                    break
+                step_start = time.perf_counter()
+                if self.MOCK_STEP_SECONDS:
+                    time.sleep(self.MOCK_STEP_SECONDS)
+                add_timing(active, 'denoise_step', time.perf_counter() - step_start)
+                for sample in active:
+                    notify(sample["progress"], type='step', clip=clip, num_clips=sample["num_clips"],
+                           step=step, total_steps=self.SAMPLE_STEPS)
+            if not active:
+                break
+            
+            for sample in active:
+                with stage_timer(sample["timings"], 'vae_decode'):
+                    self._decode_clip(clip)
+            clip_seconds.append(time.monotonic() - clip_start)
+            
+            for sample in active:
+                if sample["segment_dir"]:
+                    with stage_timer(sample["timings"], 'encode_segment'):
+                        self._write_segment(sample["segment_dir"], clip, sample["num_clips"], sample["progress"])
+        
+        for sample in active:
+            finish(sample, sample["num_clips"])
+
+    def release_memory(self):
+        """Return cached GPU memory after an aborted job so the next one starts clean"""
+        if self.uses_cuda():
+            with torch.cuda.device(torch.device(self.device)):
+                torch.cuda.empty_cache()
+
+    def generate(self, prompt, image, audio, output, size='512*512', image_digest=None, audio_digest=None,
+                 progress=None, segment_dir=None, deadline=None, allow_partial=False, timings=None,
+                 motion_video=None):
+        """
+        Generate one video; returns True when the output file was written
+        image_digest/audio_digest are SHA-256 hex digests of the inputs, when the
+        caller already has them. progress, when given, is called with a dict for
+        every stage change and denoising step. With segment_dir, every finished
+        clip is also written there as a streamable segment (a 'segment' event).
+        deadline (a Deadline) is checked between steps and clips; when it runs
+        out, GenerationCancelled/DeadlineExceeded is raised, or with
+        allow_partial the finished clips are kept (a 'truncated' event).
+        timings (a metrics.StageTimings) receives the duration of every stage.
+        motion_video holds the last frames of the preceding segment when a long
+        audio is rendered in segments (see long_audio.py).
+        
+        This is preprocess() + render() + write_video(); the pipelined handler
+        calls them separately to overlap the CPU stages with other jobs.
+        """
+        rendered = self.render(prompt, image, audio, output, size, image_digest=image_digest,
+                               audio_digest=audio_digest, progress=progress, segment_dir=segment_dir,
+                               deadline=deadline, allow_partial=allow_partial, timings=timings,
+                               motion_video=motion_video)
+        return self.write_video(rendered, progress=progress, timings=timings)
+
+    def render(self, prompt, image, audio, output, size='512*512', image_digest=None, audio_digest=None,
+               progress=None, segment_dir=None, deadline=None, allow_partial=False, timings=None,
+               prepared=None, motion_video=None):
+        """
+        GPU part of generate(): encoders, denoising and VAE decode. prepared is
+        the result of preprocess(), which is run here when not given. Returns
+        the rendered clips for write_video().
+        """
+        if not self.loaded:
+            self.load()
+        
+        args = self._make_args(prompt, image, audio, output, size, motion_video=motion_video)
+        sample = self._new_sample(args, {"progress": progress, "segment_dir": segment_dir, "deadline": deadline,
+                                         "allow_partial": allow_partial, "timings": timings, "prepared": prepared})
+        
+        try:
+            self._condition(sample, image_digest, audio_digest)
+            self._denoise([sample])
+            if "error" in sample:
+                raise sample["error"]
+            return sample["rendered"]
+        except GenerationCancelled as e:
+            print(f"🛑 Generation stopped: {e}")
+            self.release_memory()
+            raise
+
+    def write_video(self, rendered, progress=None, timings=None):
+        """
+        CPU part of generate(): encode the rendered frames with the driving audio
+        into the output MP4. Returns True when the output file was written.
+        """
+        args = rendered["args"]
+        notify(progress, type='stage', stage='write_video')
+        with stage_timer(timings, 'write_video'):
+            if rendered["written"] is not None:
+                # try_real_generation still writes the file itself
+                success = rendered["written"]
+            else:
+                # This is where you'd pipe the decoded frames and the audio through ffmpeg
+                success = mock_generation(args)
+        return bool(success) and os.path.exists(args.output)
+
+def try_real_generation(model, args, image_latents, audio_features):
+    """
+    Run the real model generation with an already loaded model and the
+    (possibly cached) reference image latents and audio features
+    Falls back to mock generation if generation fails
+    """
+    print("🚀 Running real model generation...")
     
     try:
-        # Try to import and run the actual model
-        # This is where you'd import your actual WAN S2V model code
-        
-        # For now, we'll simulate this
+        # This is where you'd call your actual WAN S2V model
         print("⚠️  Real model not implemented yet, using mock generation")
         return mock_generation(args)
         
@@ -132,6 +833,16 @@ def try_real_generation(args):
         print("🔄 Falling back to mock generation...")
         return mock_generation(args)
 
+def try_real_generation_batch(model, samples):
+    """
+    Run the real model once over a batch of conditioned samples (see
+    S2VPipeline._condition); returns one success flag per sample
+    """
+    # This is where you'd stack the image latents and audio features of the
+    # batch and run the denoiser once; until then each sample runs on its own
+    return [try_real_generation(model, sample["args"], sample["image_latents"], sample["audio_features"])
+            for sample in samples]
+
 def main():
     print("🎥 WAN S2V Video Generation")
     print("=" * 50)
@@ -148,21 +859,26 @@ def main():
     print("")
     
     try:
-        # Setup environment
-        setup_model_environment()
-        
-        # Find model files
-        model_available = find_model_files(args.ckpt_dir)
+        pipeline = S2VPipeline(
+            args.ckpt_dir,
+            task=args.task,
+            offload_model=args.offload_model,
+            convert_model_dtype=args.convert_model_dtype,
+            asset_cache=AssetCache(disk_dir=args.asset_cache_dir),
+            memory_budget=int(args.gpu_memory_gb * 1024 ** 3) if args.gpu_memory_gb else None
+        )
+        pipeline.load()
         
-        # Validate inputs
-        validate_inputs(args)
-        
-        # Generate video
-        if model_available:
-            success = try_real_generation(args)
-        else:
-            print("⚠️  Model files not found, using mock generation")
-            success = mock_generation(args)
+        success = pipeline.generate(
+            prompt=args.prompt,
+            image=args.image,
+            audio=args.audio,
+            output=args.output,
+            size=args.size,
+            deadline=Deadline(args.timeout) if args.timeout else None,
+            allow_partial=args.allow_partial,
+            motion_video=args.motion_video
+        )
         
         if success and os.path.exists(args.output):
             output_size = os.path.getsize(args.output)
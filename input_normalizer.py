@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Client-side normalization of request inputs
+Resamples audio to the 16 kHz mono the model's audio encoder consumes and
+resizes/crops the reference image to the requested resolution before upload,
+so a 48 kHz stereo WAV or a 12-megapixel PNG does not travel (and get decoded)
+only to be thrown away on the worker.
+
+Audio becomes 16-bit PCM WAV, or FLAC when ffmpeg is available; images
+become JPEG. Inputs that are already normalized, or that would get larger,
+are sent unchanged. WAV resampling needs numpy, other audio formats need
+ffmpeg, and images need Pillow.
+"""
+
+import os
+import wave
+import shutil
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+from media_probe import MediaProbeError, probe_audio, probe_image
+
+# Rate of the model's audio feature extractor
+MODEL_SAMPLE_RATE = 16000
+
+JPEG_QUALITY = 90
+
+# Taps of the anti-aliasing filter used when downsampling
+RESAMPLE_TAPS = 127
+
+
+class NormalizationError(ValueError):
+    """Raised when an input cannot be normalized with the tools available"""
+
+
+def parse_resolution(resolution):
+    width, height = (int(v) for v in str(resolution).lower().replace('x', '*').split('*'))
+    return width, height
+
+
+def lowpass_kernel(cutoff, taps=RESAMPLE_TAPS):
+    """Hamming-windowed sinc low-pass; cutoff is a fraction of the input rate"""
+    import numpy as np
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return kernel / kernel.sum()
+
+
+def resample(samples, rate, target_rate):
+    """Resample a mono float signal, low-pass filtering first when downsampling"""
+    import numpy as np
+    if rate == target_rate:
+        return samples
+    if target_rate < rate:
+        # Keep a little below the new Nyquist frequency
+        samples = np.convolve(samples, lowpass_kernel(0.45 * target_rate / rate), mode='same')
+    duration = len(samples) / rate
+    positions = np.arange(int(duration * target_rate)) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def read_pcm_wav(path):
+    """Return (mono float32 samples in [-1, 1], sample rate) of a PCM WAV file"""
+    try:
+        import numpy as np
+    except ImportError:
+        raise NormalizationError("WAV resampling requires numpy (pip install numpy)")
+
+    try:
+        with wave.open(path, 'rb') as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            raw = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise NormalizationError(f"unsupported WAV file: {e}")
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif width == 3:
+        bytes_ = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        ints = (bytes_[:, 0].astype(np.int32) | (bytes_[:, 1].astype(np.int32) << 8)
+                | (bytes_[:, 2].astype(np.int32) << 16))
+        samples = np.where(ints >= 1 << 23, ints - (1 << 24), ints).astype(np.float32) / (1 << 23)
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / (1 << 31)
+    else:
+        raise NormalizationError(f"unsupported WAV sample width {width}")
+
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+
+def write_pcm16_wav(path, samples, rate):
+    import numpy as np
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+
+
+def ffmpeg_convert_audio(src, dst, sample_rate, codec):
+    """Decode anything ffmpeg reads to mono at sample_rate as pcm_s16le WAV or FLAC"""
+    if shutil.which('ffmpeg') is None:
+        raise NormalizationError("converting this audio format requires ffmpeg")
+    command = ['ffmpeg', '-v', 'error', '-y', '-i', src, '-ac', '1', '-ar', str(sample_rate),
+               '-c:a', 'flac' if codec == 'flac' else 'pcm_s16le', dst]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise NormalizationError(f"ffmpeg failed: {result.stderr.strip()[-500:]}")
+
+
+def normalize_audio(src, work_dir, sample_rate=MODEL_SAMPLE_RATE, codec='auto'):
+    """
+    Mono audio at sample_rate in work_dir; returns the path to upload
+    codec is 'wav', 'flac' or 'auto' (FLAC when ffmpeg is available)
+    """
+    try:
+        info = probe_audio(src)
+    except MediaProbeError as e:
+        raise NormalizationError(f"unreadable audio: {e}")
+
+    already_compact = info["format"] in ('wav', 'flac') and info.get("bits_per_sample", 16) <= 16
+    if info["sample_rate"] == sample_rate and info["channels"] == 1 and already_compact:
+        return src
+
+    if codec == 'auto':
+        codec = 'flac' if shutil.which('ffmpeg') else 'wav'
+    dst = os.path.join(work_dir, f"audio.{codec}")
+
+    if codec == 'wav' and info["format"] == 'wav' and info["codec"] == 'pcm':
+        samples, rate = read_pcm_wav(src)
+        write_pcm16_wav(dst, resample(samples, rate, sample_rate), sample_rate)
+    else:
+        ffmpeg_convert_audio(src, dst, sample_rate, codec)
+
+    # e.g. a low-bitrate MP3 is already smaller than the same audio as 16-bit PCM
+    if os.path.getsize(dst) >= os.path.getsize(src):
+        return src
+    return dst
+
+
+def normalize_image(src, work_dir, resolution, quality=JPEG_QUALITY):
+    """
+    JPEG of exactly resolution in work_dir, scaled to cover it and
+    center-cropped; returns the path to upload
+    """
+    width, height = parse_resolution(resolution)
+    try:
+        info = probe_image(src)
+    except MediaProbeError as e:
+        raise NormalizationError(f"unreadable image: {e}")
+    if info["format"] == 'jpeg' and (info["width"], info["height"]) == (width, height):
+        return src
+
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise NormalizationError("image normalization requires Pillow (pip install Pillow)")
+
+    with Image.open(src) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # Flatten transparency onto white rather than black
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS, centering=(0.5, 0.5))
+        dst = os.path.join(work_dir, 'image.jpg')
+        image.save(dst, 'JPEG', quality=quality, optimize=True)
+    return dst
+
+
+def normalize_inputs(audio_file, image_file, resolution, work_dir, sample_rate=MODEL_SAMPLE_RATE,
+                     audio_codec='auto', jpeg_quality=JPEG_QUALITY):
+    """
+    Return the (audio path, image path) to upload, normalized into work_dir
+    where possible. An input that cannot be normalized is sent unchanged
+    (the worker still accepts it).
+    """
+    try:
+        audio = normalize_audio(audio_file, work_dir, sample_rate, audio_codec)
+    except NormalizationError as e:
+        print(f"⚠️ Sending audio unchanged: {e}")
+        audio = audio_file
+    try:
+        image = normalize_image(image_file, work_dir, resolution, jpeg_quality)
+    except NormalizationError as e:
+        print(f"⚠️ Sending image unchanged: {e}")
+        image = image_file
+
+    before = os.path.getsize(audio_file) + os.path.getsize(image_file)
+    after = os.path.getsize(audio) + os.path.getsize(image)
+    if after < before:
+        print(f"🗜️ Normalized inputs: {before / 1024:.0f} KB -> {after / 1024:.0f} KB")
+    return audio, image
+
+
+@contextmanager
+def normalized_inputs(audio_file, image_file, resolution, **options):
+    """normalize_inputs in a temporary directory that is removed on exit"""
+    work_dir = tempfile.mkdtemp(prefix='wan_normalize_')
+    try:
+        yield normalize_inputs(audio_file, image_file, resolution, work_dir, **options)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+
+"""
+Load generator for the RunPod endpoint
+Drives the endpoint through RunPodClient in closed-loop mode (N concurrent
+users, each sending its next request when the previous one finishes) or
+open-loop mode (Poisson arrivals at a fixed rate, latency measured from the
+intended send time so a slow endpoint cannot hide its queueing). Jobs go
+through /run plus /status polling or through /runsync.
+
+Reports throughput, RunPod queue delay (delayTime) vs execution time
+(executionTime), and HDR-style latency histograms, overall and per payload
+mix entry. Use it to size max_workers and max_queue_size in runpod.toml.
+
+Usage:
+    python load_test.py --endpoint https://api.runpod.ai/v2/ID --users 4 --requests 40
+    python load_test.py --endpoint http://localhost:8000 --rate 0.5 --duration 600 \\
+        --mix "512*512:5:3,1024*704:30:1" --api runsync
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import base64
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from runpod_client_examples import RunPodClient, TERMINAL_STATUSES, job_output
+from benchmark_handler import make_wav, make_png
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram in the style of HdrHistogram: every power-of-two
+    range is split into 2**sub_bucket_bits linear buckets, so any recorded
+    value is kept to within ~1/2**sub_bucket_bits relative error however
+    wide the range. Values are milliseconds.
+    """
+
+    def __init__(self, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.counts = {}
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        value = max(int(value), 0)
+        if value < self.sub_buckets:
+            return (0, value)
+        exponent = value.bit_length() - self.sub_bucket_bits
+        return (exponent, value >> exponent)
+
+    def _value_at(self, index):
+        exponent, sub = index
+        # Highest value that falls in the bucket
+        return ((sub + 1) << exponent) - 1 if exponent else sub
+
+    def record(self, value_ms):
+        index = self._index(value_ms)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.min = value_ms if self.min is None else min(self.min, value_ms)
+        self.max = value_ms if self.max is None else max(self.max, value_ms)
+
+    def percentile(self, p):
+        if not self.total:
+            return None
+        target = max(1, math.ceil(self.total * p / 100.0))
+        running = 0
+        for index in sorted(self.counts):
+            running += self.counts[index]
+            if running >= target:
+                return min(self._value_at(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "min_ms": self.min,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "p999_ms": self.percentile(99.9),
+            "max_ms": self.max,
+        }
+
+    def distribution(self, ticks_per_half=5):
+        """
+        Percentile distribution in the HdrHistogram .hgrm layout (value,
+        percentile, total count, 1/(1-percentile)), halving the distance to
+        100% at every step
+        """
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>18}"]
+        if not self.total:
+            return "\n".join(lines)
+
+        percentile = 0.0
+        half = 50.0
+        while percentile < 100.0 and half > 1e-4:
+            for _ in range(ticks_per_half):
+                value = self.percentile(percentile) if percentile else self.min
+                count = max(1, math.ceil(self.total * percentile / 100.0))
+                inverse = 1 / (1 - percentile / 100.0)
+                lines.append(f"{value:>12.1f} {percentile / 100.0:>14.6f} {count:>10} {inverse:>18.2f}")
+                percentile += half / ticks_per_half
+            half /= 2
+            if self.total * (100.0 - percentile) / 100.0 < 1:
+                break
+        lines.append(f"{self.max:>12.1f} {1.0:>14.6f} {self.total:>10} {'inf':>18}")
+        return "\n".join(lines)
+
+
+def parse_mix(text):
+    """'512*512:5:3,1024*704:30:1' -> [(resolution, audio seconds, weight), ...]"""
+    mix = []
+    for entry in text.split(','):
+        resolution, audio_seconds, *weight = entry.strip().split(':')
+        mix.append((resolution, float(audio_seconds), float(weight[0]) if weight else 1.0))
+    return mix
+
+
+def build_payloads(mix, prompt, audio_file=None, image_file=None):
+    """
+    Encode one payload per mix entry up front, so the client does not spend
+    its time base64-encoding during the run. Real files are used when given,
+    otherwise synthetic noise audio of the entry's length and an image of
+    the entry's resolution.
+    """
+    payloads = []
+    for resolution, audio_seconds, weight in mix:
+        width, height = (int(v) for v in resolution.replace('x', '*').split('*'))
+        if audio_file:
+            with open(audio_file, 'rb') as f:
+                audio = f.read()
+        else:
+            audio = make_wav(audio_seconds)
+        if image_file:
+            with open(image_file, 'rb') as f:
+                image = f.read()
+        else:
+            image = make_png(width, height)
+
+        payloads.append({
+            "name": f"{resolution}/{audio_seconds:g}s",
+            "weight": weight,
+            "payload": {"input": {
+                "audio_file": base64.b64encode(audio).decode('ascii'),
+                "image_file": base64.b64encode(image).decode('ascii'),
+                "prompt": prompt,
+                "resolution": resolution,
+            }},
+        })
+    return payloads
+
+
+class LoadTest:
+    """Sends requests and collects one record per finished request"""
+
+    def __init__(self, client, payloads, api='run', poll_interval=2.0, request_timeout=None, seed=None):
+        self.client = client
+        self.payloads = payloads
+        self.weights = [p["weight"] for p in payloads]
+        self.api = api
+        self.poll_interval = poll_interval
+        self.request_timeout = request_timeout
+        self.random = random.Random(seed)
+        self.records = []
+        self._lock = threading.Lock()
+
+    def pick_payload(self):
+        with self._lock:
+            return self.random.choices(self.payloads, weights=self.weights)[0]
+
+    def send(self, entry, intended_start=None):
+        """Run one request to completion; latency counts from intended_start when given"""
+        start = time.time()
+        intended_start = intended_start or start
+        try:
+            if self.api == 'runsync':
+                status = self.client.run_payload(entry["payload"], sync=True, timeout=self.request_timeout)
+                # /runsync hands back IN_QUEUE/IN_PROGRESS when the job outlives its wait
+                if status.get("id") and status.get("status") not in TERMINAL_STATUSES:
+                    status = self.client.wait_for_job(status["id"], self.poll_interval, self.request_timeout)
+            else:
+                submitted = self.client.run_payload(entry["payload"], timeout=self.request_timeout)
+                if not submitted.get("id"):
+                    status = submitted
+                else:
+                    status = self.client.wait_for_job(submitted["id"], self.poll_interval, self.request_timeout)
+        except Exception as e:
+            status = {"status": "FAILED", "error": str(e)}
+        end = time.time()
+
+        output = job_output(status)
+        handler_ok = not output.get("error")
+        record = {
+            "mix": entry["name"],
+            "status": status.get("status"),
+            "ok": status.get("status") == "COMPLETED" and handler_ok,
+            "intended_start": intended_start,
+            "start": start,
+            "end": end,
+            "latency_ms": (end - intended_start) * 1000.0,
+            "delay_ms": status.get("delayTime"),
+            "execution_ms": status.get("executionTime"),
+            "error": status.get("error") or output.get("error"),
+        }
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def run_closed_loop(self, users, duration=None, total_requests=None, think_time=0.0):
+        """users threads, each sending its next request as soon as the last one finishes"""
+        stop_at = time.time() + duration if duration else None
+        remaining = [total_requests]
+        counter_lock = threading.Lock()
+
+        def take_ticket():
+            if stop_at is not None and time.time() >= stop_at:
+                return False
+            if total_requests is None:
+                return True
+            with counter_lock:
+                if remaining[0] <= 0:
+                    return False
+                remaining[0] -= 1
+                return True
+
+        def user():
+            while take_ticket():
+                self.send(self.pick_payload())
+                if think_time:
+                    time.sleep(think_time)
+
+        threads = [threading.Thread(target=user, daemon=True) for _ in range(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_open_loop(self, rate, duration=None, total_requests=None, max_in_flight=256):
+        """Poisson arrivals at rate requests/second, whatever the endpoint's latency"""
+        if not duration and not total_requests:
+            raise ValueError("open loop needs --duration or --requests")
+
+        start = time.time()
+        next_arrival = start
+        sent = 0
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            while True:
+                next_arrival += self.random.expovariate(rate)
+                if duration and next_arrival - start >= duration:
+                    break
+                if total_requests and sent >= total_requests:
+                    break
+                delay = next_arrival - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send, self.pick_payload(), next_arrival)
+                sent += 1
+
+
+def report(records, wall_seconds):
+    """Print and return throughput, queue/execution split and latency histograms"""
+    groups = {"all": records}
+    for record in records:
+        groups.setdefault(record["mix"], []).append(record)
+
+    result = {"wall_seconds": round(wall_seconds, 2), "groups": {}}
+    for name, group in groups.items():
+        latency, delay, execution = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        ok = [r for r in group if r["ok"]]
+        for r in ok:
+            latency.record(r["latency_ms"])
+            if r["delay_ms"] is not None:
+                delay.record(r["delay_ms"])
+            if r["execution_ms"] is not None:
+                execution.record(r["execution_ms"])
+
+        statuses = {}
+        for r in group:
+            key = "COMPLETED" if r["ok"] else (r["status"] or "FAILED")
+            statuses[key] = statuses.get(key, 0) + 1
+
+        result["groups"][name] = {
+            "requests": len(group),
+            "completed": len(ok),
+            "statuses": statuses,
+            "throughput_per_second": round(len(ok) / wall_seconds, 4) if wall_seconds else None,
+            "latency": latency.summary(),
+            "queue_delay": delay.summary(),
+            "execution": execution.summary(),
+        }
+
+        print(f"\n📊 {name}: {len(ok)}/{len(group)} completed, "
+              f"{result['groups'][name]['throughput_per_second']} jobs/s, statuses {statuses}")
+        for label, histogram in (("end-to-end", latency), ("queue delay", delay), ("execution", execution)):
+            s = histogram.summary()
+            if not s["count"]:
+                continue
+            print(f"   {label:<12} p50 {s['p50_ms'] / 1000:8.1f}s  p95 {s['p95_ms'] / 1000:8.1f}s  "
+                  f"p99 {s['p99_ms'] / 1000:8.1f}s  max {s['max_ms'] / 1000:8.1f}s")
+        if name == "all" and latency.total:
+            result["latency_distribution"] = latency.distribution()
+
+    errors = {}
+    for r in records:
+        if r["error"]:
+            errors[r["error"][:120]] = errors.get(r["error"][:120], 0) + 1
+    if errors:
+        print("\n⚠️ Errors:")
+        for error, count in sorted(errors.items(), key=lambda item: -item[1]):
+            print(f"   {count:>5} x {error}")
+
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test a WAN S2V RunPod endpoint')
+    parser.add_argument('--endpoint', required=True, help='Endpoint base URL (https://api.runpod.ai/v2/ID)')
+    parser.add_argument('--api-key', default=os.environ.get('RUNPOD_API_KEY'))
+    parser.add_argument('--api', choices=['run', 'runsync'], default='run',
+                        help='/run plus /status polling, or /runsync')
+    parser.add_argument('--users', type=int, help='Closed loop: number of concurrent users')
+    parser.add_argument('--rate', type=float, help='Open loop: Poisson arrival rate (requests/second)')
+    parser.add_argument('--duration', type=float, help='Stop sending after this many seconds')
+    parser.add_argument('--requests', type=int, help='Stop after this many requests')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Closed loop: pause between requests')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Open loop: client thread cap')
+    parser.add_argument('--mix', default='512*512:5:1',
+                        help='resolution:audio_seconds:weight entries, comma separated')
+    parser.add_argument('--audio', help='Use this audio file instead of synthetic audio')
+    parser.add_argument('--image', help='Use this image file instead of a synthetic image')
+    parser.add_argument('--prompt', default='A person speaking')
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    parser.add_argument('--timeout', type=float, default=900.0, help='Per-request client timeout')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help='Write the report and raw records as JSON here')
+    args = parser.parse_args()
+
+    if (args.users is None) == (args.rate is None):
+        parser.error("choose exactly one of --users (closed loop) or --rate (open loop)")
+    if args.users is not None and not args.duration and not args.requests:
+        parser.error("closed loop needs --duration or --requests")
+    return args
+
+
+def main():
+    args = parse_args()
+    client = RunPodClient(args.endpoint, args.api_key)
+
+    print("🔥 WAN S2V load test")
+    print("=" * 50)
+    payloads = build_payloads(parse_mix(args.mix), args.prompt, args.audio, args.image)
+    for entry in payloads:
+        size = len(entry["payload"]["input"]["audio_file"]) + len(entry["payload"]["input"]["image_file"])
+        print(f"📦 {entry['name']}: weight {entry['weight']:g}, {size / 1024 / 1024:.1f} MB base64")
+
+    test = LoadTest(client, payloads, api=args.api, poll_interval=args.poll_interval,
+                    request_timeout=args.timeout, seed=args.seed)
+    start = time.time()
+    if args.users is not None:
+        print(f"👥 Closed loop: {args.users} users via /{args.api}")
+        test.run_closed_loop(args.users, args.duration, args.requests, args.think_time)
+    else:
+        print(f"⏱️ Open loop: {args.rate} req/s (Poisson) via /{args.api}")
+        test.run_open_loop(args.rate, args.duration, args.requests, args.max_in_flight)
+    wall_seconds = time.time() - start
+
+    result = report(test.records, wall_seconds)
+    if "latency_distribution" in result:
+        print("\n📈 End-to-end latency distribution (ms)")
+        print(result["latency_distribution"])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"args": vars(args), **result, "records": test.records}, f, indent=2)
+        print(f"\n💾 Report written to {args.output}")
+
+    return 0 if any(r["ok"] for r in test.records) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+
+"""
+Local stand-in for the RunPod serverless API
+Serves /run, /runsync, /status/{id}, /stream/{id}, /cancel/{id} and /health
+on localhost and runs runpod_handler.handler in N worker processes behind a
+real job queue, honouring max_queue_size, max_retries, max_execution_time
+and request_timeout from runpod.toml. RunPodClient, load_test.py and the
+streaming/cancellation paths can then be measured offline with mock
+generation, including queueing effects.
+
+Usage:
+    python local_runpod_server.py --workers 2
+    python load_test.py --endpoint http://localhost:8000 --users 4 --requests 20
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import signal
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from runpod_config import load_runpod_config, config_value
+
+# How long /runsync holds the request before answering with the job status
+RUNSYNC_WAIT_SECONDS = 90
+
+# Finished jobs kept for /status before the oldest are forgotten
+MAX_FINISHED_JOBS = 10000
+
+
+def worker_main(index, task_queue, control_queue, event_queue, env):
+    """Worker process: warm up like a real worker, then run jobs one at a time"""
+    os.environ.update(env)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import runpod_handler
+
+    runpod_handler.warmup()
+    event_queue.put(("ready", index, None))
+
+    # Cancel requests arrive while the main thread is inside the handler
+    def listen_for_cancel():
+        while True:
+            job_id = control_queue.get()
+            if job_id is None:
+                return
+            runpod_handler.cancel_job(job_id)
+
+    listener = threading.Thread(target=listen_for_cancel, daemon=True)
+    listener.start()
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            control_queue.put(None)
+            listener.join()
+            return
+        job_id, job_input = task
+
+        def emit(item, job_id=job_id):
+            event_queue.put(("stream", job_id, item))
+
+        try:
+            output = runpod_handler.handler(
+                {"id": job_id, "input": job_input},
+                progress=runpod_handler.ProgressTracker(emit)
+            )
+            event_queue.put(("done", job_id, output))
+        except Exception as e:
+            event_queue.put(("crash", job_id, f"{type(e).__name__}: {e}"))
+
+
+class Job:
+    def __init__(self, job_input):
+        self.id = f"local-{uuid.uuid4()}"
+        self.input = job_input
+        self.status = "IN_QUEUE"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.output = None
+        self.error = None
+        self.retries = 0
+        self.stream = []
+        self.done = threading.Event()
+
+    def to_status(self):
+        status = {"id": self.id, "status": self.status}
+        if self.started is not None:
+            status["delayTime"] = int((self.started - self.submitted) * 1000)
+        if self.finished is not None and self.started is not None:
+            status["executionTime"] = int((self.finished - self.started) * 1000)
+        if self.output is not None:
+            status["output"] = self.output
+        if self.error is not None:
+            status["error"] = self.error
+        if self.retries:
+            status["retries"] = self.retries
+        return status
+
+
+class Worker:
+    def __init__(self, index, context, event_queue, env):
+        self.index = index
+        self.task_queue = context.Queue()
+        self.control_queue = context.Queue()
+        self.process = context.Process(
+            target=worker_main,
+            args=(index, self.task_queue, self.control_queue, event_queue, env),
+            name=f"runpod-worker-{index}",
+            daemon=True
+        )
+        self.ready = False
+        self.job = None
+        self.spawned = time.time()
+        self.process.start()
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            self.task_queue.put(None)
+        self.process.join(timeout=10)
+
+
+class LocalEndpoint:
+    """Job queue, worker pool and job bookkeeping behind the HTTP API"""
+
+    def __init__(self, workers=2, max_queue_size=10, max_retries=1, execution_timeout=300,
+                 request_timeout=360, worker_env=None):
+        self.num_workers = workers
+        self.max_queue_size = max_queue_size
+        self.max_retries = max_retries
+        self.execution_timeout = execution_timeout
+        self.request_timeout = request_timeout
+        self.worker_env = worker_env or {}
+
+        self.context = multiprocessing.get_context('spawn')
+        self.event_queue = self.context.Queue()
+        self.jobs = {}
+        self.finished_order = deque()
+        self.pending = deque()
+        self.lock = threading.Condition()
+        self.counters = {"completed": 0, "failed": 0, "cancelled": 0, "timed_out": 0, "retried": 0,
+                         "rejected": 0}
+        self.cold_starts = 0
+        self.workers = []
+        self.running = True
+
+    def start(self):
+        for index in range(self.num_workers):
+            self.workers.append(self._spawn(index))
+        threading.Thread(target=self._collect, name='collector', daemon=True).start()
+        threading.Thread(target=self._dispatch, name='dispatcher', daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        for worker in self.workers:
+            worker.stop()
+
+    def _spawn(self, index):
+        self.cold_starts += 1
+        return Worker(index, self.context, self.event_queue, self.worker_env)
+
+    # API operations
+
+    def submit(self, job_input):
+        """Queue a job; returns it, or None when the queue is full"""
+        with self.lock:
+            if len(self.pending) >= self.max_queue_size:
+                self.counters["rejected"] += 1
+                return None
+            job = Job(job_input)
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self.lock.notify_all()
+        return job
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status == "IN_QUEUE":
+                self.pending.remove(job)
+                self._finish(job, "CANCELLED")
+            elif job.status == "IN_PROGRESS":
+                worker = next((w for w in self.workers if w.job is job), None)
+                if worker is not None:
+                    worker.control_queue.put(job.id)
+                job.status = "CANCELLED"
+            return job
+
+    def take_stream(self, job_id):
+        """Stream events since the last call, like RunPod's /stream"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            items, job.stream = job.stream, []
+            # Report the final state only once every event has been handed out
+            status = job.status if job.done.is_set() else ("IN_PROGRESS" if job.started else "IN_QUEUE")
+            return {"id": job.id, "status": status, "stream": [{"output": item} for item in items]}
+
+    def health(self):
+        with self.lock:
+            running = sum(1 for w in self.workers if w.job is not None)
+            ready = sum(1 for w in self.workers if w.ready)
+            return {
+                "jobs": {
+                    "inQueue": len(self.pending),
+                    "inProgress": running,
+                    **self.counters,
+                },
+                "workers": {
+                    "idle": ready - running,
+                    "running": running,
+                    "initializing": len(self.workers) - ready,
+                    "coldStarts": self.cold_starts,
+                },
+            }
+
+    # Internals
+
+    def _finish(self, job, status, output=None, error=None):
+        """Move a job to a terminal state (caller holds the lock)"""
+        job.status = status
+        job.output = output if output is not None else job.output
+        job.error = error
+        job.finished = time.time()
+        self.counters[{"COMPLETED": "completed", "FAILED": "failed", "CANCELLED": "cancelled",
+                       "TIMED_OUT": "timed_out"}[status]] += 1
+        job.done.set()
+
+        self.finished_order.append(job.id)
+        while len(self.finished_order) > MAX_FINISHED_JOBS:
+            self.jobs.pop(self.finished_order.popleft(), None)
+
+    def _retry_or_fail(self, job, error):
+        if job.retries < self.max_retries:
+            print(f"🔁 Retrying {job.id}: {error}")
+            job.retries += 1
+            job.status = "IN_QUEUE"
+            job.started = None
+            self.counters["retried"] += 1
+            self.pending.appendleft(job)
+            self.lock.notify_all()
+        else:
+            self._finish(job, "FAILED", error=error)
+
+    def _collect(self):
+        """Apply worker messages: ready, stream events, results and crashes"""
+        while self.running:
+            try:
+                kind, key, payload = self.event_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            with self.lock:
+                if kind == "ready":
+                    worker = self.workers[key]
+                    worker.ready = True
+                    print(f"🟢 Worker {key} ready after {time.time() - worker.spawned:.1f}s")
+                    self.lock.notify_all()
+                    continue
+
+                job = self.jobs.get(key)
+                worker = next((w for w in self.workers if w.job is job), None) if job else None
+                if job is None or job.done.is_set():
+                    if worker is not None:
+                        worker.job = None
+                    continue
+
+                if kind == "stream":
+                    job.stream.append(payload)
+                    continue
+
+                if worker is not None:
+                    worker.job = None
+                if kind == "done":
+                    # Same closing event the streaming handler yields on RunPod
+                    if isinstance(payload, dict):
+                        job.stream.append({"type": "result", **payload})
+                    if job.status == "CANCELLED":
+                        self._finish(job, "CANCELLED", output=payload)
+                    # The handler reports failures as {"error": ...}; RunPod marks those FAILED
+                    elif isinstance(payload, dict) and "error" in payload:
+                        if str(payload["error"]).startswith("Internal server error"):
+                            self._retry_or_fail(job, payload["error"])
+                        else:
+                            self._finish(job, "FAILED", output=payload, error=payload["error"])
+                    else:
+                        self._finish(job, "COMPLETED", output=payload)
+                elif kind == "crash":
+                    self._retry_or_fail(job, payload)
+                self.lock.notify_all()
+
+    def _dispatch(self):
+        """Hand queued jobs to idle workers and enforce timeouts and worker health"""
+        while True:
+            with self.lock:
+                if not self.running:
+                    return
+                now = time.time()
+
+                for index, worker in enumerate(self.workers):
+                    if worker.process.is_alive():
+                        continue
+                    # A dead worker takes its job with it, like a crashed pod
+                    if worker.job is not None and not worker.job.done.is_set():
+                        self._retry_or_fail(worker.job, f"worker {index} exited")
+                    print(f"🔄 Restarting worker {index}")
+                    self.workers[index] = self._spawn(index)
+
+                for index, worker in enumerate(self.workers):
+                    job = worker.job
+                    if job is not None and now - job.started > self.execution_timeout:
+                        print(f"⏰ {job.id} exceeded max_execution_time, killing worker {index}")
+                        self._finish(job, "TIMED_OUT", error="max_execution_time exceeded")
+                        worker.stop(kill=True)
+                        self.workers[index] = self._spawn(index)
+
+                for job in list(self.pending):
+                    if now - job.submitted > self.request_timeout:
+                        self.pending.remove(job)
+                        self._finish(job, "TIMED_OUT", error="request_timeout exceeded in queue")
+
+                for worker in self.workers:
+                    if not self.pending:
+                        break
+                    if worker.ready and worker.job is None and worker.process.is_alive():
+                        job = self.pending.popleft()
+                        job.status = "IN_PROGRESS"
+                        job.started = time.time()
+                        worker.job = job
+                        worker.task_queue.put((job.id, job.input))
+
+                self.lock.wait(timeout=0.5)
+
+
+def make_request_handler(endpoint, runsync_wait):
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, code, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _route(self):
+            """Last one or two path segments, so /v2/<endpoint_id>/run works too"""
+            parts = [p for p in self.path.split('?')[0].split('/') if p]
+            if parts and parts[-1] in ("run", "runsync", "health"):
+                return parts[-1], None
+            if len(parts) >= 2 and parts[-2] in ("status", "stream", "cancel"):
+                return parts[-2], parts[-1]
+            return None, None
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                return json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return None
+
+        def do_GET(self):
+            action, job_id = self._route()
+            if action == "health":
+                return self._reply(200, endpoint.health())
+            if action == "status":
+                job = endpoint.jobs.get(job_id)
+                if job is None:
+                    return self._reply(404, {"error": "job not found"})
+                return self._reply(200, job.to_status())
+            if action == "stream":
+                result = endpoint.take_stream(job_id)
+                if result is None:
+                    return self._reply(404, {"error": "job not found"})
+                return self._reply(200, result)
+            self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            action, job_id = self._route()
+            if action in ("run", "runsync"):
+                body = self._read_json()
+                if not isinstance(body, dict) or "input" not in body:
+                    return self._reply(400, {"error": "body must be a JSON object with an input field"})
+                job = endpoint.submit(body["input"])
+                if job is None:
+                    return self._reply(429, {"error": f"queue is full (max_queue_size={endpoint.max_queue_size})"})
+                if action == "runsync":
+                    job.done.wait(timeout=runsync_wait)
+                    return self._reply(200, job.to_status())
+                return self._reply(200, {"id": job.id, "status": job.status})
+            if action == "cancel":
+                job = endpoint.cancel(job_id)
+                if job is None:
+                    return self._reply(404, {"error": "job not found"})
+                return self._reply(200, {"id": job.id, "status": job.status})
+            if action == "stream":
+                return self.do_GET()
+            self._reply(404, {"error": "not found"})
+
+    return RequestHandler
+
+
+def parse_args(argv=None):
+    """Parse the command line; defaults come from --config, or the repo runpod.toml"""
+    # --config is read first so the other defaults can come from that file
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument('--config', help='runpod.toml to read (default: the repo copy)')
+    config = load_runpod_config(config_parser.parse_known_args(argv)[0].config)
+
+    parser = argparse.ArgumentParser(description='Local RunPod serverless API emulator', parents=[config_parser])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=config_value(config, 'server', 'port', 8000))
+    parser.add_argument('--workers', type=int, default=config_value(config, 'scaling', 'max_workers', 1))
+    parser.add_argument('--max-queue-size', type=int,
+                        default=config_value(config, 'queue', 'max_queue_size', 10))
+    parser.add_argument('--max-retries', type=int, default=config_value(config, 'queue', 'max_retries', 1))
+    parser.add_argument('--execution-timeout', type=float,
+                        default=config_value(config, 'timeout', 'max_execution_time', 300))
+    parser.add_argument('--request-timeout', type=float,
+                        default=config_value(config, 'timeout', 'request_timeout', 360))
+    parser.add_argument('--runsync-wait', type=float, default=RUNSYNC_WAIT_SECONDS)
+    parser.add_argument('--step-seconds', type=float, default=None,
+                        help='Sleep per mock denoising step, to emulate GPU time')
+    return parser.parse_args(argv), config
+
+
+def main():
+    args, config = parse_args()
+
+    worker_env = {
+        str(k): str(v) for k, v in config.get('environment', {}).items()
+        if k not in os.environ
+    }
+    worker_env['WAN_JOB_TIMEOUT_SECONDS'] = str(config_value(config, 'timeout', 'handler_timeout', 300))
+    if args.step_seconds is not None:
+        worker_env['WAN_MOCK_STEP_SECONDS'] = str(args.step_seconds)
+
+    endpoint = LocalEndpoint(
+        workers=args.workers,
+        max_queue_size=args.max_queue_size,
+        max_retries=args.max_retries,
+        execution_timeout=args.execution_timeout,
+        request_timeout=args.request_timeout,
+        worker_env=worker_env
+    )
+    endpoint.start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_request_handler(endpoint, args.runsync_wait))
+    server.daemon_threads = True
+    # Stop the workers on SIGTERM too, not only on Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"🚀 Local RunPod endpoint on http://{args.host}:{args.port} "
+          f"({args.workers} workers, queue {args.max_queue_size}, retries {args.max_retries}, "
+          f"timeout {args.execution_timeout:g}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down")
+    finally:
+        server.server_close()
+        endpoint.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,624 @@
+#!/usr/bin/env python3
+"""
+Long-audio generation in overlapping segments
+Audio longer than one job can render within max_execution_time is split
+into segments that each fit the budget, rendered on one or more workers
+(local generate.py processes, RunPod endpoints, or mock workers for
+testing) and crossfaded back into one video over the original audio.
+
+Every segment after the first starts overlap_seconds before its own part of
+the audio. Its predecessor's last overlap_seconds of video are passed in as
+motion conditioning, and the doubly rendered overlap is crossfaded when
+stitching. Segments are grouped into chains. The first segment of a chain
+starts from the reference image alone, and the others wait for their
+predecessor. Chains therefore render in parallel while each chain stays
+continuous. Segment boundaries are moved to the quietest nearby moment when
+the audio is PCM WAV and numpy is installed.
+
+Mock workers write .npy frame arrays instead of videos, so planning,
+dispatch and stitching can be checked on a CPU without ffmpeg or the model.
+
+Usage:
+    python long_audio.py --audio talk.wav --image face.jpg --output talk.mp4 --workers 2
+    python long_audio.py --audio talk.wav --image face.jpg --output talk.mp4 \\
+        --endpoint https://api.runpod.ai/v2/ID --api-key KEY --workers 2
+    python long_audio.py --audio talk.wav --output talk.npy --mock --workers 3 --plan-only
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import wave
+import shutil
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from media_probe import MediaProbeError, probe_audio
+from runpod_config import load_runpod_config, config_value
+
+# Model clip geometry and cost (match S2VPipeline and the handler's preflight cost model)
+MODEL_FPS = 16
+MODEL_INFER_FRAMES = 80
+MODEL_SAMPLE_STEPS = 40
+CLIP_SECONDS = MODEL_INFER_FRAMES / MODEL_FPS
+SECONDS_PER_STEP = 4.0
+
+DEFAULT_OVERLAP_SECONDS = 1.0
+
+# Time kept free in every job for decoding inputs and delivering the result
+JOB_MARGIN_SECONDS = 15.0
+
+# How far a segment boundary may move towards a pause, and the loudness window used to find one
+SNAP_SEARCH_SECONDS = 1.5
+ENVELOPE_WINDOW_SECONDS = 0.05
+
+
+class LongAudioError(RuntimeError):
+    """Raised when a long-audio job cannot be planned, rendered or stitched"""
+
+
+class Segment:
+    """
+    One worker job: audio from start - lead_in to end, conditioned on segment
+    depends_on's tail when that is set
+    """
+
+    def __init__(self, index, chain, start, end, lead_in, depends_on):
+        self.index = index
+        self.chain = chain
+        self.start = start
+        self.end = end
+        self.lead_in = lead_in
+        self.depends_on = depends_on
+
+    @property
+    def audio_start(self):
+        return self.start - self.lead_in
+
+    @property
+    def duration(self):
+        """Seconds of video the segment renders, including the lead-in"""
+        return self.end - self.audio_start
+
+    def to_dict(self):
+        return {"index": self.index, "chain": self.chain, "start": round(self.start, 3),
+                "end": round(self.end, 3), "lead_in": round(self.lead_in, 3),
+                "depends_on": self.depends_on}
+
+
+# Planning
+
+def clip_gpu_seconds(resolution, seconds_per_step=SECONDS_PER_STEP):
+    """Estimated GPU seconds of one model clip at a resolution (scaled from 1024*704)"""
+    width, height = (int(v) for v in str(resolution).lower().replace('x', '*').split('*'))
+    return MODEL_SAMPLE_STEPS * seconds_per_step * (width * height) / (1024 * 704)
+
+
+def segment_seconds_for_budget(budget_seconds, resolution, overlap_seconds=DEFAULT_OVERLAP_SECONDS,
+                               seconds_per_step=SECONDS_PER_STEP):
+    """
+    Longest segment (excluding its lead-in) whose clips fit in budget_seconds
+    of GPU time. Segments are whole model clips, so a job is never billed for
+    a clip it only partly uses.
+    """
+    clips = int(budget_seconds // clip_gpu_seconds(resolution, seconds_per_step))
+    if clips < 1:
+        raise LongAudioError(f"one {CLIP_SECONDS:g}s clip at {resolution} needs "
+                             f"~{clip_gpu_seconds(resolution, seconds_per_step):.0f}s, "
+                             f"more than the {budget_seconds:.0f}s budget")
+    seconds = clips * CLIP_SECONDS - overlap_seconds
+    if seconds <= 0:
+        raise LongAudioError(f"overlap of {overlap_seconds:g}s leaves no room in a {clips}-clip segment")
+    return seconds
+
+
+def audio_envelope(audio_path, window_seconds=ENVELOPE_WINDOW_SECONDS):
+    """
+    (window seconds, RMS loudness per window) of a PCM WAV file, or None when
+    the file is not PCM WAV or numpy is unavailable
+    """
+    try:
+        import numpy as np
+        from input_normalizer import NormalizationError, read_pcm_wav
+    except ImportError:
+        return None
+    try:
+        samples, rate = read_pcm_wav(audio_path)
+    except NormalizationError:
+        return None
+
+    window = max(1, int(rate * window_seconds))
+    usable = len(samples) // window * window
+    if not usable:
+        return None
+    frames = samples[:usable].reshape(-1, window)
+    return window / rate, np.sqrt((frames ** 2).mean(axis=1))
+
+
+def snap_to_pause(boundary, envelope, max_shift):
+    """Move a boundary to the quietest envelope window within max_shift seconds"""
+    if envelope is None or max_shift <= 0:
+        return boundary
+    window, loudness = envelope
+    low = max(0, int((boundary - max_shift) / window))
+    high = min(len(loudness), int((boundary + max_shift) / window) + 1)
+    if high <= low:
+        return boundary
+    # Ties go to the window nearest the planned boundary
+    quietest = min(range(low, high), key=lambda i: (loudness[i], abs((i + 0.5) * window - boundary)))
+    return (quietest + 0.5) * window
+
+
+def plan_segments(duration, segment_seconds, overlap_seconds=DEFAULT_OVERLAP_SECONDS, chains=1,
+                  envelope=None, snap_seconds=SNAP_SEARCH_SECONDS):
+    """
+    Split duration seconds of audio into segments of at most segment_seconds
+    (plus lead-in), grouped into at most chains dependency chains
+    """
+    if duration <= 0:
+        raise LongAudioError("audio has no duration")
+    if segment_seconds <= 0:
+        raise LongAudioError("segment length must be positive")
+
+    count = max(1, math.ceil(duration / segment_seconds))
+    even = duration / count
+    # A boundary may move by up to half the slack, so no segment outgrows segment_seconds
+    max_shift = min(snap_seconds, (segment_seconds - even) / 2)
+    boundaries = [0.0] + [snap_to_pause(duration * i / count, envelope, max_shift)
+                          for i in range(1, count)] + [duration]
+
+    chains = max(1, min(chains, count))
+    # Contiguous chains of near-equal length; a chain starts at each of these segment indices
+    heads = {round(count * c / chains) for c in range(chains)}
+
+    segments = []
+    chain = -1
+    for index in range(count):
+        start, end = boundaries[index], boundaries[index + 1]
+        if index in heads:
+            chain += 1
+        lead_in = min(overlap_seconds, start, end - start)
+        depends_on = None if index in heads else index - 1
+        segments.append(Segment(index, chain, start, end, lead_in, depends_on))
+    return segments
+
+
+# Audio and clip files
+
+def slice_audio(src, start, end, dst):
+    """Write src from start to end seconds to dst as WAV (PCM WAV directly, other formats via ffmpeg)"""
+    try:
+        with wave.open(src, 'rb') as wav:
+            params = wav.getparams()
+            if params.comptype != 'NONE':
+                raise wave.Error("compressed WAV")
+            rate = wav.getframerate()
+            first = int(round(start * rate))
+            wav.setpos(min(first, wav.getnframes()))
+            frames = wav.readframes(int(round(end * rate)) - first)
+        with wave.open(dst, 'wb') as out:
+            out.setparams(params)
+            out.writeframes(frames)
+        return dst
+    except (wave.Error, EOFError):
+        pass
+
+    if shutil.which('ffmpeg') is None:
+        raise LongAudioError("slicing this audio format requires ffmpeg")
+    command = ['ffmpeg', '-v', 'error', '-y', '-ss', f"{start:.3f}", '-t', f"{end - start:.3f}",
+               '-i', src, '-c:a', 'pcm_s16le', dst]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise LongAudioError(f"ffmpeg could not slice the audio: {result.stderr.strip()[-500:]}")
+    return dst
+
+
+def is_frame_file(path):
+    return path.endswith('.npy')
+
+
+def extract_tail(clip_path, seconds, dst, fps=MODEL_FPS):
+    """Write the last seconds of a clip to dst (the next segment's motion conditioning)"""
+    if is_frame_file(clip_path):
+        import numpy as np
+        frames = np.load(clip_path, mmap_mode='r')
+        np.save(dst, np.asarray(frames[-max(1, int(round(seconds * fps))):]))
+        return dst
+
+    if shutil.which('ffmpeg') is None:
+        raise LongAudioError("extracting a clip's tail frames requires ffmpeg")
+    command = ['ffmpeg', '-v', 'error', '-y', '-sseof', f"-{seconds:.3f}", '-i', clip_path,
+               '-an', '-c:v', 'libx264', '-crf', '12', '-preset', 'veryfast', dst]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise LongAudioError(f"ffmpeg could not cut the tail of {clip_path}: {result.stderr.strip()[-500:]}")
+    return dst
+
+
+# Stitching
+
+def crossfade_weights(frames):
+    """Weight of the incoming clip for each of frames overlapped frames, strictly between 0 and 1"""
+    import numpy as np
+    return (np.arange(frames, dtype=np.float32) + 1) / (frames + 1)
+
+
+def stitch_frames(clips, lead_ins, fps=MODEL_FPS):
+    """
+    Join frame arrays (frames, height, width, channels), crossfading each
+    clip's first lead_in seconds with the end of the video so far
+    """
+    import numpy as np
+    parts = [np.asarray(clips[0])]
+    for clip, lead_in in zip(clips[1:], lead_ins[1:]):
+        clip = np.asarray(clip)
+        previous = parts[-1]
+        overlap = min(int(round(lead_in * fps)), len(previous), len(clip))
+        if overlap:
+            weights = crossfade_weights(overlap).reshape(-1, *([1] * (clip.ndim - 1)))
+            blended = previous[-overlap:] * (1 - weights) + clip[:overlap] * weights
+            parts[-1] = previous[:-overlap]
+            parts.append(blended.astype(clip.dtype))
+        parts.append(clip[overlap:])
+    return np.concatenate(parts)
+
+
+def stitch_videos(clip_paths, segments, audio_path, output_path):
+    """Crossfade video clips with ffmpeg's xfade filter and mux the original audio over them"""
+    if shutil.which('ffmpeg') is None:
+        raise LongAudioError("stitching videos requires ffmpeg")
+
+    command = ['ffmpeg', '-v', 'error', '-y']
+    for path in clip_paths:
+        command += ['-i', path]
+    command += ['-i', audio_path]
+
+    filters = []
+    label = '0:v'
+    length = segments[0].duration
+    for i, segment in enumerate(segments[1:], 1):
+        out = f"v{i}"
+        if segment.lead_in > 0:
+            filters.append(f"[{label}][{i}:v]xfade=transition=fade:duration={segment.lead_in:.3f}:"
+                           f"offset={length - segment.lead_in:.3f}[{out}]")
+        else:
+            filters.append(f"[{label}][{i}:v]concat=n=2:v=1:a=0[{out}]")
+        length += segment.duration - segment.lead_in
+        label = out
+
+    if filters:
+        command += ['-filter_complex', ';'.join(filters), '-map', f"[{label}]"]
+    else:
+        command += ['-map', '0:v']
+    command += ['-map', f"{len(clip_paths)}:a", '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac', '-shortest', output_path]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise LongAudioError(f"ffmpeg could not stitch the clips: {result.stderr.strip()[-500:]}")
+    return output_path
+
+
+def stitch(clip_paths, segments, audio_path, output_path):
+    """Stitch rendered segments into output_path (.npy frame files or videos)"""
+    if all(is_frame_file(path) for path in clip_paths):
+        import numpy as np
+        clips = [np.load(path, mmap_mode='r') for path in clip_paths]
+        np.save(output_path, stitch_frames(clips, [s.lead_in for s in segments]))
+        return output_path
+    return stitch_videos(clip_paths, segments, audio_path, output_path)
+
+
+# Workers: callables worker(segment, audio_path, motion_path, output_path) that render one
+# segment into output_path (motion_path is None for the first segment of a chain)
+
+class MockWorker:
+    """
+    Writes a .npy frame array per segment instead of rendering: every frame
+    is filled with the segment index, so stitched output shows where each
+    segment landed and how the overlaps were blended
+    """
+
+    extension = '.npy'
+
+    def __init__(self, name='mock', frame_size=(36, 64), fps=MODEL_FPS, seconds_per_clip=0.0):
+        self.name = name
+        self.frame_size = frame_size
+        self.fps = fps
+        self.seconds_per_clip = seconds_per_clip
+
+    def __call__(self, segment, audio_path, motion_path, output_path):
+        import numpy as np
+        if (motion_path is None) != (segment.depends_on is None):
+            raise LongAudioError(f"segment {segment.index} got the wrong conditioning")
+        frames = int(round(segment.duration * self.fps))
+        time.sleep(self.seconds_per_clip * math.ceil(frames / MODEL_INFER_FRAMES))
+        np.save(output_path, np.full((frames, *self.frame_size, 3), segment.index * 10, dtype=np.float32))
+        return output_path
+
+
+class ProcessWorker:
+    """Runs generate.py in a subprocess, optionally pinned to one GPU"""
+
+    extension = '.mp4'
+
+    def __init__(self, generate_script, ckpt_dir, image, prompt, resolution, device=None,
+                 python=sys.executable, extra_args=()):
+        self.name = f"gpu{device}" if device is not None else 'local'
+        self.generate_script = generate_script
+        self.ckpt_dir = ckpt_dir
+        self.image = image
+        self.prompt = prompt
+        self.resolution = resolution
+        self.device = device
+        self.python = python
+        self.extra_args = list(extra_args)
+
+    def __call__(self, segment, audio_path, motion_path, output_path):
+        command = [self.python, self.generate_script, '--task', 's2v-14B', '--size', self.resolution,
+                   '--ckpt_dir', self.ckpt_dir, '--prompt', self.prompt, '--image', self.image,
+                   '--audio', audio_path, '--output', output_path, *self.extra_args]
+        if motion_path is not None:
+            command += ['--motion_video', motion_path]
+        env = dict(os.environ)
+        if self.device is not None:
+            env['CUDA_VISIBLE_DEVICES'] = str(self.device)
+        result = subprocess.run(command, capture_output=True, text=True, env=env)
+        if result.returncode != 0 or not os.path.exists(output_path):
+            raise LongAudioError(f"generate.py failed on segment {segment.index}: "
+                                 f"{(result.stderr or result.stdout).strip()[-500:]}")
+        return output_path
+
+
+class EndpointWorker:
+    """Renders a segment as one /runsync request to a RunPod endpoint (or the local emulator)"""
+
+    extension = '.mp4'
+
+    def __init__(self, endpoint_url, api_key, image, prompt, resolution, name='endpoint', timeout=None):
+        from runpod_client_examples import RunPodClient
+        self.name = name
+        self.client = RunPodClient(endpoint_url, api_key)
+        self.image = image
+        self.prompt = prompt
+        self.resolution = resolution
+        self.timeout = timeout
+
+    def __call__(self, segment, audio_path, motion_path, output_path):
+        import requests
+        from client_streaming import PayloadBody
+
+        files = {"audio_file": audio_path, "image_file": self.image}
+        if motion_path is not None:
+            files["motion_video"] = motion_path
+        body = PayloadBody(files, {"prompt": self.prompt, "resolution": self.resolution})
+        response = requests.post(f"{self.client.base_url}/runsync", headers=self.client.headers,
+                                 data=body, stream=True, timeout=self.timeout)
+        if response.status_code != 200:
+            raise LongAudioError(f"segment {segment.index}: HTTP {response.status_code}: {response.text[:500]}")
+
+        from runpod_client_examples import job_output
+        result = self.client.read_response(response, output_path)
+        # /runsync wraps the handler response in "output" (a list of events on a streaming worker)
+        output = job_output(result) if "output" in result else result
+        if not output.get("success"):
+            raise LongAudioError(f"segment {segment.index} failed: "
+                                 f"{output.get('error') or result.get('error') or result}")
+        if not self.client.save_video(output, output_path):
+            raise LongAudioError(f"segment {segment.index}: response had no video")
+        return output_path
+
+
+# Dispatch
+
+def render_segment(worker, segment, audio_path, work_dir, condition_on, tail_seconds):
+    """Slice the segment's audio, cut its conditioning tail and render it; returns (path, seconds)"""
+    start = time.perf_counter()
+    name = f"segment_{segment.index:04d}"
+    segment_audio = slice_audio(audio_path, segment.audio_start, segment.end,
+                                os.path.join(work_dir, f"{name}.wav"))
+    motion_path = None
+    if condition_on is not None:
+        motion_path = extract_tail(condition_on, tail_seconds,
+                                   os.path.join(work_dir, f"{name}_motion{worker.extension}"))
+    output = worker(segment, segment_audio, motion_path,
+                    os.path.join(work_dir, f"{name}{worker.extension}"))
+    return output, time.perf_counter() - start
+
+
+def render_segments(segments, audio_path, workers, work_dir, tail_seconds=DEFAULT_OVERLAP_SECONDS,
+                    attempts=2):
+    """
+    Render every segment on the first free worker once its predecessor is
+    done, lowest index first. A failed segment is retried (on whichever
+    worker is free) up to attempts times in total.
+    Returns (clip paths in segment order, per-segment report).
+    """
+    if not workers:
+        raise LongAudioError("no workers")
+
+    clips = {}
+    report = {}
+    failures = {}
+    pending = list(segments)
+    free = list(workers)
+    running = {}
+
+    pool = ThreadPoolExecutor(len(workers), thread_name_prefix='wan-segment')
+    try:
+        while pending or running:
+            for segment in list(pending):
+                if not free:
+                    break
+                if segment.depends_on is not None and segment.depends_on not in clips:
+                    continue
+                worker = free.pop(0)
+                pending.remove(segment)
+                condition_on = clips.get(segment.depends_on)
+                future = pool.submit(render_segment, worker, segment, audio_path, work_dir,
+                                     condition_on, tail_seconds)
+                running[future] = (segment, worker)
+                print(f"🎬 Segment {segment.index + 1}/{len(segments)} "
+                      f"({segment.audio_start:.1f}-{segment.end:.1f}s, chain {segment.chain}) on {worker.name}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                segment, worker = running.pop(future)
+                free.append(worker)
+                try:
+                    clips[segment.index], seconds = future.result()
+                except Exception as e:
+                    failures[segment.index] = failures.get(segment.index, 0) + 1
+                    if failures[segment.index] >= attempts:
+                        raise LongAudioError(f"segment {segment.index} failed {attempts} time(s): {e}")
+                    print(f"⚠️ Segment {segment.index} failed on {worker.name}, retrying: {e}")
+                    pending.append(segment)
+                    pending.sort(key=lambda s: s.index)
+                    continue
+                report[segment.index] = {**segment.to_dict(), "worker": worker.name,
+                                         "seconds": round(seconds, 3),
+                                         "attempts": failures.get(segment.index, 0) + 1}
+                print(f"✅ Segment {segment.index + 1}/{len(segments)} done in {seconds:.1f}s")
+    except BaseException:
+        # Give up without waiting for segments still rendering on other workers
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+    return [clips[s.index] for s in segments], [report[s.index] for s in segments]
+
+
+def generate_long(audio_path, output_path, workers, segment_seconds, overlap_seconds=DEFAULT_OVERLAP_SECONDS,
+                  chains=None, work_dir=None, attempts=2, snap=True):
+    """
+    Plan, render and stitch a long-audio video; returns a report with the plan,
+    per-segment timings and the wall-clock vs summed render time
+    chains defaults to one per worker
+    """
+    try:
+        duration = probe_audio(audio_path)["duration_seconds"]
+    except (MediaProbeError, OSError) as e:
+        raise LongAudioError(f"unreadable audio: {e}")
+
+    # Video clips are cut and stitched with ffmpeg; find out before any GPU time is spent
+    if any(worker.extension != '.npy' for worker in workers) and shutil.which('ffmpeg') is None:
+        raise LongAudioError("stitching video segments requires ffmpeg")
+
+    envelope = audio_envelope(audio_path) if snap else None
+    segments = plan_segments(duration, segment_seconds, overlap_seconds,
+                             chains=chains or len(workers), envelope=envelope)
+    print(f"🗺️ {duration:.1f}s of audio -> {len(segments)} segment(s) in "
+          f"{segments[-1].chain + 1} chain(s) on {len(workers)} worker(s)")
+
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='wan_long_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        start = time.perf_counter()
+        clips, report = render_segments(segments, audio_path, workers, work_dir,
+                                        tail_seconds=overlap_seconds, attempts=attempts)
+        render_seconds = time.perf_counter() - start
+        stitch(clips, segments, audio_path, output_path)
+        wall_seconds = time.perf_counter() - start
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    serial_seconds = sum(item["seconds"] for item in report)
+    print(f"🧵 Stitched {len(clips)} segment(s) into {output_path} in {wall_seconds:.1f}s "
+          f"({serial_seconds:.1f}s of segment work, {serial_seconds / max(render_seconds, 1e-9):.1f}x parallel)")
+    return {
+        "audio_seconds": round(duration, 3),
+        "segments": report,
+        "render_seconds": round(render_seconds, 3),
+        "wall_seconds": round(wall_seconds, 3),
+        "serial_seconds": round(serial_seconds, 3),
+        "output": output_path,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate a video for long audio in overlapping segments')
+    parser.add_argument('--audio', required=True, help='Driving audio (wav, mp3 or flac)')
+    parser.add_argument('--image', help='Reference image (not needed with --mock)')
+    parser.add_argument('--output', required=True, help='Output video (.npy with --mock)')
+    parser.add_argument('--prompt', default='A person speaking')
+    parser.add_argument('--resolution', default='1024*704')
+    parser.add_argument('--workers', type=int, default=1, help='Parallel workers (GPUs, endpoint requests)')
+    parser.add_argument('--chains', type=int, help='Independent chains (default: one per worker; 1 = fully continuous)')
+    parser.add_argument('--segment-seconds', type=float,
+                        help='Audio per segment (default: what fits in max_execution_time from runpod.toml)')
+    parser.add_argument('--overlap-seconds', type=float, default=DEFAULT_OVERLAP_SECONDS,
+                        help='Overlap rendered twice and crossfaded, also the conditioning tail length')
+    parser.add_argument('--seconds-per-step', type=float, default=SECONDS_PER_STEP,
+                        help='GPU seconds per denoising step at 1024*704, for segment sizing')
+    parser.add_argument('--no-snap', action='store_true', help='Do not move boundaries to pauses')
+    parser.add_argument('--attempts', type=int, default=2, help='Tries per segment')
+    parser.add_argument('--endpoint', help='RunPod endpoint base URL (default: local generate.py processes)')
+    parser.add_argument('--api-key', default=os.environ.get('RUNPOD_API_KEY'))
+    parser.add_argument('--generate-script', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                  'generate.py'))
+    parser.add_argument('--ckpt-dir', default='/workspace/wan-s2v-14b/Wan2.2/Wan2.2-S2V-14B/')
+    parser.add_argument('--devices', help='Comma-separated GPU indices for local workers (default: 0..workers-1)')
+    parser.add_argument('--mock', action='store_true', help='Mock workers writing .npy frames (CPU only)')
+    parser.add_argument('--mock-seconds-per-clip', type=float, default=0.0)
+    parser.add_argument('--work-dir', help='Keep segment audio and clips here')
+    parser.add_argument('--plan-only', action='store_true', help='Print the plan and exit')
+    parser.add_argument('--report', help='Write the JSON report here')
+    args = parser.parse_args()
+    if not args.mock and not args.image:
+        parser.error("--image is required unless --mock is given")
+    return args
+
+
+def build_workers(args):
+    if args.mock:
+        return [MockWorker(f"mock{i}", seconds_per_clip=args.mock_seconds_per_clip) for i in range(args.workers)]
+    if args.endpoint:
+        return [EndpointWorker(args.endpoint, args.api_key, args.image, args.prompt, args.resolution,
+                               name=f"endpoint{i}") for i in range(args.workers)]
+    devices = args.devices.split(',') if args.devices else [str(i) for i in range(args.workers)]
+    return [ProcessWorker(args.generate_script, args.ckpt_dir, args.image, args.prompt, args.resolution,
+                          device=device) for device in devices]
+
+
+def main():
+    args = parse_args()
+
+    segment_seconds = args.segment_seconds
+    if segment_seconds is None:
+        config = load_runpod_config()
+        budget = config_value(config, 'timeout', 'max_execution_time', 300) - JOB_MARGIN_SECONDS
+        segment_seconds = segment_seconds_for_budget(budget, args.resolution, args.overlap_seconds,
+                                                     args.seconds_per_step)
+        print(f"⏱️ {budget:.0f}s job budget at {args.resolution} -> {segment_seconds:g}s segments")
+
+    workers = build_workers(args)
+    try:
+        if args.plan_only:
+            duration = probe_audio(args.audio)["duration_seconds"]
+            envelope = None if args.no_snap else audio_envelope(args.audio)
+            segments = plan_segments(duration, segment_seconds, args.overlap_seconds,
+                                     chains=args.chains or len(workers), envelope=envelope)
+            print(json.dumps([s.to_dict() for s in segments], indent=2))
+            return 0
+
+        report = generate_long(args.audio, args.output, workers, segment_seconds, args.overlap_seconds,
+                               chains=args.chains, work_dir=args.work_dir, attempts=args.attempts,
+                               snap=not args.no_snap)
+    except (LongAudioError, MediaProbeError) as e:
+        print(f"❌ {e}")
+        return 1
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
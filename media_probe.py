@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Header-only probing of request media
+Reads just enough of WAV/MP3/FLAC and JPEG/PNG files to get format, sample rate,
+channels, duration and image dimensions, without decoding any samples or pixels
+"""
+
+import os
+import struct
+
+
+class MediaProbeError(ValueError):
+    """Raised when a file is malformed or in an unsupported format"""
+
+
+# MPEG audio Layer III tables
+MP3_BITRATES_KBPS = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],   # MPEG-1
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],       # MPEG-2 / 2.5
+}
+MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+# How far into the file to look for the first MP3 frame (after any ID3 tag)
+MP3_SYNC_SEARCH_BYTES = 64 * 1024
+
+# JPEG start-of-frame markers carry the image dimensions (C4, C8 and CC are not SOF)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise MediaProbeError("file is truncated")
+    return data
+
+
+def unpack_from(fmt, data, offset=0):
+    """struct.unpack_from that reports a short buffer as a truncated file"""
+    if offset + struct.calcsize(fmt) > len(data):
+        raise MediaProbeError("file is truncated")
+    return struct.unpack_from(fmt, data, offset)
+
+
+def sniff_format(path):
+    """Identify wav, mp3, flac, jpeg or png from the first bytes, or return None"""
+    with open(path, 'rb') as f:
+        head = f.read(12)
+
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'wav'
+    if head[:4] == b'fLaC':
+        return 'flac'
+    if head[:3] == b'ID3' or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return 'mp3'
+    if head[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    return None
+
+
+def probe_wav(path):
+    """Read the fmt and data chunk headers of a RIFF/WAVE file"""
+    file_size = os.path.getsize(path)
+    fmt = None
+    data_size = None
+
+    with open(path, 'rb') as f:
+        riff = read_exact(f, 12)
+        if riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise MediaProbeError("not a RIFF/WAVE file")
+
+        while fmt is None or data_size is None:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            chunk_id, chunk_size = header[:4], unpack_from('<I', header, 4)[0]
+
+            if chunk_id == b'fmt ':
+                if chunk_size < 16:
+                    raise MediaProbeError("WAV fmt chunk too short")
+                fmt = struct.unpack('<HHIIHH', read_exact(f, 16))
+                f.seek(chunk_size - 16 + (chunk_size & 1), os.SEEK_CUR)
+            elif chunk_id == b'data':
+                data_offset = f.tell()
+                # Streaming writers leave the size at 0 or 0xFFFFFFFF
+                if chunk_size in (0, 0xFFFFFFFF) and file_size > data_offset:
+                    chunk_size = file_size - data_offset
+                data_size = min(chunk_size, file_size - data_offset)
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+    if fmt is None:
+        raise MediaProbeError("WAV file has no fmt chunk")
+    if data_size is None:
+        raise MediaProbeError("WAV file has no data chunk")
+
+    audio_format, channels, sample_rate, byte_rate, block_align, bits = fmt
+    if byte_rate == 0:
+        raise MediaProbeError("WAV header has a zero byte rate")
+
+    return {
+        "format": "wav",
+        "codec": "pcm" if audio_format in (1, 0xFFFE) else f"wav-{audio_format}",
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "bits_per_sample": bits,
+        "duration_seconds": data_size / float(byte_rate),
+        "file_size_bytes": file_size,
+    }
+
+
+def parse_mp3_frame_header(header):
+    """Decode a 4-byte MPEG audio frame header, or return None if it is not one"""
+    b1, b2, b3 = header[1], header[2], header[3]
+    if header[0] != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+
+    version_bits = (b1 >> 3) & 0x3
+    layer_bits = (b1 >> 1) & 0x3
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x3
+
+    if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None  # reserved values, or not Layer III / free format
+
+    version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+    table = 1 if version == 1 else 2
+    return {
+        "version": version,
+        "bitrate": MP3_BITRATES_KBPS[table][bitrate_index] * 1000,
+        "sample_rate": MP3_SAMPLE_RATES[version][rate_index],
+        "channels": 1 if (b3 >> 6) == 3 else 2,
+        "samples_per_frame": 1152 if version == 1 else 576,
+    }
+
+
+def probe_mp3(path):
+    """Read the first MP3 frame header (and Xing/VBRI header, if any) for duration"""
+    file_size = os.path.getsize(path)
+
+    with open(path, 'rb') as f:
+        start = 0
+        head = f.read(10)
+        if head[:3] == b'ID3' and len(head) == 10:
+            size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+            start = 10 + size + (10 if head[5] & 0x10 else 0)
+
+        f.seek(start)
+        window = f.read(MP3_SYNC_SEARCH_BYTES)
+
+    frame = None
+    offset = 0
+    while offset + 4 <= len(window):
+        offset = window.find(b'\xff', offset)
+        if offset == -1 or offset + 4 > len(window):
+            break
+        frame = parse_mp3_frame_header(window[offset:offset + 4])
+        if frame:
+            break
+        offset += 1
+
+    if not frame:
+        raise MediaProbeError("no MPEG Layer III frame found")
+
+    # A Xing/Info or VBRI header in the first frame gives the exact frame count
+    side_info = (32 if frame["channels"] == 2 else 17) if frame["version"] == 1 else \
+        (17 if frame["channels"] == 2 else 9)
+    frames = None
+    xing_at = offset + 4 + side_info
+    if window[xing_at:xing_at + 4] in (b'Xing', b'Info'):
+        flags = unpack_from('>I', window, xing_at + 4)[0]
+        if flags & 0x1:
+            frames = unpack_from('>I', window, xing_at + 8)[0]
+    elif window[offset + 36:offset + 40] == b'VBRI':
+        frames = unpack_from('>I', window, offset + 50)[0]
+
+    if frames:
+        duration = frames * frame["samples_per_frame"] / float(frame["sample_rate"])
+    else:
+        duration = (file_size - start - offset) * 8 / float(frame["bitrate"])
+
+    return {
+        "format": "mp3",
+        "codec": "mp3",
+        "sample_rate": frame["sample_rate"],
+        "channels": frame["channels"],
+        "bitrate": frame["bitrate"],
+        "duration_seconds": duration,
+        "file_size_bytes": file_size,
+    }
+
+
+def probe_flac(path):
+    """Read the STREAMINFO block that starts every FLAC stream"""
+    with open(path, 'rb') as f:
+        header = read_exact(f, 8)
+        if header[:4] != b'fLaC':
+            raise MediaProbeError("not a FLAC file")
+        if header[4] & 0x7F != 0:
+            raise MediaProbeError("FLAC stream does not start with STREAMINFO")
+        info = read_exact(f, 34)
+
+    # 20 bits sample rate, 3 bits channels - 1, 5 bits bits per sample - 1, 36 bits total samples
+    packed = int.from_bytes(info[10:18], 'big')
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    bits = ((packed >> 36) & 0x1F) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    if sample_rate == 0:
+        raise MediaProbeError("FLAC STREAMINFO has no sample rate")
+
+    return {
+        "format": "flac",
+        "codec": "flac",
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "bits_per_sample": bits,
+        "duration_seconds": total_samples / float(sample_rate),
+        "file_size_bytes": os.path.getsize(path),
+    }
+
+
+def probe_jpeg(path):
+    """Walk JPEG marker segments up to the start-of-frame for the dimensions"""
+    with open(path, 'rb') as f:
+        if read_exact(f, 2) != b'\xff\xd8':
+            raise MediaProbeError("not a JPEG file")
+
+        while True:
+            byte = read_exact(f, 1)
+            if byte != b'\xff':
+                raise MediaProbeError("corrupt JPEG marker")
+            marker = read_exact(f, 1)[0]
+            while marker == 0xFF:  # fill bytes
+                marker = read_exact(f, 1)[0]
+
+            if marker in (0x01,) or 0xD0 <= marker <= 0xD7:
+                continue  # markers without a length
+            if marker in (0xD9, 0xDA):
+                raise MediaProbeError("JPEG has no frame header before image data")
+
+            length = struct.unpack('>H', read_exact(f, 2))[0]
+            if length < 2:
+                raise MediaProbeError("corrupt JPEG segment length")
+
+            if marker in JPEG_SOF_MARKERS:
+                precision, height, width, components = struct.unpack('>BHHB', read_exact(f, 6))
+                return {
+                    "format": "jpeg",
+                    "width": width,
+                    "height": height,
+                    "components": components,
+                    "progressive": marker in (0xC2, 0xC6, 0xCA, 0xCE),
+                    "file_size_bytes": os.path.getsize(path),
+                }
+
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def probe_png(path):
+    """Read the PNG IHDR chunk for the dimensions"""
+    with open(path, 'rb') as f:
+        header = read_exact(f, 24)
+
+    if header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+        raise MediaProbeError("not a PNG file")
+
+    width, height = unpack_from('>II', header, 16)
+    return {
+        "format": "png",
+        "width": width,
+        "height": height,
+        "file_size_bytes": os.path.getsize(path),
+    }
+
+
+AUDIO_PROBES = {'wav': probe_wav, 'mp3': probe_mp3, 'flac': probe_flac}
+IMAGE_PROBES = {'jpeg': probe_jpeg, 'png': probe_png}
+
+
+def run_probe(probe, path):
+    """Run one probe; any parse failure on malformed bytes becomes a MediaProbeError"""
+    try:
+        return probe(path)
+    except (struct.error, IndexError, KeyError) as e:
+        raise MediaProbeError(f"malformed header: {e}")
+
+
+def probe_audio(path):
+    """Probe an audio file's headers; raises MediaProbeError if unsupported or malformed"""
+    kind = sniff_format(path)
+    if kind not in AUDIO_PROBES:
+        raise MediaProbeError(f"unsupported audio format (expected {', '.join(AUDIO_PROBES)})")
+    return run_probe(AUDIO_PROBES[kind], path)
+
+
+def probe_image(path):
+    """Probe an image file's headers; raises MediaProbeError if unsupported or malformed"""
+    kind = sniff_format(path)
+    if kind not in IMAGE_PROBES:
+        raise MediaProbeError(f"unsupported image format (expected {', '.join(IMAGE_PROBES)})")
+    return run_probe(IMAGE_PROBES[kind], path)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Per-stage latency metrics
+StageTimings records how long each stage of one job took (a stage may run
+many times, e.g. one denoising step per call); MetricsRegistry aggregates
+jobs into histograms and exports them as Prometheus text and JSON-lines
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Histogram bucket upper bounds (seconds), from single steps up to whole jobs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_NULL_CONTEXT = nullcontext()
+
+
+class StageTimings:
+    """Wall-clock durations of the stages of one job"""
+
+    enabled = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # stage -> list of durations, in first-seen order
+        self.samples = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        """Response form: seconds per stage, plus call counts of repeated stages"""
+        result = {
+            "stages": {name: round(sum(values), 4) for name, values in self.samples.items()},
+            "total_seconds": round(self.total(), 4),
+        }
+        counts = {name: len(values) for name, values in self.samples.items() if len(values) > 1}
+        if counts:
+            result["counts"] = counts
+        return result
+
+
+class NullTimings:
+    """Stand-in used when metrics are disabled; every call is a no-op"""
+
+    enabled = False
+    samples = {}
+
+    def stage(self, name):
+        return _NULL_CONTEXT
+
+    def add(self, name, seconds):
+        pass
+
+    def as_dict(self):
+        return None
+
+
+NULL_TIMINGS = NullTimings()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            yield bound, running
+
+
+class MetricsRegistry:
+    """
+    Aggregates StageTimings across jobs. When jsonl_path is set, every job is
+    appended there as one JSON line; when prometheus_path is set, the
+    Prometheus text exposition is rewritten there after every job (for a
+    node-exporter textfile collector or a scraper on the volume).
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None, buckets=DEFAULT_BUCKETS):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.buckets = buckets
+        self.stage_histograms = {}
+        self.job_histogram = Histogram(buckets)
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def record(self, timings, status='success', labels=None):
+        """Fold one finished job into the aggregates and write the exports"""
+        if not timings.enabled:
+            return
+        total = timings.total()
+
+        with self._lock:
+            for name, values in timings.samples.items():
+                histogram = self.stage_histograms.get(name)
+                if histogram is None:
+                    histogram = self.stage_histograms[name] = Histogram(self.buckets)
+                for value in values:
+                    histogram.observe(value)
+            self.job_histogram.observe(total)
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+            text = self.prometheus_text() if self.prometheus_path else None
+
+        if self.jsonl_path:
+            record = {"time": time.time(), "status": status, **(labels or {}), **timings.as_dict()}
+            self._append_jsonl(record)
+        if text is not None:
+            self._write_atomic(self.prometheus_path, text)
+
+    def prometheus_text(self):
+        """Prometheus text exposition format of all aggregates"""
+        lines = [
+            "# HELP wan_jobs_total Jobs handled by this worker, by outcome",
+            "# TYPE wan_jobs_total counter",
+        ]
+        for status, count in sorted(self.jobs.items()):
+            lines.append(f'wan_jobs_total{{status="{status}"}} {count}')
+
+        lines += [
+            "# HELP wan_job_duration_seconds End-to-end handler time per job",
+            "# TYPE wan_job_duration_seconds histogram",
+        ]
+        lines += self._histogram_lines('wan_job_duration_seconds', '', self.job_histogram)
+
+        lines += [
+            "# HELP wan_stage_duration_seconds Time per stage call (denoising steps are observed one by one)",
+            "# TYPE wan_stage_duration_seconds histogram",
+        ]
+        for name in sorted(self.stage_histograms):
+            lines += self._histogram_lines('wan_stage_duration_seconds', f'stage="{name}",',
+                                           self.stage_histograms[name])
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _histogram_lines(metric, labels, histogram):
+        lines = [f'{metric}_bucket{{{labels}le="{bound}"}} {count}' for bound, count in histogram.cumulative()]
+        lines.append(f'{metric}_bucket{{{labels}le="+Inf"}} {histogram.count}')
+        label_set = f'{{{labels.rstrip(",")}}}' if labels else ''
+        lines.append(f'{metric}_sum{label_set} {histogram.sum:.6f}')
+        lines.append(f'{metric}_count{label_set} {histogram.count}')
+        return lines
+
+    def _append_jsonl(self, record):
+        try:
+            with open(self.jsonl_path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not write metrics to {self.jsonl_path}: {e}")
+
+    def _write_atomic(self, path, text):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not write metrics to {path}: {e}")
+
+
+def stage_timer(timings, name):
+    """timings.stage(name), or a no-op context when timings is None"""
+    return timings.stage(name) if timings is not None else _NULL_CONTEXT
@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+Memory-budget offload planning
+Decides which modules stay on the GPU and which are streamed in from host
+memory, from the device's memory budget, the host RAM limit, the module
+weight sizes in the checkpoint manifest and the activation memory of the
+resolution. Modules used on every denoising step (the DiT blocks) are the
+last to be offloaded and the encoders, used once per job, the first, so a
+card with room for the whole model moves nothing over PCIe and a smaller
+one only moves what it must. Plans are cached per (device, resolution).
+
+Offloaded modules are streamed by a Prefetcher: while one runs, the module
+that runs next (the next encoder, the next step's first offloaded DiT block
+after the last one, the VAE before the decode) is copied on a side CUDA
+stream, so transfers overlap compute.
+
+Usage (a simulated budget, no GPU needed):
+    python offload_planner.py /workspace/wan-s2v-14b/Wan2.2/Wan2.2-S2V-14B --gpu-memory-gb 24 --size 1024*704
+"""
+
+import os
+import re
+import sys
+import argparse
+import threading
+
+try:
+    import torch
+except ImportError:  # planning works without torch
+    torch = None
+
+from checkpoint_manifest import get_manifest
+
+GB = 1024 ** 3
+
+# Uses of each component's weights per clip (the DiT runs every step, twice with
+# classifier-free guidance; the VAE encodes the reference and decodes the clip)
+COMPONENT_USES = {'dit': 40 * 2, 'vae': 2, 'text_encoder': 1, 'audio_encoder': 1}
+
+# Order the components run in; the DiT then repeats every step and the VAE decodes
+EXECUTION_ORDER = ('text_encoder', 'audio_encoder', 'vae', 'dit')
+
+# Device memory kept free for the CUDA context and allocator fragmentation
+RESERVE_FRACTION = 0.05
+MIN_RESERVE_BYTES = 1 * GB
+
+# At most this share of host RAM is pinned; pinned pages cannot be swapped and
+# pinning too much starves the rest of the system
+MAX_PINNED_FRACTION = 0.6
+
+# Host-to-device bandwidth, for the transfer estimates in plans
+PCIE_BYTES_PER_SECOND = float(os.environ.get('WAN_PCIE_GBPS', 20)) * GB
+UNPINNED_SLOWDOWN = 3.0
+
+FLOAT_DTYPES = {'F64', 'F32', 'F16', 'BF16'}
+
+
+class OffloadPlanError(RuntimeError):
+    """Raised when the model cannot run within the memory budget even fully offloaded"""
+
+
+class ModuleSpec:
+    """A unit of placement: its weight bytes, how often a clip uses it and when it runs"""
+
+    def __init__(self, name, component, weight_bytes, order):
+        self.name = name
+        self.component = component
+        self.weight_bytes = weight_bytes
+        self.order = order
+
+    @property
+    def uses(self):
+        return COMPONENT_USES.get(self.component, 1)
+
+    def __repr__(self):
+        return f"ModuleSpec({self.name}, {self.weight_bytes / GB:.2f} GB)"
+
+
+def component_of(shard_path):
+    """The model component a checkpoint file belongs to"""
+    name = shard_path.lower()
+    if 't5' in name:
+        return 'text_encoder'
+    if 'vae' in name:
+        return 'vae'
+    if 'wav2vec' in name or 'audio' in name:
+        return 'audio_encoder'
+    return 'dit'
+
+
+def module_of(component, tensor_name):
+    """'dit.blocks.12' for a DiT block tensor, the component itself otherwise"""
+    if component != 'dit':
+        return component
+    match = re.match(r'(blocks\.\d+)\.', tensor_name)
+    return f"dit.{match.group(1) if match else tensor_name.split('.')[0]}"
+
+
+def _block_index(name):
+    match = re.search(r'blocks\.(\d+)$', name)
+    return int(match.group(1)) if match else None
+
+
+def module_specs(manifest, dtype_bytes=None):
+    """
+    ModuleSpecs from the manifest's tensor table, grouped by module prefix;
+    files without a tensor table (.pth, .bin) count as one module each.
+    dtype_bytes sizes floating-point tensors as converted (2 for bfloat16).
+    """
+    sizes = {}
+    for name, info in manifest["tensors"].items():
+        if "bytes" not in info:
+            continue
+        size = info["bytes"]
+        if dtype_bytes and info.get("dtype") in FLOAT_DTYPES:
+            count = 1
+            for dim in info["shape"]:
+                count *= dim
+            size = count * dtype_bytes
+        module = module_of(component_of(info["shard"]), name)
+        sizes[module] = sizes.get(module, 0) + size
+
+    for shard in manifest["shards"]:
+        if not shard.get("tensor_count"):
+            component = component_of(shard["path"])
+            sizes[component] = sizes.get(component, 0) + shard["size"]
+
+    def sort_key(name):
+        # DiT embeddings run before the blocks and the head after them
+        position = _block_index(name)
+        if position is None:
+            position = len(sizes) if name.endswith('.head') else -1
+        return EXECUTION_ORDER.index(name.split('.')[0]), position, name
+
+    return [ModuleSpec(name, name.split('.')[0], sizes[name], order)
+            for order, name in enumerate(sorted(sizes, key=sort_key))]
+
+
+def host_memory_limit():
+    """WAN_HOST_MEMORY_GB, else MemAvailable from /proc/meminfo, else None (unknown)"""
+    override = os.environ.get('WAN_HOST_MEMORY_GB')
+    if override:
+        return int(float(override) * GB)
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class OffloadPlan:
+    """Where each module lives for one (device, resolution)"""
+
+    def __init__(self, device, size, budget_bytes, activation_bytes, reserve_bytes,
+                 resident, offloaded, pinned):
+        self.device = device
+        self.size = size
+        self.budget_bytes = budget_bytes
+        self.activation_bytes = activation_bytes
+        self.reserve_bytes = reserve_bytes
+        self.resident = resident
+        self.offloaded = offloaded
+        self.pinned = pinned
+
+    @property
+    def prefetch_order(self):
+        """Offloaded module names in the order they run (the DiT part repeats every step)"""
+        return [module.name for module in sorted(self.offloaded, key=lambda m: m.order)]
+
+    @property
+    def resident_bytes(self):
+        return sum(module.weight_bytes for module in self.resident)
+
+    @property
+    def offloaded_bytes(self):
+        return sum(module.weight_bytes for module in self.offloaded)
+
+    @property
+    def peak_bytes(self):
+        return peak_bytes(self.resident, self.offloaded, self.activation_bytes)
+
+    def transfer_bytes_per_clip(self):
+        return sum(module.weight_bytes * module.uses for module in self.offloaded)
+
+    def transfer_seconds_per_clip(self):
+        bandwidth = PCIE_BYTES_PER_SECOND / (1.0 if self.pinned else UNPINNED_SLOWDOWN)
+        return self.transfer_bytes_per_clip() / bandwidth
+
+    def to_dict(self):
+        return {
+            "device": self.device,
+            "size": self.size,
+            "budget_gb": round(self.budget_bytes / GB, 2),
+            "activation_gb": {component: round(value / GB, 2) for component, value in self.activation_bytes.items()},
+            "reserve_gb": round(self.reserve_bytes / GB, 2),
+            "resident_gb": round(self.resident_bytes / GB, 2),
+            "peak_gb": round(self.peak_bytes / GB, 2),
+            "offloaded_gb": round(self.offloaded_bytes / GB, 2),
+            "resident": [module.name for module in sorted(self.resident, key=lambda m: m.order)],
+            "offloaded": self.prefetch_order,
+            "pinned": self.pinned,
+            "transfer_gb_per_clip": round(self.transfer_bytes_per_clip() / GB, 2),
+            "transfer_seconds_per_clip": round(self.transfer_seconds_per_clip(), 2),
+        }
+
+    def summary(self):
+        return (f"{len(self.resident)} resident ({self.resident_bytes / GB:.1f} GB), "
+                f"{len(self.offloaded)} offloaded ({self.offloaded_bytes / GB:.1f} GB, "
+                f"~{self.transfer_seconds_per_clip():.1f}s PCIe per clip)")
+
+
+def successor(offloaded, name, decoding=False):
+    """
+    The offloaded module to prefetch while name runs, following how a job
+    runs: the encoders once, then the DiT blocks for every step (the last
+    offloaded block is followed by the first one of the next step), then the
+    VAE decode, which ends the job. None when nothing should be prefetched.
+    """
+    streamed = sorted(offloaded, key=lambda m: m.order)
+    dit = [module for module in streamed if module.component == 'dit']
+    module = next(module for module in streamed if module.name == name)
+    if module.component == 'dit':
+        return dit[(dit.index(module) + 1) % len(dit)]
+    if decoding:
+        return None
+    later = [other for other in streamed if other.component != 'dit' and other.order > module.order]
+    if later:
+        return later[0]
+    return dit[0] if dit else None
+
+
+def peak_bytes(resident, offloaded, activation_bytes):
+    """
+    Peak device memory over a job: the resident weights plus, while each
+    offloaded module runs, its weights, its successor's (being prefetched)
+    and the activations of its component. During the last step the VAE is
+    prefetched for the decode instead of the next step's first block.
+    """
+    base = sum(module.weight_bytes for module in resident)
+    peak = base + max(activation_bytes.values(), default=0)
+    for module in offloaded:
+        following = successor(offloaded, module.name)
+        prefetched = following.weight_bytes if following is not None and following is not module else 0
+        peak = max(peak, base + module.weight_bytes + prefetched + activation_bytes.get(module.component, 0))
+
+    vae = [module for module in offloaded if module.component == 'vae']
+    if vae:
+        largest_block = max((m.weight_bytes for m in offloaded if m.component == 'dit'), default=0)
+        peak = max(peak, base + largest_block + vae[0].weight_bytes + activation_bytes.get('dit', 0))
+    return peak
+
+
+class OffloadPlanner:
+    """
+    Plan module placement for modules (ModuleSpecs). mode 'auto' fits the
+    budget; True offloads every module and False keeps every module resident,
+    as the old --offload_model flag did. Plans are cached per (device, size).
+    """
+
+    def __init__(self, modules, mode='auto', host_limit_bytes=None):
+        self.modules = list(modules)
+        self.mode = mode
+        self.host_limit_bytes = host_limit_bytes if host_limit_bytes is not None else host_memory_limit()
+        self.plans = {}
+        self.lock = threading.Lock()
+
+    def plan(self, device, size, budget_bytes, activation_bytes, mode=None):
+        """
+        The cached plan for (device, size), made on first use with the given
+        budget; activation_bytes maps components to their peak activation memory.
+        mode overrides the planner's mode for a plan made by this call.
+        """
+        key = (str(device), size)
+        with self.lock:
+            if key not in self.plans:
+                self.plans[key] = self.make_plan(device, size, budget_bytes, activation_bytes, mode)
+                print(f"🧮 Offload plan for {device} at {size}: {self.plans[key].summary()}")
+            return self.plans[key]
+
+    def make_plan(self, device, size, budget_bytes, activation_bytes, mode=None):
+        reserve = max(MIN_RESERVE_BYTES, int(budget_bytes * RESERVE_FRACTION))
+        usable = budget_bytes - reserve
+        mode = self.mode if mode is None else mode
+
+        if mode is False:
+            resident, offloaded = list(self.modules), []
+        elif mode is True:
+            resident, offloaded = [], list(self.modules)
+        else:
+            resident, offloaded = self._fit(usable, activation_bytes)
+
+        peak = peak_bytes(resident, offloaded, activation_bytes)
+        if offloaded and peak > usable:
+            raise OffloadPlanError(
+                f"{device} has {budget_bytes / GB:.1f} GB; {size} needs {peak / GB:.1f} GB "
+                f"at its peak even with every module streamed from the host")
+
+        offloaded_bytes = sum(module.weight_bytes for module in offloaded)
+        pinned = self.host_limit_bytes is None or offloaded_bytes <= self.host_limit_bytes * MAX_PINNED_FRACTION
+        return OffloadPlan(str(device), size, budget_bytes, activation_bytes, reserve,
+                           resident, offloaded, pinned)
+
+    def _fit(self, usable, activation_bytes):
+        """
+        Offload the modules with the fewest uses per clip (largest first) until
+        the peak fits, then take back any offloaded
+        module that still fits, most used first
+        """
+        resident = sorted(self.modules, key=lambda m: (-m.uses, m.weight_bytes))
+        offloaded = []
+
+        def fits():
+            return peak_bytes(resident, offloaded, activation_bytes) <= usable
+
+        while resident and not fits():
+            offloaded.append(resident.pop())
+
+        for module in sorted(offloaded, key=lambda m: (-m.uses, m.weight_bytes)):
+            offloaded.remove(module)
+            resident.append(module)
+            if not fits():
+                resident.remove(module)
+                offloaded.append(module)
+        return resident, offloaded
+
+
+class Prefetcher:
+    """
+    Stream a plan's offloaded modules onto the device around their forward
+    passes. modules maps plan names to torch modules. Host copies of the
+    offloaded weights stay in (pinned) host memory; before a module runs its
+    copy is awaited and its successor's copy started on a side stream, and
+    after it runs its device copy is dropped. The sampling loop calls
+    before_decode() during its last step, so the VAE is copied while the
+    DiT finishes instead of the next step's first block.
+    """
+
+    def __init__(self, modules, device):
+        self.modules = modules
+        self.device = torch.device(device)
+        self.stream = torch.cuda.Stream(self.device) if self.device.type == 'cuda' else None
+        self.plan = None
+        self.host = {}
+        self.inflight = {}
+        self.running = set()
+        self.decoding = False
+        self.hooks = []
+
+    def apply(self, plan):
+        """Move modules to match plan (only those whose placement changed) and hook the offloaded ones"""
+        if plan is self.plan:
+            return
+        for hook in self.hooks:
+            hook.remove()
+        self.hooks = []
+        self.inflight = {}
+        self.decoding = False
+
+        for spec in plan.resident:
+            module = self.modules.get(spec.name)
+            if module is not None:
+                self._restore(spec.name)
+                module.to(self.device)
+
+        for spec in plan.offloaded:
+            module = self.modules.get(spec.name)
+            if module is None:
+                continue
+            if spec.name not in self.host:
+                module.to('cpu')
+                tensors = list(module.parameters()) + list(module.buffers())
+                if plan.pinned and self.device.type == 'cuda':
+                    for tensor in tensors:
+                        tensor.data = tensor.data.pin_memory()
+                self.host[spec.name] = [(tensor, tensor.data) for tensor in tensors]
+            self.hooks.append(module.register_forward_pre_hook(
+                lambda _module, _inputs, name=spec.name: self._before(name)))
+            self.hooks.append(module.register_forward_hook(
+                lambda _module, _inputs, _output, name=spec.name: self._after(name)))
+
+        self.plan = plan
+
+    def _restore(self, name):
+        for tensor, host_data in self.host.pop(name, []):
+            tensor.data = host_data
+
+    def prefetch(self, name):
+        """Start copying name's weights to the device, without blocking compute"""
+        if name in self.inflight or name not in self.host:
+            return
+        if self.stream is None:
+            self.inflight[name] = ([data.to(self.device) for _, data in self.host[name]], None)
+            return
+        with torch.cuda.stream(self.stream):
+            copies = [data.to(self.device, non_blocking=True) for _, data in self.host[name]]
+            event = torch.cuda.Event()
+            event.record(self.stream)
+        self.inflight[name] = (copies, event)
+
+    def _before(self, name):
+        self.prefetch(name)  # a miss: the copy is on the critical path
+        copies, event = self.inflight[name]
+        if event is not None:
+            torch.cuda.current_stream(self.device).wait_event(event)
+        for (tensor, _), copy in zip(self.host[name], copies):
+            if event is not None:
+                # The copy was made on the side stream but is used (and freed) on this one
+                copy.record_stream(torch.cuda.current_stream(self.device))
+            tensor.data = copy
+
+        self.running.add(name)
+
+        following = self._successor(name)
+        if following is not None and following != name:
+            self.prefetch(following)
+
+    def _after(self, name):
+        for tensor, host_data in self.host[name]:
+            tensor.data = host_data
+        self.inflight.pop(name, None)
+        self.running.discard(name)
+
+        if self.decoding and self.plan.offloaded and name == self._vae_name():
+            self.decoding = False  # the job is done; the next one starts with the encoders
+        elif self._successor(name) == name:
+            self.prefetch(name)  # the only offloaded block: fetch it again for the next step
+
+    def before_decode(self):
+        """Swap the next step's block prefetch for the VAE's, which decodes next"""
+        self.decoding = True
+        for name in list(self.inflight):
+            if name not in self.running and name != self._vae_name():
+                del self.inflight[name]
+        vae = self._vae_name()
+        if vae is not None:
+            self.prefetch(vae)
+
+    def _vae_name(self):
+        return next((spec.name for spec in self.plan.offloaded if spec.component == 'vae'), None)
+
+    def _successor(self, name):
+        following = successor(self.plan.offloaded, name, decoding=self.decoding)
+        if following is None or following.name not in self.modules:
+            return None
+        return following.name
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Show the offload plan of a checkpoint for a memory budget')
+    parser.add_argument('ckpt_dir')
+    parser.add_argument('--gpu-memory-gb', type=float, required=True, help='Device memory budget to plan for')
+    parser.add_argument('--host-memory-gb', type=float, default=None, help='Host RAM limit (default: available)')
+    parser.add_argument('--size', default='1024*704')
+    parser.add_argument('--activation-gb', type=float, default=None,
+                        help='Activation memory of the DiT and VAE (default: the pipeline estimate for --size)')
+    parser.add_argument('--dtype-bytes', type=int, default=2, help='Bytes per weight after conversion')
+    return parser.parse_args()
+
+
+def main():
+    import json
+    args = parse_args()
+    manifest = get_manifest(args.ckpt_dir)
+    if not manifest or not manifest["shards"]:
+        print(f"❌ No model files in {args.ckpt_dir}")
+        return 1
+
+    if args.activation_gb is not None:
+        activation = {'dit': int(args.activation_gb * GB), 'vae': int(args.activation_gb * GB)}
+    else:
+        from generate import S2VPipeline
+        activation = S2VPipeline(args.ckpt_dir).activation_bytes(args.size)
+    host_limit = int(args.host_memory_gb * GB) if args.host_memory_gb is not None else None
+
+    planner = OffloadPlanner(module_specs(manifest, args.dtype_bytes), host_limit_bytes=host_limit)
+    try:
+        plan = planner.plan('simulated', args.size, int(args.gpu_memory_gb * GB), activation)
+    except OffloadPlanError as e:
+        print(f"❌ {e}")
+        return 1
+    print(json.dumps(plan.to_dict(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
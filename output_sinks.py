@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Output sinks for generated videos
+Decide how a finished MP4 gets back to the client: inline base64 in the job
+response, a file on a shared volume, or an upload to S3-compatible storage
+"""
+
+import os
+import base64
+import shutil
+
+# Bytes read per block when base64-encoding (multiple of 3, so blocks concatenate)
+ENCODE_CHUNK_BYTES = 3 * 256 * 1024
+
+# S3 multipart uploads need parts of at least 5 MB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def encode_file_to_base64(file_path, chunk_bytes=ENCODE_CHUNK_BYTES):
+    """Base64-encode a file block by block, without reading it whole first"""
+    parts = []
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            parts.append(base64.b64encode(block).decode('ascii'))
+    return ''.join(parts)
+
+
+class OutputSink:
+    """Base class: deliver(video_path, request_id) returns response fields"""
+
+    name = 'base'
+
+    def deliver(self, video_path, request_id):
+        raise NotImplementedError
+
+
+class InlineBase64Sink(OutputSink):
+    """Return the video inline as video_base64 (the original behaviour)"""
+
+    name = 'inline'
+
+    def deliver(self, video_path, request_id):
+        return {"video_base64": encode_file_to_base64(video_path)}
+
+
+class LocalFileSink(OutputSink):
+    """Move the video to a directory, e.g. a network volume shared with the client"""
+
+    name = 'local'
+
+    def __init__(self, output_dir, url_prefix=None):
+        self.output_dir = output_dir
+        self.url_prefix = url_prefix
+
+    def deliver(self, video_path, request_id):
+        os.makedirs(self.output_dir, exist_ok=True)
+        filename = f"{request_id}.mp4"
+        target = os.path.join(self.output_dir, filename)
+        shutil.move(video_path, target)
+
+        result = {"video_path": target}
+        if self.url_prefix:
+            result["video_url"] = f"{self.url_prefix.rstrip('/')}/{filename}"
+        print(f"💾 Video stored at {target}")
+        return result
+
+
+class S3Sink(OutputSink):
+    """
+    Upload the video to S3-compatible storage with a multipart upload and
+    return a URL. endpoint_url points it at MinIO or any other S3 stand-in;
+    a ready-made boto3-style client can be passed in instead.
+    """
+
+    name = 's3'
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None,
+                 public_url=None, url_expiry=3600, part_size=8 * 1024 * 1024, client=None):
+        if not bucket:
+            raise ValueError("S3 output requires a bucket (set S3_BUCKET)")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.public_url = public_url
+        self.url_expiry = url_expiry
+        self.part_size = max(part_size, MIN_PART_SIZE)
+
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ValueError("S3 output requires boto3 (pip install boto3)")
+            client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+
+    def object_key(self, request_id):
+        filename = f"{request_id}.mp4"
+        return f"{self.prefix}/{filename}" if self.prefix else filename
+
+    def upload(self, video_path, key):
+        """Multipart upload of video_path, reading one part at a time"""
+        upload = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=key, ContentType='video/mp4'
+        )
+        upload_id = upload['UploadId']
+        parts = []
+
+        try:
+            with open(video_path, 'rb') as f:
+                part_number = 1
+                while True:
+                    data = f.read(self.part_size)
+                    if not data and parts:
+                        break
+                    response = self.client.upload_part(
+                        Bucket=self.bucket, Key=key, UploadId=upload_id,
+                        PartNumber=part_number, Body=data
+                    )
+                    parts.append({"ETag": response['ETag'], "PartNumber": part_number})
+                    part_number += 1
+                    if len(data) < self.part_size:
+                        break
+
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        except Exception:
+            # A failed abort must not hide why the upload failed; the bucket's
+            # lifecycle rule has to clean up the parts instead
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            except Exception as e:
+                print(f"⚠️ Could not abort multipart upload {upload_id} of s3://{self.bucket}/{key}: {e}")
+            raise
+
+        return len(parts)
+
+    def url_for(self, key):
+        if self.public_url:
+            return f"{self.public_url.rstrip('/')}/{key}"
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=self.url_expiry
+        )
+
+    def deliver(self, video_path, request_id):
+        key = self.object_key(request_id)
+        part_count = self.upload(video_path, key)
+        print(f"☁️ Uploaded s3://{self.bucket}/{key} in {part_count} part(s)")
+        return {
+            "video_url": self.url_for(key),
+            "video_key": key,
+            "video_bucket": self.bucket
+        }
+
+
+OUTPUT_SINKS = ('inline', 'local', 's3')
+
+
+def get_output_sink(name=None):
+    """
+    Build the sink for a request. name comes from the request's "output_sink"
+    field and defaults to the WAN_OUTPUT_SINK environment variable (inline).
+    """
+    name = (name or os.environ.get('WAN_OUTPUT_SINK', 'inline')).lower()
+
+    if name == 'inline':
+        return InlineBase64Sink()
+
+    if name == 'local':
+        return LocalFileSink(
+            os.environ.get('WAN_OUTPUT_DIR', '/runpod-volume/outputs'),
+            url_prefix=os.environ.get('WAN_OUTPUT_URL_PREFIX')
+        )
+
+    if name == 's3':
+        return S3Sink(
+            os.environ.get('S3_BUCKET'),
+            prefix=os.environ.get('S3_PREFIX', 'wan-s2v'),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+            region=os.environ.get('S3_REGION'),
+            public_url=os.environ.get('S3_PUBLIC_URL'),
+            url_expiry=int(os.environ.get('S3_URL_EXPIRY', 3600)),
+            part_size=int(os.environ.get('S3_PART_SIZE', 8 * 1024 * 1024))
+        )
+
+    raise ValueError(f"Unknown output sink '{name}', expected one of {OUTPUT_SINKS}")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of generated videos
+Identical requests (same decoded audio and image bytes, same generation
+parameters) are answered from disk instead of running the model again
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+
+def cache_key(input_digests, params):
+    """
+    Build the cache key from content digests of the decoded inputs and the
+    generation parameters (any JSON-serialisable dict)
+    """
+    hasher = hashlib.sha256()
+    for name in sorted(input_digests):
+        hasher.update(f"{name}={input_digests[name]};".encode('utf-8'))
+    hasher.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def disk_entries(directory, suffix):
+    """(mtime, size, path) for every file in directory ending in suffix"""
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(suffix):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def evict_lru(entries, max_bytes):
+    """
+    Remove the least recently used (oldest mtime) entries until the rest fit
+    in max_bytes. Returns (files removed, bytes kept).
+    """
+    entries = sorted(entries)
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed, total
+
+
+class ResultCache:
+    """
+    On-disk MP4 cache with size-bounded LRU eviction
+    Recency is tracked with file mtimes, so it survives worker restarts when
+    cache_dir lives on a network volume
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    def get(self, key, dest_path):
+        """Copy the cached video to dest_path; returns True on a hit"""
+        path = self.path_for(key)
+        with self._lock:
+            try:
+                shutil.copyfile(path, dest_path)
+                now = time.time()
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                self.misses += 1
+                return False
+            self.hits += 1
+            return True
+
+    def put(self, key, video_path):
+        """Store a copy of video_path under key, then evict down to max_bytes"""
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(video_path, tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.evict()
+
+    def entries(self):
+        """(mtime, size, path) for every cached video"""
+        return disk_entries(self.cache_dir, '.mp4')
+
+    def evict(self):
+        """Remove least recently used videos until the cache fits in max_bytes"""
+        removed, total = evict_lru(self.entries(), self.max_bytes)
+        if removed:
+            print(f"🧹 Result cache evicted {removed} video(s), {total / (1024*1024):.1f} MB kept")
+        return removed
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -9,8 +9,31 @@ import base64
 import json
 import time
 import os
+import shutil
+from contextlib import nullcontext
 from typing import Optional
 
+from client_streaming import PayloadBody, VideoResponseDecoder, DECODE_CHUNK_BYTES
+
+# Job states after which /status no longer changes
+TERMINAL_STATUSES = {"COMPLETED", "FAILED", "CANCELLED", "TIMED_OUT"}
+
+def job_output(status: dict) -> dict:
+    """
+    The handler response in a /status or /runsync body. A streaming worker
+    (WAN_STREAMING=True, return_aggregate_stream) returns the list of events
+    it yielded; its response is then the final "result" event.
+    """
+    output = status.get("output")
+    if isinstance(output, list):
+        for event in reversed(output):
+            if isinstance(event, dict):
+                event = event.get("output", event)
+            if isinstance(event, dict) and event.get("type") == "result":
+                return event
+        return {}
+    return output if isinstance(output, dict) else {}
+
 class RunPodClient:
     """Client for RunPod Serverless Wan2.2-S2V-14B API"""
     
@@ -24,6 +47,12 @@ class RunPodClient:
             api_key: Your RunPod API key (optional if endpoint is public)
         """
         self.endpoint_url = endpoint_url
+        # https://api.runpod.ai/v2/YOUR_ENDPOINT_ID, for /run, /status, /stream and /cancel
+        self.base_url = endpoint_url.rstrip('/')
+        for suffix in ('/runsync', '/run'):
+            if self.base_url.endswith(suffix):
+                self.base_url = self.base_url[:-len(suffix)]
+                break
         self.headers = {"Content-Type": "application/json"}
         
         if api_key:
@@ -34,49 +63,89 @@ class RunPodClient:
         with open(file_path, 'rb') as file:
             return base64.b64encode(file.read()).decode('utf-8')
     
+    def build_payload(self, audio_file: str, image_file: str, prompt: str, resolution: str,
+                      **options) -> dict:
+        """Build the request payload for the handler (options are extra input fields)"""
+        return {
+            "input": {
+                "audio_file": self.encode_file_to_base64(audio_file),
+                "image_file": self.encode_file_to_base64(image_file),
+                "prompt": prompt,
+                "resolution": resolution,
+                **options
+            }
+        }
+    
+    def payload_body(self, audio_file: str, image_file: str, prompt: str, resolution: str,
+                     **options) -> PayloadBody:
+        """
+        The same payload as build_payload, as a request body that base64-encodes
+        the files block by block while it is sent
+        """
+        return PayloadBody({"audio_file": audio_file, "image_file": image_file},
+                           {"prompt": prompt, "resolution": resolution, **options})
+    
+    def prepare_inputs(self, audio_file: str, image_file: str, resolution: str, normalize: bool = False):
+        """
+        Context manager yielding the (audio, image) paths to upload. With
+        normalize=True the audio is resampled to 16 kHz mono and the image
+        resized/cropped to the resolution first (see input_normalizer).
+        """
+        if normalize:
+            # Only needed for normalize=True, so the client can be copied without it
+            from input_normalizer import normalized_inputs
+            return normalized_inputs(audio_file, image_file, resolution)
+        return nullcontext((audio_file, image_file))
+    
+    def read_response(self, response, output_path: Optional[str] = None) -> dict:
+        """
+        Parse a response opened with stream=True. With output_path, video_base64
+        is decoded straight into that file and replaced by "video_file".
+        """
+        if output_path is None:
+            return response.json()
+        decoder = VideoResponseDecoder(output_path)
+        for chunk in response.iter_content(chunk_size=DECODE_CHUNK_BYTES):
+            decoder.feed(chunk)
+        result = decoder.finish()
+        if decoder.video_done:
+            print(f"💾 Video saved to {output_path} ({decoder.video_bytes / (1024 * 1024):.1f} MB)")
+        return result
+    
     def generate_video(self, 
                       audio_file: str, 
                       image_file: str, 
                       prompt: str = "A person speaking",
-                      resolution: str = "1024*704") -> dict:
+                      resolution: str = "1024*704",
+                      output_path: Optional[str] = None,
+                      normalize: bool = False) -> dict:
         """
         Generate video from audio and image files
         
         Args:
-            audio_file: Path to audio file (wav/mp3)
+            audio_file: Path to audio file (wav/mp3/flac)
             image_file: Path to image file (jpg/jpeg/png)
             prompt: Text prompt for generation
             resolution: Video resolution (e.g., "1024*704")
+            output_path: Decode an inline video straight to this file while the
+                         response arrives (the result then has "video_file")
+            normalize: Resample the audio and resize the image before upload
             
         Returns:
             Dict containing the result
         """
-        print(f"📁 Encoding files...")
-        
-        # Encode files to base64
-        audio_b64 = self.encode_file_to_base64(audio_file)
-        image_b64 = self.encode_file_to_base64(image_file)
-        
         print(f"🚀 Sending request to RunPod...")
         print(f"📝 Prompt: {prompt}")
         print(f"📏 Resolution: {resolution}")
         
-        # Prepare request payload
-        payload = {
-            "input": {
-                "audio_file": audio_b64,
-                "image_file": image_b64,
-                "prompt": prompt,
-                "resolution": resolution
-            }
-        }
-        
-        # Send request
+        # Send request; files are base64-encoded block by block as it is sent
         start_time = time.time()
-        response = requests.post(self.endpoint_url, headers=self.headers, json=payload)
+        with self.prepare_inputs(audio_file, image_file, resolution, normalize) as (audio_file, image_file):
+            payload = self.payload_body(audio_file, image_file, prompt, resolution)
+            response = requests.post(self.endpoint_url, headers=self.headers, data=payload, stream=True)
         
         if response.status_code == 200:
-            result = response.json()
+            result = self.read_response(response, output_path)
             end_time = time.time()
             
             print(f"✅ Request completed in {end_time - start_time:.1f}s")
@@ -86,19 +155,161 @@ class RunPodClient:
             print(f"Response: {response.text}")
             return {"error": f"HTTP {response.status_code}: {response.text}"}
     
+    def submit_job(self,
+                   audio_file: str,
+                   image_file: str,
+                   prompt: str = "A person speaking",
+                   resolution: str = "1024*704",
+                   normalize: bool = False,
+                   **options) -> Optional[str]:
+        """
+        Submit a job to /run without waiting for it; returns the job ID
+        options are extra input fields, e.g. stream_segments=True
+        """
+        with self.prepare_inputs(audio_file, image_file, resolution, normalize) as (audio_file, image_file):
+            payload = self.payload_body(audio_file, image_file, prompt, resolution, **options)
+            response = requests.post(f"{self.base_url}/run", headers=self.headers, data=payload)
+        
+        if response.status_code != 200:
+            print(f"❌ Submit failed: {response.status_code} {response.text}")
+            return None
+        
+        job_id = response.json().get("id")
+        print(f"🚀 Job submitted: {job_id}")
+        return job_id
+    
+    def run_payload(self, payload: dict, sync: bool = False, timeout: Optional[float] = None) -> dict:
+        """
+        POST an already built payload to /run (returns the job ID and status)
+        or, with sync=True, to /runsync (waits for the result)
+        """
+        url = f"{self.base_url}/runsync" if sync else f"{self.base_url}/run"
+        response = requests.post(url, headers=self.headers, json=payload, timeout=timeout)
+        if response.status_code != 200:
+            return {"status": "FAILED", "error": f"HTTP {response.status_code}: {response.text}"}
+        return response.json()
+    
+    def get_status(self, job_id: str, output_path: Optional[str] = None) -> dict:
+        """
+        Fetch the job status from /status; with output_path, an inline video in
+        a finished job is decoded straight into that file
+        """
+        response = requests.get(f"{self.base_url}/status/{job_id}", headers=self.headers,
+                                stream=output_path is not None)
+        return self.read_response(response, output_path)
+    
+    def wait_for_job(self, job_id: str, poll_interval: float = 1.0, timeout: Optional[float] = None,
+                     output_path: Optional[str] = None) -> dict:
+        """
+        Poll /status until the job finishes; returns the last status, which
+        includes delayTime (queue wait) and executionTime in milliseconds.
+        With output_path, an inline video is decoded straight into that file.
+        """
+        start = time.time()
+        while True:
+            status = self.get_status(job_id, output_path=output_path)
+            if status.get("status") in TERMINAL_STATUSES:
+                return status
+            if timeout is not None and time.time() - start > timeout:
+                return {**status, "status": "TIMED_OUT", "error": "client gave up waiting"}
+            time.sleep(poll_interval)
+    
+    def cancel(self, job_id: str) -> dict:
+        """Cancel a queued or running job"""
+        response = requests.post(f"{self.base_url}/cancel/{job_id}", headers=self.headers)
+        print(f"🛑 Cancel requested for {job_id}")
+        return response.json()
+    
+    def stream(self, job_id: str, poll_interval: float = 1.0):
+        """
+        Yield the handler's progress events from /stream as they arrive
+        (requires the worker to run with WAN_STREAMING=True). The last event
+        has type "result" and carries the normal handler response.
+        """
+        while True:
+            response = requests.get(f"{self.base_url}/stream/{job_id}", headers=self.headers)
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}: {response.text}")
+            
+            data = response.json()
+            for item in data.get("stream", []):
+                yield item.get("output", item)
+            
+            if data.get("status") in TERMINAL_STATUSES:
+                return
+            time.sleep(poll_interval)
+    
+    def stream_to_file(self, job_id: str, output_path: str, poll_interval: float = 1.0) -> dict:
+        """
+        Append each streamed clip segment (MPEG-TS) to output_path as soon as it
+        arrives, so the file is playable while later clips are still generating.
+        Needs a job submitted with "stream_segments": true. Returns the final result.
+        """
+        result = {}
+        with open(output_path, 'wb') as f:
+            for event in self.stream(job_id, poll_interval=poll_interval):
+                if event.get("type") == "segment":
+                    f.write(base64.b64decode(event["data"]))
+                    f.flush()
+                    print(f"🎞️ Segment {event['index']}/{event['num_clips']} appended to {output_path}")
+                elif event.get("type") == "result":
+                    result = event
+        return result
+    
     def save_video_from_base64(self, base64_data: str, output_path: str):
         """Save base64 encoded video to file"""
         try:
-            video_data = base64.b64decode(base64_data)
+            # Decode in blocks (a multiple of 4 characters) rather than copying the whole video
+            block = 4 * DECODE_CHUNK_BYTES
             with open(output_path, 'wb') as f:
-                f.write(video_data)
+                for start in range(0, len(base64_data), block):
+                    f.write(base64.b64decode(base64_data[start:start + block]))
             
-            file_size = len(video_data) / (1024 * 1024)  # MB
+            file_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
             print(f"💾 Video saved to {output_path} ({file_size:.1f} MB)")
             return True
         except Exception as e:
             print(f"❌ Failed to save video: {e}")
             return False
+    
+    def download_video(self, video_url: str, output_path: str, chunk_size: int = 1024 * 1024):
+        """Stream a video from a URL (e.g. an S3 presigned URL) to a file"""
+        try:
+            with requests.get(video_url, stream=True, timeout=300) as response:
+                response.raise_for_status()
+                with open(output_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+            
+            file_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
+            print(f"💾 Video downloaded to {output_path} ({file_size:.1f} MB)")
+            return True
+        except Exception as e:
+            print(f"❌ Failed to download video: {e}")
+            return False
+    
+    def save_video(self, result: dict, output_path: str):
+        """
+        Save the video from a handler result, whichever output sink produced it:
+        video_base64 (inline), video_url (object storage) or video_path (shared volume).
+        A video already decoded by read_response ("video_file") is moved into place.
+        """
+        if "video_file" in result and os.path.exists(result["video_file"]):
+            if os.path.abspath(result["video_file"]) != os.path.abspath(output_path):
+                shutil.move(result["video_file"], output_path)
+            print(f"💾 Video saved to {output_path}")
+            return True
+        if "video_base64" in result:
+            return self.save_video_from_base64(result["video_base64"], output_path)
+        if "video_url" in result:
+            return self.download_video(result["video_url"], output_path)
+        if "video_path" in result and os.path.exists(result["video_path"]):
+            shutil.copyfile(result["video_path"], output_path)
+            print(f"💾 Video copied to {output_path}")
+            return True
+        
+        print("❌ Result contains no video")
+        return False
 
 
 # Example usage functions
@@ -140,9 +351,8 @@ def example_basic_generation():
         print(f"💾 File size: {result.get('file_size_bytes', 0) / (1024*1024):.1f} MB")
         
         # Save the video
-        if "video_base64" in result:
-            output_file = f"generated_video_{result['request_id']}.mp4"
-            client.save_video_from_base64(result["video_base64"], output_file)
+        output_file = f"generated_video_{result['request_id']}.mp4"
+        client.save_video(result, output_file)
     else:
         print(f"❌ Unexpected response: {result}")
 
@@ -187,9 +397,9 @@ def example_batch_generation():
             resolution=request["resolution"]
         )
         
-        if result.get("success") and "video_base64" in result:
+        if result.get("success"):
             output_file = f"batch_output_{i}_{result['request_id']}.mp4"
-            client.save_video_from_base64(result["video_base64"], output_file)
+            client.save_video(result, output_file)
         else:
             print(f"❌ Request {i} failed: {result.get('error', 'Unknown error')}")
 
@@ -224,12 +434,15 @@ def example_async_generation():
         request_id = result["id"]
         print(f"🚀 Async request submitted: {request_id}")
         
-        # Poll for status (you'd implement this)
-        status_url = f"https://api.runpod.ai/v2/YOUR_ENDPOINT_ID/status/{request_id}"
-        
-        print("💡 To check status, poll:")
-        print(f"GET {status_url}")
-        print(f"Headers: {{'Authorization': 'Bearer {API_KEY}'}}")
+        # Follow progress (needs WAN_STREAMING=True on the worker)
+        for event in client.stream(request_id):
+            if event.get("type") == "stage":
+                print(f"🔄 Stage: {event['stage']} ({event['elapsed_seconds']:.0f}s)")
+            elif event.get("type") == "step":
+                print(f"⏳ Clip {event['clip']}/{event['num_clips']} step {event['step']}/{event['total_steps']}"
+                      f" - ETA {event['eta_seconds']:.0f}s")
+            elif event.get("type") == "result" and event.get("success"):
+                client.save_video(event, f"generated_video_{event['request_id']}.mp4")
     else:
         print(f"❌ Async request failed: {result}")
 
@@ -247,9 +460,24 @@ def cost_calculator():
     videos_per_day = int(input("📊 How many videos do you generate per day? "))
     days_per_month = 30
     
-    # RunPod Serverless (pay per use)
-    monthly_seconds = videos_per_day * days_per_month * generation_time
-    runpod_monthly = monthly_seconds * runpod_per_second
+    # RunPod Serverless: replay a simulated day through the runpod.toml scaling
+    # settings, so cold starts and idle workers waiting out idle_timeout are billed too.
+    # Imported here so RunPodClient can be copied without the simulator
+    import random
+    from autoscale_simulator import (Simulation, Distribution, scaling_settings,
+                                     synthetic_trace, prepare_jobs)
+    from runpod_config import load_runpod_config
+    
+    rng = random.Random(1)
+    trace = synthetic_trace(videos_per_day / 86400.0, 86400.0, rng) if videos_per_day > 0 else []
+    jobs = prepare_jobs(trace, Distribution(f'constant:{generation_time}'), rng)
+    day = Simulation(scaling_settings(load_runpod_config()), jobs, Distribution('lognormal:60:0.3'),
+                     gpu_cost_per_second=runpod_per_second).run()
+    runpod_monthly = day["cost"] * days_per_month
+    p95 = f"{day['p95_latency']:.0f}s" if day["p95_latency"] is not None else "-"
+    print(f"\n🧮 Simulated day: {day['cold_starts']} cold starts, {day['gpu_seconds']:.0f} GPU-seconds, "
+          f"p95 latency {p95}")
+    print("   (python autoscale_simulator.py --sweep ... explores the latency vs cost trade-off)")
     
     # Thunder Compute (always-on instance)
     # Assume you need instance running for generation_time per video + overhead
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Reads runpod.toml, the deployment settings shared by the handler and the
+local tools (scaling, timeouts, queue limits, monitoring)
+"""
+
+import os
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+# First existing file wins; WAN_RUNPOD_CONFIG overrides
+CONFIG_PATHS = [
+    os.environ.get('WAN_RUNPOD_CONFIG'),
+    '/workspace/runpod.toml',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runpod.toml'),
+]
+
+
+def load_runpod_config(path=None):
+    """Return runpod.toml as a dict of sections, or {} when there is none"""
+    paths = [path] if path else [p for p in CONFIG_PATHS if p]
+    for candidate in paths:
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate, 'rb') as f:
+            return tomllib.load(f)
+    return {}
+
+
+def config_value(config, section, key, default=None):
+    """config[section][key], or default when either is missing"""
+    return config.get(section, {}).get(key, default)
@@ -4,6 +4,9 @@ RunPod Serverless Handler for Wan2.2-S2V-14B
 Converts the Flask API to RunPod's serverless format
 """
 
+import time
+_BOOT_START = time.perf_counter()
+
 import runpod
 import os
 import json
@@ -11,11 +14,32 @@ import tempfile
 import uuid
 import subprocess
 import base64
+import binascii
+import re
+import asyncio
+import threading
+import math
+import hashlib
+import importlib.util
+from contextlib import contextmanager
 from datetime import datetime
 import shutil
 
+from output_sinks import get_output_sink, encode_file_to_base64
+from result_cache import ResultCache, cache_key
+from batch_scheduler import BatchScheduler
+from stage_pipeline import StagePipeline
+from device_pool import DevicePool, enumerate_devices, DEFAULT_CPU_DEVICE_MEMORY_BYTES
+from media_probe import MediaProbeError, probe_audio, probe_image, sniff_format
+from deadline import Deadline, GenerationCancelled
+from metrics import StageTimings, NULL_TIMINGS, MetricsRegistry
+from runpod_config import load_runpod_config, config_value
+
+IMPORT_SECONDS = time.perf_counter() - _BOOT_START
+
 # Model configuration
-# Try multiple possible model locations
+# WAN_MODEL_PATH pins the checkpoint directory (the Docker image sets it);
+# otherwise try multiple possible model locations
 POSSIBLE_MODEL_PATHS = [
     "/workspace/wan-s2v-14b/Wan2.2/Wan2.2-S2V-14B/",
     "/workspace/wan-s2v-14b/Wan2.2-S2V-14B/", 
@@ -25,8 +49,8 @@ POSSIBLE_MODEL_PATHS = [
 ]
 
 # Find the actual model path
-MODEL_PATH = None
-for path in POSSIBLE_MODEL_PATHS:
+MODEL_PATH = os.environ.get('WAN_MODEL_PATH') or None
+for path in POSSIBLE_MODEL_PATHS if not MODEL_PATH else []:
     if os.path.exists(path):
         MODEL_PATH = path
         break
@@ -34,7 +58,158 @@ for path in POSSIBLE_MODEL_PATHS:
 if not MODEL_PATH:
     MODEL_PATH = POSSIBLE_MODEL_PATHS[0]  # Default fallback
 
-ALLOWED_EXTENSIONS = {'wav', 'mp3', 'jpg', 'jpeg', 'png'}
+ALLOWED_EXTENSIONS = {'wav', 'mp3', 'flac', 'jpg', 'jpeg', 'png'}
+
+# Extension for each sniffed input format, so loaders that go by extension see the real type
+MEDIA_EXTENSIONS = {'wav': '.wav', 'mp3': '.mp3', 'flac': '.flac', 'jpeg': '.jpg', 'png': '.png'}
+
+# Per-field limits on the decoded size of request inputs (bytes)
+MAX_AUDIO_BYTES = int(os.environ.get('WAN_MAX_AUDIO_BYTES', 100 * 1024 * 1024))
+MAX_IMAGE_BYTES = int(os.environ.get('WAN_MAX_IMAGE_BYTES', 25 * 1024 * 1024))
+MAX_MOTION_VIDEO_BYTES = int(os.environ.get('WAN_MAX_MOTION_VIDEO_BYTES', 25 * 1024 * 1024))
+
+# Base64 characters decoded per block (multiple of 4, ~768 KB decoded)
+BASE64_CHUNK_CHARS = 1024 * 1024
+
+_NON_BASE64 = re.compile(r'[^A-Za-z0-9+/=]')
+
+# generate.py's log line when --allow_partial kept only some clips
+_TRUNCATED_LINE = re.compile(r'keeping (\d+)/(\d+) clips')
+
+# Content-addressed cache of finished videos for repeated identical requests
+RESULT_CACHE_ENABLED = os.environ.get('WAN_RESULT_CACHE', 'True').lower() in ('true', '1', 'yes')
+RESULT_CACHE_DIR = os.environ.get('WAN_RESULT_CACHE_DIR', '/tmp/wan_result_cache')
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('WAN_RESULT_CACHE_MAX_BYTES', 10 * 1024 ** 3))
+
+# Request fields that change how a result is delivered, not what is generated
+NON_GENERATION_FIELDS = {'audio_file', 'image_file', 'motion_video', 'output_sink', 'use_cache', 'stream_segments',
+                         'preflight_only', 'deadline_seconds', 'allow_partial'}
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+# Deployment settings from runpod.toml ({} when the image has none)
+RUNPOD_CONFIG = load_runpod_config()
+
+# Per-job time budget ([timeout] handler_timeout in runpod.toml), minus a margin
+# kept free for delivering the result; requests may ask for less with
+# "deadline_seconds", which is used as given (capped at the worker's budget)
+JOB_TIMEOUT_SECONDS = float(os.environ.get(
+    'WAN_JOB_TIMEOUT_SECONDS', config_value(RUNPOD_CONFIG, 'timeout', 'handler_timeout', 300)
+))
+DEADLINE_MARGIN_SECONDS = float(os.environ.get('WAN_DEADLINE_MARGIN_SECONDS', 15))
+# generate.py gets the remaining deadline as --timeout and stops itself; it is
+# only killed when it overruns that by this much
+SUBPROCESS_KILL_MARGIN_SECONDS = float(os.environ.get('WAN_SUBPROCESS_KILL_MARGIN_SECONDS', 10))
+
+# Deadlines of running jobs by RunPod job ID, so they can be cancelled
+_active_deadlines = {}
+
+# Preflight limits, checked from file headers before any model work
+MIN_AUDIO_SECONDS = float(os.environ.get('WAN_MIN_AUDIO_SECONDS', 0.1))
+MAX_AUDIO_SECONDS = float(os.environ.get('WAN_MAX_AUDIO_SECONDS', 120))
+MIN_IMAGE_SIDE = int(os.environ.get('WAN_MIN_IMAGE_SIDE', 64))
+MAX_IMAGE_SIDE = int(os.environ.get('WAN_MAX_IMAGE_SIDE', 8192))
+MAX_OUTPUT_SIDE = int(os.environ.get('WAN_MAX_OUTPUT_SIDE', 2048))
+
+# Cost model for preflight estimates: output fps, frames per clip and steps per
+# clip (match S2VPipeline), seconds per denoising step at 1024*704 on the
+# worker GPU (scaled by pixel count), and GPU price per second
+MODEL_FPS = 16
+MODEL_INFER_FRAMES = 80
+MODEL_SAMPLE_STEPS = 40
+SECONDS_PER_STEP = float(os.environ.get('WAN_SECONDS_PER_STEP', 4.0))
+GPU_COST_PER_SECOND = float(os.environ.get('WAN_GPU_COST_PER_SECOND', 0.0012))
+
+# Per-asset encoding cache (image latents, audio features) inside the pipeline
+ASSET_CACHE_MEMORY_ITEMS = int(os.environ.get('WAN_ASSET_CACHE_MEMORY_ITEMS', 64))
+ASSET_CACHE_MEMORY_BYTES = int(os.environ.get('WAN_ASSET_CACHE_MEMORY_BYTES', 2 * 1024 ** 3))
+ASSET_CACHE_DIR = os.environ.get('WAN_ASSET_CACHE_DIR') or None
+ASSET_CACHE_MAX_BYTES = int(os.environ.get('WAN_ASSET_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+ASSET_CACHE_POLICY = os.environ.get('WAN_ASSET_CACHE_POLICY', 'lru').lower()
+
+# Micro-batching of compatible concurrent jobs (needs RunPod concurrency > 1)
+BATCHING_ENABLED = os.environ.get('WAN_BATCHING', 'False').lower() in ('true', '1', 'yes')
+BATCH_WINDOW_MS = int(os.environ.get('WAN_BATCH_WINDOW_MS', 250))
+MAX_BATCH_SIZE = int(os.environ.get('WAN_MAX_BATCH_SIZE', 4))
+MAX_CONCURRENCY = int(os.environ.get('WAN_MAX_CONCURRENCY', MAX_BATCH_SIZE))
+
+_batch_scheduler = None
+_batch_scheduler_lock = threading.Lock()
+
+# Overlap CPU stages (decode, preprocessing, video encode, delivery) of some
+# jobs with the GPU stage of another (needs RunPod concurrency > 1)
+PIPELINING_ENABLED = os.environ.get('WAN_PIPELINING', 'False').lower() in ('true', '1', 'yes')
+CPU_WORKERS = int(os.environ.get('WAN_CPU_WORKERS', os.cpu_count() or 4))
+STAGE_QUEUE_SIZE = int(os.environ.get('WAN_STAGE_QUEUE_SIZE', 1))
+# One job preparing, one generating and one finishing by default
+PIPELINE_CONCURRENCY = int(os.environ.get('WAN_PIPELINE_CONCURRENCY', 3))
+
+_stage_pipeline = None
+_stage_pipeline_lock = threading.Lock()
+
+# One resident pipeline per device, jobs placed on the least-loaded one.
+# WAN_DEVICES: auto (every visible GPU), cuda:0,cuda:1, or cpu:N to test
+# placement without a GPU. WAN_DEVICE_POOL: auto enables the pool when more
+# than one device is found.
+DEVICES_SPEC = os.environ.get('WAN_DEVICES', 'auto')
+DEVICE_POOL_SETTING = os.environ.get('WAN_DEVICE_POOL', 'auto').lower()
+CPU_DEVICE_MEMORY_BYTES = int(os.environ.get('WAN_CPU_DEVICE_MEMORY_BYTES', DEFAULT_CPU_DEVICE_MEMORY_BYTES))
+# Jobs per device: one running plus one queued, so the next job starts without waiting on RunPod
+JOBS_PER_DEVICE = int(os.environ.get('WAN_JOBS_PER_DEVICE', 2))
+
+_devices = None
+_device_pool = None
+_device_pool_lock = threading.Lock()
+
+# --offload_model: auto plans resident and streamed modules from each device's
+# memory budget; True/False force the old offload-everything/nothing behaviour
+OFFLOAD_MODEL = os.environ.get('WAN_OFFLOAD_MODEL', 'auto')
+
+# Serve jobs through the async-generator handler that streams progress events
+STREAMING_ENABLED = os.environ.get('WAN_STREAMING', 'False').lower() in ('true', '1', 'yes')
+# Minimum seconds between streamed denoising step events (the last step always goes out)
+PROGRESS_MIN_INTERVAL = float(os.environ.get('WAN_PROGRESS_INTERVAL', 0.5))
+
+# Per-stage latency metrics: a "timings" block in every response, plus
+# JSON-lines and Prometheus text exports; defaults to [monitoring]
+# enable_metrics in runpod.toml
+METRICS_ENABLED = os.environ.get(
+    'WAN_METRICS', str(config_value(RUNPOD_CONFIG, 'monitoring', 'enable_metrics', True))
+).lower() in ('true', '1', 'yes')
+METRICS_JSONL_PATH = os.environ.get('WAN_METRICS_JSONL', '/tmp/wan_metrics.jsonl') or None
+METRICS_PROMETHEUS_PATH = os.environ.get('WAN_METRICS_PROMETHEUS', '/tmp/wan_metrics.prom') or None
+
+_metrics_registry = None
+_metrics_registry_lock = threading.Lock()
+
+# Possible locations of generate.py
+POSSIBLE_GENERATE_SCRIPTS = [
+    '/workspace/generate.py',
+    '/workspace/wan-s2v-14b/Wan2.2/generate.py',
+    '/workspace/wan-s2v-14b/generate.py',
+    '/app/generate.py',
+    './generate.py'
+]
+
+# "inprocess" keeps one resident pipeline per worker, "subprocess" spawns
+# generate.py for every job (fallback when the pipeline cannot be imported)
+WORKER_MODE = os.environ.get('WAN_WORKER_MODE', 'inprocess').lower()
+
+# Resident pipeline, loaded on first use and kept for the life of the worker
+_pipeline = None
+_pipeline_unsupported = False
+# Jobs reach the lazy singletons from worker threads; first use is locked so
+# two concurrent first jobs cannot each load a pipeline
+_pipeline_lock = threading.Lock()
+
+# generate.py location, resolved once per worker (WAN_GENERATE_SCRIPT skips the search)
+GENERATE_SCRIPT = os.environ.get('WAN_GENERATE_SCRIPT') or None
+
+# Warmup settings: run a dummy generation before accepting jobs and write the
+# per-phase cold-start timings to this file
+WARMUP_ENABLED = os.environ.get('WAN_WARMUP', 'True').lower() in ('true', '1', 'yes')
+COLD_START_PROFILE_PATH = os.environ.get('WAN_COLD_START_PROFILE', '/tmp/cold_start_profile.json')
 
 def setup_environment():
     """Initialize the environment and check model availability"""
@@ -59,163 +234,1311 @@ def setup_environment():
     print("✅ Handler initialization complete")
     return True
 
-def decode_base64_file(base64_string, output_path):
-    """Decode base64 string and save to file"""
-    try:
-        # Remove data URL prefix if present
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
+class InputTooLargeError(ValueError):
+    """Raised when a decoded input exceeds its per-field size limit"""
+
+def base64_payload_offset(base64_string):
+    """Index where the base64 payload starts, skipping a data URL prefix"""
+    comma = base64_string.find(',', 0, 1024)
+    return comma + 1 if comma != -1 else 0
+
+def stream_decode_base64(base64_string, output, max_bytes=None, hasher=None,
+                         chunk_chars=BASE64_CHUNK_CHARS):
+    """
+    Decode base64 text block by block into a writable binary stream (an open
+    file or an io.BytesIO), without copying the whole string or holding the
+    whole decoded payload in memory. Returns the number of bytes written.
+    Raises InputTooLargeError as soon as more than max_bytes would be written.
+    Decoded blocks are also fed to hasher (a hashlib object) when given.
+    """
+    pos = base64_payload_offset(base64_string)
+    end = len(base64_string)
+    carry = ''
+    written = 0
+    padded = False
+    
+    while pos < end or carry:
+        block = carry + base64_string[pos:pos + chunk_chars]
+        pos += chunk_chars
+        
+        # Like base64.b64decode, ignore line breaks and other stray characters
+        if _NON_BASE64.search(block):
+            block = _NON_BASE64.sub('', block)
+        
+        if pos < end:
+            usable = len(block) - len(block) % 4
+            block, carry = block[:usable], block[usable:]
+        else:
+            carry = ''
+        
+        if not block:
+            continue
         
-        # Decode and save
-        file_data = base64.b64decode(base64_string)
+        # b64decode stops at the first padding, which would silently drop
+        # whatever follows it in this or a later block
+        payload = block.rstrip('=')
+        if '=' in payload or (padded and payload):
+            raise binascii.Error("padding before the end of the base64 data")
+        padded = padded or len(payload) < len(block)
+        
+        data = base64.b64decode(block)
+        written += len(data)
+        if max_bytes is not None and written > max_bytes:
+            raise InputTooLargeError(f"decoded size exceeds limit of {max_bytes} bytes")
+        output.write(data)
+        if hasher is not None:
+            hasher.update(data)
+    
+    return written
+
+def decode_base64_file(base64_string, output_path, max_bytes=None, hasher=None):
+    """
+    Decode base64 string and stream it to a file
+    Returns False on malformed input; raises InputTooLargeError over max_bytes
+    """
+    try:
         with open(output_path, 'wb') as f:
-            f.write(file_data)
+            stream_decode_base64(base64_string, f, max_bytes=max_bytes, hasher=hasher)
         return True
+    except InputTooLargeError:
+        os.remove(output_path)
+        raise
     except Exception as e:
         print(f"Error decoding base64 file: {e}")
         return False
 
-def handler(event):
+def match_extension(path):
+    """Rename a decoded input to the extension of its actual format; returns the path"""
+    extension = MEDIA_EXTENSIONS.get(sniff_format(path))
+    if extension is None or path.endswith(extension):
+        return path
+    renamed = os.path.splitext(path)[0] + extension
+    os.replace(path, renamed)
+    return renamed
+
+def get_result_cache():
+    """Return the worker's ResultCache, or None when caching is disabled"""
+    global _result_cache
+    
+    if _result_cache is not None or not RESULT_CACHE_ENABLED:
+        return _result_cache
+    
+    with _result_cache_lock:
+        if _result_cache is None:
+            try:
+                _result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES)
+            except OSError as e:
+                print(f"⚠️ Result cache unavailable: {e}")
+        return _result_cache
+
+class ProgressTracker:
+    """
+    Turns stage changes and pipeline step callbacks into structured progress
+    events with elapsed time and a projected ETA, and passes them to emit
+    """
+
+    def __init__(self, emit=None, min_interval=PROGRESS_MIN_INTERVAL):
+        self.emit = emit
+        self.min_interval = min_interval
+        self.start = time.monotonic()
+        self.stage = None
+        self.denoise_start = None
+        self.last_step_sent = None
+        self.truncated = None
+
+    def _send(self, event):
+        if self.emit is None:
+            return
+        event["elapsed_seconds"] = round(time.monotonic() - self.start, 2)
+        self.emit(event)
+
+    def set_stage(self, stage):
+        self.stage = stage
+        if stage == 'denoise':
+            self.denoise_start = time.monotonic()
+        self._send({"type": "stage", "stage": stage})
+
+    def __call__(self, event):
+        """Progress callback handed to the pipeline"""
+        if event.get("type") == "stage":
+            self.set_stage(event["stage"])
+            return
+        
+        if event.get("type") == "truncated":
+            self.truncated = {"clips_done": event["clips_done"], "num_clips": event["num_clips"]}
+        
+        if event.get("type") == "segment":
+            if self.emit is None:
+                return
+            # Ship the finished clip's bytes with the event; the server path is useless to clients
+            path = event["path"]
+            event = {k: v for k, v in event.items() if k != "path"}
+            event["data"] = encode_file_to_base64(path)
+            self._send(event)
+            return
+        
+        if event.get("type") == "step":
+            now = time.monotonic()
+            if self.denoise_start is None:
+                self.denoise_start = now
+            
+            total = event["num_clips"] * event["total_steps"]
+            done = (event["clip"] - 1) * event["total_steps"] + event["step"]
+            if (done < total and self.last_step_sent is not None
+                    and now - self.last_step_sent < self.min_interval):
+                return
+            self.last_step_sent = now
+            
+            per_step = (now - self.denoise_start) / done
+            event = dict(event)
+            event["progress"] = round(done / total, 4)
+            event["eta_seconds"] = round(per_step * (total - done), 2)
+        
+        self._send(event)
+
+def get_metrics_registry():
+    """Return the worker's MetricsRegistry, created on first use"""
+    global _metrics_registry
+    if _metrics_registry is not None:
+        return _metrics_registry
+    with _metrics_registry_lock:
+        if _metrics_registry is None:
+            _metrics_registry = MetricsRegistry(jsonl_path=METRICS_JSONL_PATH,
+                                                prometheus_path=METRICS_PROMETHEUS_PATH)
+        return _metrics_registry
+
+def new_timings():
+    """StageTimings for a new job, or a no-op stand-in when metrics are off"""
+    return StageTimings() if METRICS_ENABLED else NULL_TIMINGS
+
+def record_timings(response, timings):
+    """Attach the job's stage timings to its response and export them"""
+    if not timings.enabled or not isinstance(response, dict):
+        return response
+    
+    response["timings"] = timings.as_dict()
+    status = "success" if response.get("success") else "error"
+    labels = {k: response[k] for k in ("request_id", "resolution", "worker_mode") if k in response}
+    get_metrics_registry().record(timings, status, labels)
+    return response
+
+@contextmanager
+def job_temp_dir(timings):
+    """Working directory for one job; its removal is timed as 'cleanup'"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        yield temp_dir
+    finally:
+        with timings.stage('cleanup'):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+def job_deadline(event):
+    """Build the Deadline for a job and register it for cancellation"""
+    input_data = event.get('input') or {}
+    # The delivery margin only comes off the worker's own cap; a deadline the
+    # client asked for is its whole budget
+    budget = max(0.0, JOB_TIMEOUT_SECONDS - DEADLINE_MARGIN_SECONDS)
+    try:
+        requested = float(input_data.get('deadline_seconds', budget))
+        if requested > 0:
+            budget = min(budget, requested)
+    except (TypeError, ValueError):
+        pass
+    
+    deadline = Deadline(budget)
+    if event.get('id'):
+        _active_deadlines[event['id']] = deadline
+    return deadline
+
+def release_deadline(event):
+    if event.get('id'):
+        _active_deadlines.pop(event['id'], None)
+
+def cancel_job(job_id):
+    """Ask a running job to stop at its next step; returns False if it is not running here"""
+    deadline = _active_deadlines.get(job_id)
+    if deadline is None:
+        return False
+    print(f"🛑 Cancelling job {job_id}")
+    deadline.cancel()
+    return True
+
+def find_generate_script():
+    """Return the first existing generate.py location, or None (cached once found)"""
+    global GENERATE_SCRIPT
+    
+    if GENERATE_SCRIPT is not None:
+        return GENERATE_SCRIPT
+    
+    for location in POSSIBLE_GENERATE_SCRIPTS:
+        if os.path.exists(location):
+            GENERATE_SCRIPT = location
+            return location
+    return None
+
+def get_pipeline(generate_script):
+    """
+    Return the resident S2VPipeline, loading it on first use
+    Returns None when generate_script does not expose S2VPipeline
+    """
+    global _pipeline, _pipeline_unsupported
+    
+    if _pipeline is not None or _pipeline_unsupported:
+        return _pipeline
+    
+    with _pipeline_lock:
+        if _pipeline is not None or _pipeline_unsupported:
+            return _pipeline
+        
+        module, import_seconds = load_generate_module(generate_script)
+        if module is None:
+            _pipeline_unsupported = True
+            return None
+        
+        _pipeline = new_pipeline(module, import_seconds)
+        return _pipeline
+
+def load_generate_module(generate_script):
+    """
+    Import generate_script; returns (module, import seconds), with module None
+    when it does not expose S2VPipeline
+    """
+    import_start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location('wan_generate', generate_script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    import_seconds = time.perf_counter() - import_start
+    
+    if not hasattr(module, 'S2VPipeline'):
+        print(f"⚠️ {generate_script} has no S2VPipeline, using subprocess mode")
+        return None, import_seconds
+    return module, import_seconds
+
+def new_pipeline(module, import_seconds, device='cuda', memory_budget=None):
+    """Build and load a resident S2VPipeline on device (memory_budget simulates a GPU's memory)"""
+    print(f"📦 Loading resident pipeline on {device}...")
+    asset_cache = module.AssetCache(
+        memory_items=ASSET_CACHE_MEMORY_ITEMS,
+        memory_bytes=ASSET_CACHE_MEMORY_BYTES,
+        disk_dir=ASSET_CACHE_DIR,
+        disk_max_bytes=ASSET_CACHE_MAX_BYTES,
+        policy=ASSET_CACHE_POLICY
+    )
+    pipeline = module.S2VPipeline(
+        MODEL_PATH,
+        task='s2v-14B',
+        offload_model=OFFLOAD_MODEL,
+        convert_model_dtype=True,
+        asset_cache=asset_cache,
+        device=device,
+        memory_budget=memory_budget
+    )
+    pipeline.load_timings['pipeline_import'] = round(import_seconds, 4)
+    pipeline.load()
+    return pipeline
+
+def get_devices():
+    """The devices named by WAN_DEVICES, enumerated once per worker"""
+    global _devices
+    
+    if _devices is None:
+        with _device_pool_lock:
+            if _devices is None:
+                _devices = enumerate_devices(DEVICES_SPEC, cpu_memory_bytes=CPU_DEVICE_MEMORY_BYTES)
+    return _devices
+
+def device_pool_enabled():
+    """WAN_DEVICE_POOL=true/false, or (auto) whether there is more than one device"""
+    if DEVICE_POOL_SETTING == 'auto':
+        return len(get_devices()) > 1
+    return DEVICE_POOL_SETTING in ('true', '1', 'yes')
+
+def get_device_pool(generate_script):
+    """
+    Return the worker's DevicePool, created on first use with one resident
+    pipeline per device (loaded in parallel), or none in subprocess mode
+    """
+    global _device_pool
+    
+    if _device_pool is not None:
+        return _device_pool
+    
+    devices = get_devices()
+    with _device_pool_lock:
+        if _device_pool is not None:
+            return _device_pool
+        
+        module, import_seconds = None, 0.0
+        if WORKER_MODE == 'inprocess':
+            # Like resolve_generator: without a resident pipeline the devices run generate.py per job
+            try:
+                module, import_seconds = load_generate_module(generate_script)
+            except Exception as e:
+                print(f"⚠️ Resident pipeline unavailable ({e}), using subprocess mode on every device")
+        
+        def pipeline_factory(device):
+            if module is None:
+                return None
+            # A CPU "device" runs the pipeline wherever torch defaults to (mock generation in tests),
+            # with its simulated memory as the offload planning budget
+            try:
+                if device.kind == 'cuda':
+                    return new_pipeline(module, import_seconds, device=device.name)
+                return new_pipeline(module, import_seconds, device='cpu', memory_budget=device.memory_bytes)
+            except Exception as e:
+                print(f"⚠️ Pipeline on {device.name} unavailable ({e}), using subprocess mode there")
+                return None
+        
+        print(f"🖥️ Starting {len(devices)} device worker(s): {', '.join(d.name for d in devices)}")
+        _device_pool = DevicePool(devices, pipeline_factory)
+        return _device_pool
+
+
+def warmup():
+    """
+    Boot-time warmup: resolve paths, load weights and run one dummy generation
+    before the worker starts accepting jobs. Writes a cold-start profile to the
+    log and to COLD_START_PROFILE_PATH; returns the profile dict.
+    """
+    boot_start = time.perf_counter()
+    profile = {
+        "model_path": MODEL_PATH,
+        "worker_mode": WORKER_MODE,
+        "phases": {"imports": round(IMPORT_SECONDS, 4)}
+    }
+    
+    phase_start = time.perf_counter()
+    setup_environment()
+    profile["phases"]["environment_check"] = round(time.perf_counter() - phase_start, 4)
+    
+    generate_script = find_generate_script()
+    profile["generate_script"] = generate_script
+    
+    if generate_script and device_pool_enabled():
+        try:
+            pool = get_device_pool(generate_script)
+            profile["devices"] = {}
+            if WARMUP_ENABLED:
+                pool.each(lambda worker: worker.pipeline and worker.pipeline.warmup())
+            for worker in pool.workers:
+                if worker.pipeline is not None:
+                    profile["devices"][worker.device.name] = worker.pipeline.load_timings
+        except Exception as e:
+            print(f"⚠️ Device pool warmup failed ({e}), jobs will start it lazily")
+            profile["warmup_error"] = str(e)
+    elif generate_script and WORKER_MODE == 'inprocess':
+        try:
+            pipeline = get_pipeline(generate_script)
+            if pipeline is not None:
+                if WARMUP_ENABLED:
+                    pipeline.warmup()
+                profile["phases"].update(pipeline.load_timings)
+        except Exception as e:
+            print(f"⚠️ Warmup failed ({e}), jobs will load the pipeline lazily")
+            profile["warmup_error"] = str(e)
+    
+    profile["total_seconds"] = round(IMPORT_SECONDS + time.perf_counter() - boot_start, 4)
+    
+    print("⏱️ Cold-start profile:")
+    for phase, seconds in profile["phases"].items():
+        print(f"   {phase}: {seconds:.3f}s")
+    print(f"   total: {profile['total_seconds']:.3f}s")
+    
+    try:
+        with open(COLD_START_PROFILE_PATH, 'w') as f:
+            json.dump(profile, f, indent=2)
+    except OSError as e:
+        print(f"⚠️ Could not write cold-start profile: {e}")
+    
+    return profile
+
+def run_generation_inprocess(pipeline, prompt, image_path, audio_path, output_path, resolution,
+                             image_digest=None, audio_digest=None, progress=None, segment_dir=None,
+                             deadline=None, allow_partial=False, timings=None, motion_video=None):
+    """Run generation on the resident pipeline; returns (success, error details)"""
+    try:
+        success = pipeline.generate(
+            prompt=prompt,
+            image=image_path,
+            audio=audio_path,
+            output=output_path,
+            size=resolution,
+            image_digest=image_digest,
+            audio_digest=audio_digest,
+            progress=progress,
+            segment_dir=segment_dir,
+            deadline=deadline,
+            allow_partial=allow_partial,
+            timings=timings,
+            motion_video=motion_video
+        )
+        return success, None if success else "Pipeline returned no output"
+    except Exception as e:
+        return False, str(e)
+
+def run_generation_subprocess(generate_script, prompt, image_path, audio_path, output_path, resolution,
+                              deadline=None, allow_partial=False, progress=None, motion_video=None, device=None):
+    """
+    Run generate.py in a fresh interpreter; returns (success, error details)
+    The remaining deadline is passed on as --timeout (with --allow_partial, a
+    truncation is reported to progress as a 'truncated' event). device (a
+    device_pool.Device) pins it to one GPU.
+    """
+    cmd = [
+        'python', generate_script,
+        '--task', 's2v-14B',
+        '--size', resolution,
+        '--ckpt_dir', MODEL_PATH,
+        '--offload_model', OFFLOAD_MODEL,
+        '--convert_model_dtype',
+        '--prompt', prompt,
+        '--image', image_path,
+        '--audio', audio_path,
+        '--output', output_path
+    ]
+    if motion_video:
+        cmd += ['--motion_video', motion_video]
+    if device is not None and device.kind == 'cpu':
+        cmd += ['--gpu_memory_gb', str(device.memory_bytes / 1024 ** 3)]
+    
+    timeout = None
+    if deadline is not None and deadline.expires_at is not None:
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            return False, f"deadline exceeded after {deadline.elapsed():.1f}s, before generate.py started"
+        cmd += ['--timeout', f"{remaining:.3f}"]
+        if allow_partial:
+            cmd += ['--allow_partial']
+        # Backstop only: generate.py normally stops on its own --timeout
+        timeout = remaining + SUBPROCESS_KILL_MARGIN_SECONDS
+    
+    env = None
+    if device is not None and device.kind == 'cuda':
+        visible = os.environ.get('CUDA_VISIBLE_DEVICES')
+        # Device indices are relative to the worker's own CUDA_VISIBLE_DEVICES
+        physical = visible.split(',')[device.index] if visible else str(device.index)
+        env = dict(os.environ, CUDA_VISIBLE_DEVICES=physical)
+    
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, cwd='/workspace/wan-s2v-14b/Wan2.2',
+                                timeout=timeout, env=env)
+    except subprocess.TimeoutExpired:
+        return False, f"deadline exceeded after {deadline.elapsed():.1f}s, generate.py was stopped"
+    
+    if result.returncode != 0:
+        return False, result.stderr
+    
+    truncated = _TRUNCATED_LINE.search(result.stdout or '')
+    if truncated and progress is not None:
+        progress({"type": "truncated", "clips_done": int(truncated.group(1)), "num_clips": int(truncated.group(2))})
+    return True, None
+
+def deliver_result(sink, output_path, request_id, generation_time, resolution, prompt,
+                   worker_mode, cache_info, preflight_info=None):
+    """Hand the finished video to the output sink and build the success response"""
+    file_size = os.path.getsize(output_path)
+    print(f"✅ Generated video: {file_size / (1024*1024):.1f} MB")
+    
+    # Deliver the video (inline base64, local volume or object storage)
+    try:
+        delivery = sink.deliver(output_path, request_id)
+    except Exception as e:
+        return {
+            "error": "Failed to deliver output video",
+            "details": str(e),
+            "request_id": request_id
+        }
+    
+    return {
+        "success": True,
+        "request_id": request_id,
+        **delivery,
+        "output_sink": sink.name,
+        "generation_time_seconds": generation_time,
+        "file_size_bytes": file_size,
+        "worker_mode": worker_mode,
+        "cache": cache_info,
+        "preflight": preflight_info,
+        "resolution": resolution,
+        "prompt": prompt,
+        "message": "Video generated successfully"
+    }
+
+def prepare_job(event, temp_dir, deadline=None, timings=NULL_TIMINGS):
+    """
+    Validate a request and decode its inputs into temp_dir
+    Returns (job, None) on success or (None, error response)
+    """
+    # Validate input
+    if not event.get('input'):
+        return None, {"error": "No input provided"}
+    
+    input_data = event['input']
+    
+    # Check required fields
+    if 'audio_file' not in input_data or 'image_file' not in input_data:
+        return None, {"error": "Both audio_file and image_file are required (as base64)"}
+    
+    # Get parameters
+    prompt = input_data.get('prompt', 'A person speaking')
+    resolution = input_data.get('resolution', '1024*704')
+    
+    # Resolve the output sink before any heavy work so misconfiguration fails fast
+    try:
+        sink = get_output_sink(input_data.get('output_sink'))
+    except ValueError as e:
+        return None, {"error": str(e)}
+    
+    # Generate unique ID for this request
+    request_id = str(uuid.uuid4())
+    print(f"📝 Request ID: {request_id}")
+    print(f"📝 Prompt: {prompt}")
+    print(f"📏 Resolution: {resolution}")
+    print(f"📁 Working in: {temp_dir}")
+    
+    # Decode and save input files
+    audio_path = os.path.join(temp_dir, 'input_audio.wav')
+    image_path = os.path.join(temp_dir, 'input_image.jpg')
+    
+    audio_hash = hashlib.sha256()
+    image_hash = hashlib.sha256()
+    
+    try:
+        if not decode_base64_file(input_data['audio_file'], audio_path, max_bytes=MAX_AUDIO_BYTES, hasher=audio_hash):
+            return None, {"error": "Failed to decode audio file"}
+        
+        if not decode_base64_file(input_data['image_file'], image_path, max_bytes=MAX_IMAGE_BYTES, hasher=image_hash):
+            return None, {"error": "Failed to decode image file"}
+        
+        # Tail frames of the previous segment when long audio is rendered in segments
+        motion_path = None
+        motion_hash = hashlib.sha256()
+        if input_data.get('motion_video'):
+            motion_path = os.path.join(temp_dir, 'motion_video.mp4')
+            if not decode_base64_file(input_data['motion_video'], motion_path,
+                                      max_bytes=MAX_MOTION_VIDEO_BYTES, hasher=motion_hash):
+                return None, {"error": "Failed to decode motion video"}
+    except InputTooLargeError as e:
+        return None, {"error": f"Input file too large: {e}", "request_id": request_id}
+    
+    # Clients may send normalized inputs (e.g. 16 kHz mono FLAC, JPEG at the output size)
+    audio_path = match_extension(audio_path)
+    image_path = match_extension(image_path)
+    
+    print("✅ Input files decoded successfully")
+    
+    # Streamed clip segments (only useful with the streaming handler)
+    segment_dir = None
+    if input_data.get('stream_segments'):
+        segment_dir = os.path.join(temp_dir, 'segments')
+        os.makedirs(segment_dir, exist_ok=True)
+    
+    job = {
+        "request_id": request_id,
+        "input": input_data,
+        "prompt": prompt,
+        "resolution": resolution,
+        "sink": sink,
+        "audio_path": audio_path,
+        "image_path": image_path,
+        "motion_path": motion_path,
+        "output_path": os.path.join(temp_dir, 'output_video.mp4'),
+        "segment_dir": segment_dir,
+        "audio_digest": audio_hash.hexdigest(),
+        "image_digest": image_hash.hexdigest(),
+        "motion_digest": motion_hash.hexdigest() if motion_path else None,
+        "result_cache": None,
+        "cache_info": {"hit": False},
+        "preflight": None,
+        "deadline": deadline if deadline is not None else Deadline(),
+        "allow_partial": bool(input_data.get('allow_partial', False)),
+        "truncated": None,
+        "device": None,
+        "timings": timings
+    }
+    return job, None
+
+def parse_resolution(resolution):
+    """Parse '1024*704' into (width, height); raises ValueError when invalid"""
+    try:
+        width, height = (int(v) for v in str(resolution).lower().replace('x', '*').split('*'))
+    except ValueError:
+        raise ValueError(f"Invalid resolution '{resolution}', expected WIDTH*HEIGHT")
+    
+    if not (0 < width <= MAX_OUTPUT_SIDE and 0 < height <= MAX_OUTPUT_SIDE):
+        raise ValueError(f"Resolution {resolution} outside 1..{MAX_OUTPUT_SIDE} per side")
+    if width % 8 or height % 8:
+        raise ValueError(f"Resolution {resolution} must be a multiple of 8 per side")
+    return width, height
+
+def estimate_cost(duration_seconds, width, height):
+    """Estimated frames, clips, denoising steps, GPU seconds and cost of a job"""
+    frames = max(1, math.ceil(duration_seconds * MODEL_FPS))
+    clips = math.ceil(frames / MODEL_INFER_FRAMES)
+    steps = clips * MODEL_SAMPLE_STEPS
+    gpu_seconds = steps * SECONDS_PER_STEP * (width * height) / (1024 * 704)
+    return {
+        "frames": frames,
+        "clips": clips,
+        "denoising_steps": steps,
+        "estimated_gpu_seconds": round(gpu_seconds, 1),
+        "estimated_cost_usd": round(gpu_seconds * GPU_COST_PER_SECOND, 4)
+    }
+
+def preflight(job):
+    """
+    Header-only validation of the decoded inputs plus a cost estimate
+    Returns (preflight info, None) or (None, error response)
+    """
+    request_id = job["request_id"]
+    
+    try:
+        width, height = parse_resolution(job["resolution"])
+        audio = probe_audio(job["audio_path"])
+        image = probe_image(job["image_path"])
+    except MediaProbeError as e:
+        return None, {"error": f"Invalid input file: {e}", "request_id": request_id}
+    except ValueError as e:
+        return None, {"error": str(e), "request_id": request_id}
+    
+    problems = []
+    if audio["channels"] < 1 or audio["sample_rate"] <= 0:
+        problems.append("audio header has no channels or sample rate")
+    if audio["duration_seconds"] < MIN_AUDIO_SECONDS:
+        problems.append(f"audio is {audio['duration_seconds']:.2f}s, shorter than {MIN_AUDIO_SECONDS}s")
+    if audio["duration_seconds"] > MAX_AUDIO_SECONDS:
+        problems.append(f"audio is {audio['duration_seconds']:.0f}s, longer than {MAX_AUDIO_SECONDS:.0f}s "
+                        f"(split it client-side with long_audio.py from the repo, which sends each "
+                        f"segment as its own job; the worker image does not include it)")
+    if min(image["width"], image["height"]) < MIN_IMAGE_SIDE:
+        problems.append(f"image is {image['width']}x{image['height']}, smaller than {MIN_IMAGE_SIDE}px per side")
+    if max(image["width"], image["height"]) > MAX_IMAGE_SIDE:
+        problems.append(f"image is {image['width']}x{image['height']}, larger than {MAX_IMAGE_SIDE}px per side")
+    
+    if problems:
+        return None, {"error": "Preflight failed", "details": problems, "request_id": request_id}
+    
+    info = {
+        "audio": {k: audio[k] for k in ("format", "sample_rate", "channels")},
+        "image": {k: image[k] for k in ("format", "width", "height")},
+        **estimate_cost(audio["duration_seconds"], width, height)
+    }
+    info["audio"]["duration_seconds"] = round(audio["duration_seconds"], 3)
+    
+    print(f"🛫 Preflight: {info['audio']['duration_seconds']}s audio, {info['clips']} clip(s), "
+          f"~{info['estimated_gpu_seconds']}s GPU (${info['estimated_cost_usd']})")
+    return info, None
+
+def run_preflight(job):
+    """Run preflight on a prepared job; returns a response to send back early, or None"""
+    info, error = preflight(job)
+    if error:
+        return error
+    
+    job["preflight"] = info
+    if job["input"].get('preflight_only'):
+        return {
+            "success": True,
+            "request_id": job["request_id"],
+            "preflight": info,
+            "message": "Preflight passed"
+        }
+    return None
+
+def lookup_cached_result(job):
+    """Look the job up in the result cache; returns the response on a hit, else None"""
+    result_cache = get_result_cache() if job["input"].get('use_cache', True) else None
+    if result_cache is None:
+        return None
+    
+    params = {k: v for k, v in job["input"].items() if k not in NON_GENERATION_FIELDS}
+    params.update({"prompt": job["prompt"], "resolution": job["resolution"], "model_path": MODEL_PATH})
+    digests = {"audio": job["audio_digest"], "image": job["image_digest"]}
+    if job["motion_digest"]:
+        digests["motion"] = job["motion_digest"]
+    key = cache_key(digests, params)
+    
+    job["result_cache"] = result_cache
+    if job["segment_dir"]:
+        # A hit would return before any segment is emitted; generate (and still
+        # store the result for later unstreamed requests)
+        job["cache_info"] = {"hit": False, "key": key, "skipped": "stream_segments"}
+        return None
+    job["cache_info"] = {"hit": result_cache.get(key, job["output_path"]), "key": key}
+    job["cache_info"].update(result_cache.stats())
+    
+    if not job["cache_info"]["hit"]:
+        return None
+    
+    print(f"♻️ Result cache hit: {key[:16]}")
+    return deliver_result(
+        job["sink"], job["output_path"], job["request_id"], 0.0, job["resolution"], job["prompt"],
+        worker_mode="cache", cache_info=job["cache_info"], preflight_info=job["preflight"]
+    )
+
+def resolve_generator(request_id):
+    """
+    Find generate.py and, in inprocess mode, the resident pipeline
+    Returns (pipeline or None, generate_script, error response or None)
+    """
+    # Find generate.py script in multiple possible locations
+    generate_script = find_generate_script()
+    
+    if not generate_script:
+        return None, None, {
+            "error": "generate.py not found",
+            "details": f"Searched locations: {POSSIBLE_GENERATE_SCRIPTS}",
+            "request_id": request_id
+        }
+    
+    print(f"✅ Found generate.py at: {generate_script}")
+    
+    pipeline = None
+    if WORKER_MODE == 'inprocess':
+        try:
+            pipeline = get_pipeline(generate_script)
+        except Exception as e:
+            print(f"⚠️ Resident pipeline unavailable ({e}), using subprocess mode")
+    
+    return pipeline, generate_script, None
+
+def run_job(job, pipeline, generate_script, progress=None):
+    """Run generation for one job; returns (success, error details, seconds)"""
+    print("🎯 Starting model inference...")
+    # Collects a deadline truncation even when nobody listens for progress
+    progress = progress if progress is not None else ProgressTracker()
+    
+    # Run generation
+    start_time = datetime.now()
+    if pipeline is not None:
+        success, details = run_generation_inprocess(
+            pipeline, job["prompt"], job["image_path"], job["audio_path"], job["output_path"],
+            job["resolution"], image_digest=job["image_digest"], audio_digest=job["audio_digest"],
+            progress=progress, segment_dir=job["segment_dir"],
+            deadline=job["deadline"], allow_partial=job["allow_partial"], timings=job["timings"],
+            motion_video=job["motion_path"]
+        )
+    else:
+        with job["timings"].stage('generate'):
+            success, details = run_generation_subprocess(
+                generate_script, job["prompt"], job["image_path"], job["audio_path"],
+                job["output_path"], job["resolution"], deadline=job["deadline"],
+                allow_partial=job["allow_partial"], progress=progress,
+                motion_video=job["motion_path"], device=job["device"]
+            )
+    job["truncated"] = progress.truncated
+    end_time = datetime.now()
+    
+    generation_time = (end_time - start_time).total_seconds()
+    print(f"⏱️ Generation completed in {generation_time:.1f}s")
+    return success, details, generation_time
+
+def finish_job(job, success, details, generation_time, worker_mode):
+    """Store the result in the cache and deliver it, or build the error response"""
+    request_id = job["request_id"]
+    
+    if not success and job["deadline"].cancelled():
+        return {"error": "Job cancelled", "details": details, "request_id": request_id}
+    
+    if not success and (job["deadline"].missed or job["deadline"].remaining() <= 0):
+        return {"error": "Deadline exceeded", "details": details, "request_id": request_id}
+    
+    if not success:
+        return {
+            "error": "Video generation failed",
+            "details": details,
+            "request_id": request_id
+        }
+    
+    # Check if output file was created
+    if not os.path.exists(job["output_path"]):
+        return {
+            "error": "Output video not found", 
+            "request_id": request_id
+        }
+    
+    # Partial (deadline-truncated) videos are not cached
+    if job["result_cache"] is not None and not job["truncated"]:
+        try:
+            with job["timings"].stage('cache_store'):
+                job["result_cache"].put(job["cache_info"]["key"], job["output_path"])
+        except OSError as e:
+            print(f"⚠️ Could not store result in cache: {e}")
+    
+    with job["timings"].stage('deliver'):
+        response = deliver_result(
+            job["sink"], job["output_path"], request_id, generation_time, job["resolution"],
+            job["prompt"], worker_mode=worker_mode, cache_info=job["cache_info"],
+            preflight_info=job["preflight"]
+        )
+    if job["truncated"] and response.get("success"):
+        response["partial"] = job["truncated"]
+        response["message"] = "Partial video generated before the deadline"
+    return response
+
+def handler(event, progress=None):
     """
     RunPod handler function for video generation
+    progress is an optional ProgressTracker that receives stage and step events
     
     Expected input format:
     {
-        "audio_file": "base64_encoded_audio_data",
-        "image_file": "base64_encoded_image_data", 
+        "audio_file": "base64_encoded_audio_data",   # wav, mp3 or flac
+        "image_file": "base64_encoded_image_data",   # jpeg or png
         "prompt": "A person speaking",
-        "resolution": "1024*704"
+        "resolution": "1024*704",
+        "output_sink": "inline",      # optional: inline, local or s3
+        "stream_segments": false,     # optional: stream each clip as an MPEG-TS segment
+        "preflight_only": false,      # optional: only validate inputs and estimate cost
+        "deadline_seconds": 300,      # optional: time budget, capped at handler_timeout
+        "allow_partial": false,       # optional: on deadline, return the clips finished so far
+        "motion_video": "base64..."   # optional: previous segment's tail frames (long_audio.py)
     }
     """
     print("🎬 Starting video generation request...")
+    progress = progress if progress is not None else ProgressTracker()
+    deadline = job_deadline(event)
+    timings = new_timings()
     
     try:
-        # Validate input
-        if not event.get('input'):
-            return {"error": "No input provided"}
-        
-        input_data = event['input']
-        
-        # Check required fields
-        if 'audio_file' not in input_data or 'image_file' not in input_data:
-            return {"error": "Both audio_file and image_file are required (as base64)"}
-        
-        # Get parameters
-        audio_b64 = input_data['audio_file']
-        image_b64 = input_data['image_file'] 
-        prompt = input_data.get('prompt', 'A person speaking')
-        resolution = input_data.get('resolution', '1024*704')
-        
-        # Generate unique ID for this request
-        request_id = str(uuid.uuid4())
-        print(f"📝 Request ID: {request_id}")
-        print(f"📝 Prompt: {prompt}")
-        print(f"📏 Resolution: {resolution}")
-        
-        # Create temporary directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            print(f"📁 Working in: {temp_dir}")
-            
-            # Decode and save input files
-            audio_path = os.path.join(temp_dir, 'input_audio.wav')
-            image_path = os.path.join(temp_dir, 'input_image.jpg')
-            
-            if not decode_base64_file(audio_b64, audio_path):
-                return {"error": "Failed to decode audio file"}
-            
-            if not decode_base64_file(image_b64, image_path):
-                return {"error": "Failed to decode image file"}
-            
-            print("✅ Input files decoded successfully")
-            
-            # Prepare generation command
-            output_path = os.path.join(temp_dir, 'output_video.mp4')
-            
-            # Find generate.py script in multiple possible locations
-            generate_script = None
-            possible_locations = [
-                '/workspace/generate.py',
-                '/workspace/wan-s2v-14b/Wan2.2/generate.py',
-                '/workspace/wan-s2v-14b/generate.py',
-                '/app/generate.py',
-                './generate.py'
-            ]
-            
-            for location in possible_locations:
-                if os.path.exists(location):
-                    generate_script = location
-                    print(f"✅ Found generate.py at: {location}")
-                    break
-            
-            if not generate_script:
-                return {
-                    "error": "generate.py not found",
-                    "details": f"Searched locations: {possible_locations}",
-                    "request_id": request_id
-                }
-            
-            cmd = [
-                'python', generate_script,
-                '--task', 's2v-14B',
-                '--size', resolution,
-                '--ckpt_dir', MODEL_PATH,
-                '--offload_model', 'True',
-                '--convert_model_dtype',
-                '--prompt', prompt,
-                '--image', image_path,
-                '--audio', audio_path,
-                '--output', output_path
-            ]
-            
-            print("🎯 Starting model inference...")
-            
-            # Run generation
-            start_time = datetime.now()
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd='/workspace/wan-s2v-14b/Wan2.2')
-            end_time = datetime.now()
-            
-            generation_time = (end_time - start_time).total_seconds()
-            print(f"⏱️ Generation completed in {generation_time:.1f}s")
-            
-            if result.returncode != 0:
-                return {
-                    "error": "Video generation failed",
-                    "details": result.stderr,
-                    "request_id": request_id
-                }
-            
-            # Check if output file was created
-            if not os.path.exists(output_path):
-                return {
-                    "error": "Output video not found", 
-                    "request_id": request_id
-                }
-            
-            # Encode output video as base64
-            with open(output_path, 'rb') as video_file:
-                video_b64 = base64.b64encode(video_file.read()).decode('utf-8')
-            
-            file_size = os.path.getsize(output_path)
-            print(f"✅ Generated video: {file_size / (1024*1024):.1f} MB")
-            
-            return {
-                "success": True,
-                "request_id": request_id,
-                "video_base64": video_b64,
-                "generation_time_seconds": generation_time,
-                "file_size_bytes": file_size,
-                "resolution": resolution,
-                "prompt": prompt,
-                "message": "Video generated successfully"
-            }
+        with job_temp_dir(timings) as temp_dir:
+            response = handle_job(event, temp_dir, progress, deadline, timings)
+    except Exception as e:
+        print(f"❌ Handler error: {str(e)}")
+        response = {"error": f"Internal server error: {str(e)}"}
+    finally:
+        release_deadline(event)
+    
+    return record_timings(response, timings)
+
+def handle_job(event, temp_dir, progress, deadline, timings):
+    """Run one request through decode, preflight, cache, generation and delivery"""
+    progress.set_stage('decode_inputs')
+    with timings.stage('decode_inputs'):
+        job, error = prepare_job(event, temp_dir, deadline, timings)
+    if error:
+        return error
+    
+    progress.set_stage('preflight')
+    with timings.stage('preflight'):
+        early = run_preflight(job)
+    if early:
+        return early
+    
+    progress.set_stage('cache_lookup')
+    with timings.stage('cache_lookup'):
+        cached = lookup_cached_result(job)
+    if cached:
+        return cached
+    
+    progress.set_stage('load_pipeline')
+    with timings.stage('load_pipeline'):
+        pipeline, generate_script, error = resolve_generator(job["request_id"])
+    if error:
+        return error
+    
+    try:
+        deadline.check('setup')
+    except GenerationCancelled as e:
+        return finish_job(job, False, str(e), 0.0, worker_mode="none")
+    
+    success, details, generation_time = run_job(job, pipeline, generate_script, progress=progress)
+    
+    progress.set_stage('deliver')
+    return finish_job(
+        job, success, details, generation_time,
+        worker_mode="inprocess" if pipeline is not None else "subprocess"
+    )
+
+def get_batch_scheduler(pipeline):
+    """Return the worker's BatchScheduler, created on first use"""
+    global _batch_scheduler
+    
+    if _batch_scheduler is not None:
+        return _batch_scheduler
+    
+    with _batch_scheduler_lock:
+        if _batch_scheduler is None:
+            def run_batch(jobs):
+                print(f"🎯 Starting model inference for {len(jobs)} job(s)...")
+                start_time = datetime.now()
+                results = pipeline.generate_batch([
+                    {
+                        "prompt": job["prompt"],
+                        "image": job["image_path"],
+                        "audio": job["audio_path"],
+                        "output": job["output_path"],
+                        "size": job["resolution"],
+                        "image_digest": job["image_digest"],
+                        "audio_digest": job["audio_digest"],
+                        "motion_video": job["motion_path"],
+                        "deadline": job["deadline"],
+                        "allow_partial": job["allow_partial"],
+                        "segment_dir": job["segment_dir"],
+                        "progress": job["progress"],
+                        "timings": job["timings"]
+                    }
+                    for job in jobs
+                ])
+                for job in jobs:
+                    job["truncated"] = job["progress"].truncated
+                generation_time = (datetime.now() - start_time).total_seconds()
+                print(f"⏱️ Batch completed in {generation_time:.1f}s")
+                return [(success, details, generation_time) for success, details in results]
             
+            _batch_scheduler = BatchScheduler(
+                run_batch,
+                window_seconds=BATCH_WINDOW_MS / 1000.0,
+                max_batch_size=MAX_BATCH_SIZE,
+                max_batch_size_fn=lambda key: pipeline.max_batch_size(key[0], MAX_BATCH_SIZE)
+            )
+        return _batch_scheduler
+
+async def batching_handler(event):
+    """
+    Concurrent variant of handler: compatible jobs (same resolution and clip
+    count) arriving within WAN_BATCH_WINDOW_MS run through the pipeline as
+    one batch. Decode, caching and delivery run in threads so the event loop
+    keeps accepting jobs.
+    """
+    print("🎬 Starting video generation request (batching)...")
+    deadline = job_deadline(event)
+    timings = new_timings()
+    
+    try:
+        with job_temp_dir(timings) as temp_dir:
+            response = await handle_batched_job(event, temp_dir, deadline, timings)
+    except asyncio.CancelledError:
+        deadline.cancel()
+        raise
     except Exception as e:
         print(f"❌ Handler error: {str(e)}")
-        return {"error": f"Internal server error: {str(e)}"}
+        response = {"error": f"Internal server error: {str(e)}"}
+    finally:
+        release_deadline(event)
+    
+    return record_timings(response, timings)
 
-# Initialize environment when the handler starts
-if __name__ != "__main__":
-    setup_environment()
+async def handle_batched_job(event, temp_dir, deadline, timings):
+    """handle_job for batching_handler, with blocking stages in threads"""
+    with timings.stage('decode_inputs'):
+        job, error = await asyncio.to_thread(prepare_job, event, temp_dir, deadline, timings)
+    if error:
+        return error
+    
+    with timings.stage('preflight'):
+        early = await asyncio.to_thread(run_preflight, job)
+    if early:
+        return early
+    
+    with timings.stage('cache_lookup'):
+        cached = await asyncio.to_thread(lookup_cached_result, job)
+    if cached:
+        return cached
+    
+    with timings.stage('load_pipeline'):
+        pipeline, generate_script, error = await asyncio.to_thread(resolve_generator, job["request_id"])
+    if error:
+        return error
+    
+    if pipeline is None:
+        success, details, generation_time = await asyncio.to_thread(
+            run_job, job, pipeline, generate_script
+        )
+        worker_mode = "subprocess"
+    else:
+        key = pipeline.batch_key(job["resolution"], job["audio_path"])
+        # Collects the job's truncation; the batching handler streams no events
+        job["progress"] = ProgressTracker()
+        # Batch wait and the shared denoiser pass are one stage for a batched job
+        with timings.stage('batch'):
+            future = get_batch_scheduler(pipeline).submit(job, key)
+            success, details, generation_time = await asyncio.wrap_future(future)
+        worker_mode = "inprocess"
+    
+    return await asyncio.to_thread(
+        finish_job, job, success, details, generation_time, worker_mode
+    )
+
+def get_stage_pipeline():
+    """Return the worker's StagePipeline, created on first use"""
+    global _stage_pipeline
+    
+    if _stage_pipeline is not None:
+        return _stage_pipeline
+    
+    with _stage_pipeline_lock:
+        if _stage_pipeline is None:
+            _stage_pipeline = StagePipeline(cpu_workers=CPU_WORKERS, queue_size=STAGE_QUEUE_SIZE)
+        return _stage_pipeline
+
+def prepare_stage(job_input):
+    """
+    CPU stage of pipelined_handler: decode, preflight, cache lookup and the
+    pipeline's input preprocessing. Returns (done, response or job).
+    """
+    event, temp_dir, deadline, timings = job_input
+    with timings.stage('decode_inputs'):
+        job, error = prepare_job(event, temp_dir, deadline, timings)
+    if error:
+        return True, error
+    
+    with timings.stage('preflight'):
+        early = run_preflight(job)
+    if early:
+        return True, early
+    
+    with timings.stage('cache_lookup'):
+        cached = lookup_cached_result(job)
+    if cached:
+        return True, cached
+    
+    with timings.stage('load_pipeline'):
+        pipeline, generate_script, error = resolve_generator(job["request_id"])
+    if error:
+        return True, error
+    
+    job["pipeline"], job["generate_script"], job["prepared"] = pipeline, generate_script, None
+    if pipeline is not None:
+        try:
+            with timings.stage('preprocess'):
+                job["prepared"] = pipeline.preprocess(job["image_path"], job["audio_path"],
+                                                      job["resolution"], timings=timings)
+        except Exception as e:
+            return True, finish_job(job, False, str(e), 0.0, worker_mode="inprocess")
+    return False, job
+
+def generate_stage(job):
+    """
+    GPU stage of pipelined_handler: encoders, denoising and VAE decode (or the
+    whole run, for the subprocess fallback)
+    """
+    try:
+        job["deadline"].check('stage queue')
+    except GenerationCancelled as e:
+        return True, finish_job(job, False, str(e), 0.0, worker_mode="none")
+    
+    job["rendered"] = None
+    pipeline = job["pipeline"]
+    if pipeline is None:
+        job["generation"] = run_job(job, None, job["generate_script"])
+        return False, job
+    
+    print("🎯 Starting model inference...")
+    start = time.perf_counter()
+    try:
+        job["rendered"] = pipeline.render(
+            job["prompt"], job["image_path"], job["audio_path"], job["output_path"], job["resolution"],
+            image_digest=job["image_digest"], audio_digest=job["audio_digest"],
+            segment_dir=job["segment_dir"], deadline=job["deadline"], allow_partial=job["allow_partial"],
+            timings=job["timings"], prepared=job["prepared"], motion_video=job["motion_path"]
+        )
+        rendered = job["rendered"]
+        if rendered["clips"] < rendered["num_clips"]:
+            job["truncated"] = {"clips_done": rendered["clips"], "num_clips": rendered["num_clips"]}
+        job["generation"] = (True, None, time.perf_counter() - start)
+    except Exception as e:
+        job["generation"] = (False, str(e), time.perf_counter() - start)
+    return False, job
+
+def finish_stage(job):
+    """CPU stage of pipelined_handler: encode the video, then cache and deliver it"""
+    success, details, generation_time = job["generation"]
+    if job["rendered"] is not None:
+        start = time.perf_counter()
+        try:
+            success = job["pipeline"].write_video(job["rendered"], timings=job["timings"])
+            details = None if success else "Pipeline returned no output"
+        except Exception as e:
+            success, details = False, str(e)
+        generation_time += time.perf_counter() - start
+        print(f"⏱️ Generation completed in {generation_time:.1f}s")
+    
+    worker_mode = "inprocess" if job["pipeline"] is not None else "subprocess"
+    return True, finish_job(job, success, details, generation_time, worker_mode)
+
+async def pipelined_handler(event):
+    """
+    Concurrent variant of handler that overlaps the CPU stages of some jobs
+    with the GPU stage of another: while job N denoises, job N+1's inputs are
+    decoded and preprocessed and job N-1's video is encoded and delivered.
+    Stages are connected by queues of WAN_STAGE_QUEUE_SIZE jobs.
+    """
+    print("🎬 Starting video generation request (pipelined)...")
+    deadline = job_deadline(event)
+    timings = new_timings()
+    stages = get_stage_pipeline()
+    
+    try:
+        with job_temp_dir(timings) as temp_dir:
+            response = await stages.run(prepare_stage, generate_stage, finish_stage,
+                                        value=(event, temp_dir, deadline, timings), timings=timings)
+    except asyncio.CancelledError:
+        deadline.cancel()
+        raise
+    except Exception as e:
+        print(f"❌ Handler error: {str(e)}")
+        response = {"error": f"Internal server error: {str(e)}"}
+    finally:
+        release_deadline(event)
+    
+    print(f"📊 Stage utilization: {json.dumps(stages.stats())}")
+    return record_timings(response, timings)
+
+def prepare_device_job(event, temp_dir, deadline, timings):
+    """
+    CPU part of device_pool_handler before placement: decode, preflight and
+    cache lookup. Returns (done, response or job).
+    """
+    with timings.stage('decode_inputs'):
+        job, error = prepare_job(event, temp_dir, deadline, timings)
+    if error:
+        return True, error
+    
+    with timings.stage('preflight'):
+        early = run_preflight(job)
+    if early:
+        return True, early
+    
+    with timings.stage('cache_lookup'):
+        cached = lookup_cached_result(job)
+    if cached:
+        return True, cached
+    
+    job["generate_script"] = find_generate_script()
+    if not job["generate_script"]:
+        return True, {
+            "error": "generate.py not found",
+            "details": f"Searched locations: {POSSIBLE_GENERATE_SCRIPTS}",
+            "request_id": job["request_id"]
+        }
+    return False, job
+
+def run_on_device(worker, job):
+    """Runs on the device's thread: generate with that device's pipeline"""
+    job["device"] = worker.device
+    try:
+        job["deadline"].check('device queue')
+    except GenerationCancelled as e:
+        return False, str(e), 0.0
+    print(f"🖥️ Job {job['request_id']} on {worker.device.name}")
+    return run_job(job, worker.pipeline, job["generate_script"])
+
+async def device_pool_handler(event):
+    """
+    Concurrent variant of handler for multi-GPU pods: one resident pipeline
+    per device, each job placed on the least-loaded device (memory headroom,
+    then queue length). Decode, caching and delivery run in threads.
+    """
+    print("🎬 Starting video generation request (device pool)...")
+    deadline = job_deadline(event)
+    timings = new_timings()
+    
+    try:
+        with job_temp_dir(timings) as temp_dir:
+            response = await handle_device_job(event, temp_dir, deadline, timings)
+    except asyncio.CancelledError:
+        deadline.cancel()
+        raise
+    except Exception as e:
+        print(f"❌ Handler error: {str(e)}")
+        response = {"error": f"Internal server error: {str(e)}"}
+    finally:
+        release_deadline(event)
+    
+    if _device_pool is not None:
+        print(f"📊 Device utilization: {json.dumps(_device_pool.stats())}")
+    return record_timings(response, timings)
+
+async def handle_device_job(event, temp_dir, deadline, timings):
+    done, value = await asyncio.to_thread(prepare_device_job, event, temp_dir, deadline, timings)
+    if done:
+        return value
+    job = value
+    
+    with timings.stage('load_pipeline'):
+        pool = await asyncio.to_thread(get_device_pool, job["generate_script"])
+    
+    pipeline = pool.workers[0].pipeline
+    bytes_needed = pipeline.estimate_sample_bytes(job["resolution"]) if pipeline is not None else 0
+    worker, (success, details, generation_time) = await pool.run(run_on_device, job, bytes_needed=bytes_needed)
+    
+    response = await asyncio.to_thread(
+        finish_job, job, success, details, generation_time,
+        "inprocess" if worker.pipeline is not None else "subprocess"
+    )
+    response["device"] = worker.device.name
+    return response
+
+async def streaming_handler(event):
+    """
+    Async-generator variant of handler for RunPod's /stream endpoint
+    Yields progress events (stage changes, denoising step i/N, elapsed time,
+    ETA) while the job runs, then a final {"type": "result", ...} event.
+    With "stream_segments": true each finished clip is also yielded as a
+    {"type": "segment", "data": <base64 MPEG-TS>} event.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    
+    def emit(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+    
+    def run():
+        try:
+            result = handler(event, progress=ProgressTracker(emit))
+        except Exception as e:
+            result = {"error": f"Internal server error: {str(e)}"}
+        emit({"type": "result", **result})
+    
+    worker = loop.run_in_executor(None, run)
+    
+    try:
+        while True:
+            item = await queue.get()
+            yield item
+            if item.get("type") == "result":
+                break
+    except (GeneratorExit, asyncio.CancelledError):
+        # The consumer went away (client cancel): stop the job at its next step
+        cancel_job(event.get('id'))
+        raise
+    
+    await worker
+
+def concurrency_modifier(current_concurrency):
+    """Number of jobs RunPod may hand this worker at once"""
+    if BATCHING_ENABLED:
+        return MAX_CONCURRENCY
+    if PIPELINING_ENABLED:
+        return PIPELINE_CONCURRENCY
+    if device_pool_enabled():
+        return JOBS_PER_DEVICE * len(get_devices())
+    return 1
 
-# Start the RunPod serverless handler
-runpod.serverless.start({"handler": handler})
+# Warm up, then start the RunPod serverless handler so the first real job
+# does not absorb the cold start
+if __name__ == "__main__":
+    warmup()
+    if STREAMING_ENABLED:
+        runpod.serverless.start({
+            "handler": streaming_handler,
+            "return_aggregate_stream": True
+        })
+    elif BATCHING_ENABLED:
+        runpod.serverless.start({
+            "handler": batching_handler,
+            "concurrency_modifier": concurrency_modifier
+        })
+    elif PIPELINING_ENABLED:
+        runpod.serverless.start({
+            "handler": pipelined_handler,
+            "concurrency_modifier": concurrency_modifier
+        })
+    elif device_pool_enabled():
+        runpod.serverless.start({
+            "handler": device_pool_handler,
+            "concurrency_modifier": concurrency_modifier
+        })
+    else:
+        runpod.serverless.start({"handler": handler})
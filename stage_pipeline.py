@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Three-stage job pipeline for one worker
+prepare (CPU pool) -> generate (a single GPU thread) -> finish (CPU pool),
+connected by bounded queues, so job N+1's inputs are decoded and job N-1's
+video is encoded and delivered while job N is denoising. A full queue
+blocks the stage feeding it, so a slow stage holds back its producers
+instead of piling up decoded inputs or finished frames in memory.
+"""
+
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+STAGES = ('prepare', 'generate', 'finish')
+
+
+class StageJob:
+    """One job moving through the stages; value is handed from stage to stage"""
+
+    def __init__(self, future, steps, value, timings=None):
+        self.future = future
+        self.steps = steps
+        self.value = value
+        self.timings = timings
+        self.enqueued_at = time.perf_counter()
+
+
+class StagePipeline:
+    """
+    Run jobs through prepare -> generate -> finish. Each step is a blocking
+    function taking the previous step's value and returning (done, value);
+    done=True ends the job early with value as its result (e.g. a cache hit
+    or a validation error), otherwise the last step's value is the result.
+    """
+
+    def __init__(self, cpu_workers=4, queue_size=1):
+        self.cpu_workers = cpu_workers
+        self.queue_size = queue_size
+        # The CPU threads are split between the two CPU stages, so a burst of
+        # decodes cannot starve the encodes that free the GPU's output queue
+        prepare_workers = max(1, cpu_workers // 2)
+        self.capacity = {'prepare': prepare_workers, 'generate': 1,
+                         'finish': max(1, cpu_workers - prepare_workers)}
+        self.cpu_pool = ThreadPoolExecutor(self.capacity['prepare'] + self.capacity['finish'],
+                                           thread_name_prefix='wan-cpu')
+        self.gpu_pool = ThreadPoolExecutor(1, thread_name_prefix='wan-gpu')
+        self.queues = None
+        self.loop = None
+        self.tasks = []
+        self.busy_seconds = {stage: 0.0 for stage in STAGES}
+        self.active = {stage: 0 for stage in STAGES}
+        self.started_at = None
+
+    def _start(self):
+        """Create the queues and stage workers inside the running event loop"""
+        self.loop = asyncio.get_running_loop()
+        self.queues = {stage: asyncio.Queue(maxsize=self.queue_size) for stage in STAGES}
+        self.tasks = []
+        self.started_at = time.perf_counter()
+        workers = [('prepare', 'generate', self.cpu_pool, self.capacity['prepare']),
+                   ('generate', 'finish', self.gpu_pool, 1),
+                   ('finish', None, self.cpu_pool, self.capacity['finish'])]
+        for stage, next_stage, pool, count in workers:
+            for _ in range(count):
+                self.tasks.append(asyncio.ensure_future(self._worker(stage, next_stage, pool)))
+
+    async def run(self, prepare, generate, finish, value=None, timings=None):
+        """Queue a job and wait for its result"""
+        # RunPod keeps one event loop; a new one (e.g. a second asyncio.run) needs new workers
+        if self.loop is not asyncio.get_running_loop():
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        job = StageJob(future, {'prepare': prepare, 'generate': generate, 'finish': finish}, value, timings)
+        await self.queues['prepare'].put(job)
+        return await future
+
+    async def _worker(self, stage, next_stage, pool):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queues[stage].get()
+            if job.future.done():
+                continue  # the handler gave up on this job (cancelled)
+            if job.timings is not None:
+                job.timings.add(f"wait_{stage}", time.perf_counter() - job.enqueued_at)
+
+            self.active[stage] += 1
+            start = time.perf_counter()
+            try:
+                done, value = await loop.run_in_executor(pool, job.steps[stage], job.value)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                continue
+            finally:
+                self.busy_seconds[stage] += time.perf_counter() - start
+                self.active[stage] -= 1
+
+            if done or next_stage is None:
+                if not job.future.done():
+                    job.future.set_result(value)
+                continue
+            job.value = value
+            job.enqueued_at = time.perf_counter()
+            # Blocks while the next stage's queue is full
+            await self.queues[next_stage].put(job)
+
+    def stats(self):
+        """Per-stage utilization, queue depth and jobs in progress"""
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        return {
+            stage: {
+                "utilization": round(self.busy_seconds[stage] / (elapsed * self.capacity[stage]), 4)
+                if elapsed else 0.0,
+                "queued": self.queues[stage].qsize() if self.queues else 0,
+                "active": self.active[stage],
+            }
+            for stage in STAGES
+        }
+
+    def shutdown(self):
+        for task in self.tasks:
+            task.cancel()
+        self.cpu_pool.shutdown(wait=False)
+        self.gpu_pool.shutdown(wait=False)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Asset cache tests: memory and disk tiers, promotion, eviction policies and
+the pickle-free disk format
+Run: python -m pytest -q test_asset_cache.py
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from asset_cache import AssetCache, decode_entry, encode_entry
+
+
+def test_memory_hit_skips_compute():
+    cache = AssetCache()
+    calls = []
+    compute = lambda: calls.append(1) or {"latents": np.ones(4)}
+
+    first = cache.get_or_compute('image_latents', 'abc', compute)
+    second = cache.get_or_compute('image_latents', 'abc', compute)
+
+    assert len(calls) == 1
+    assert second["latents"] is first["latents"]
+    assert cache.stats == {"memory_hits": 1, "disk_hits": 0, "misses": 1}
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    writer = AssetCache(disk_dir=str(tmp_path))
+    writer.put('audio_features-abc', {"features": np.arange(6, dtype=np.float32).reshape(2, 3)})
+
+    # A fresh cache over the same directory, as after a worker restart
+    cache = AssetCache(disk_dir=str(tmp_path))
+    value = cache.get('audio_features-abc')
+    np.testing.assert_array_equal(value["features"], np.arange(6).reshape(2, 3))
+    assert value["features"].dtype == np.float32
+
+    assert cache.get('audio_features-abc') is value
+    assert cache.stats == {"memory_hits": 1, "disk_hits": 1, "misses": 0}
+
+
+def test_disk_tier_evicts_least_recently_used_within_byte_budget(tmp_path):
+    probe = AssetCache(disk_dir=str(tmp_path / 'probe'))
+    probe.put('x', np.zeros(100))
+    entry_bytes = os.path.getsize(str(tmp_path / 'probe' / 'x.npz'))
+
+    disk = tmp_path / 'disk'
+    cache = AssetCache(memory_items=1, disk_dir=str(disk), disk_max_bytes=3 * entry_bytes)
+    for i, key in enumerate(('old', 'mid', 'new')):
+        cache.put(key, np.zeros(100))
+        os.utime(str(disk / f"{key}.npz"), (1000 + i, 1000 + i))
+    # Reading 'old' back from disk refreshes it, leaving 'mid' as the oldest
+    assert cache.get('old') is not None
+    assert cache.stats["disk_hits"] == 1
+
+    cache.put('newest', np.zeros(100))
+
+    assert sorted(os.listdir(str(disk))) == ['new.npz', 'newest.npz', 'old.npz']
+
+
+@pytest.mark.parametrize("policy, evicted", [('lru', 'b'), ('lfu', 'c'), ('fifo', 'a')])
+def test_memory_policies_pick_their_victim(policy, evicted):
+    cache = AssetCache(memory_items=3, policy=policy)
+    for key in 'abc':
+        cache.put(key, key.encode())
+    for key in 'aabbca':
+        cache.get(key)
+
+    cache.put('d', b'd')
+
+    remaining = {key for key in 'abcd' if cache.get(key) is not None}
+    assert remaining == set('abcd') - {evicted}
+
+
+def test_memory_tier_respects_byte_budget():
+    cache = AssetCache(memory_bytes=2048)
+    cache.put('big', np.zeros(1024, dtype=np.uint8))
+    cache.put('bigger', np.zeros(1536, dtype=np.uint8))
+    cache.put('too_big', np.zeros(4096, dtype=np.uint8))
+
+    assert cache.get('big') is None
+    assert cache.get('bigger') is not None
+    assert cache.get('too_big') is None
+
+
+def test_entry_round_trips_nested_values():
+    value = {
+        "size": "1024*704",
+        "frames": [np.ones((2, 2), dtype=np.float16), b'\x00\x01', None],
+        "shape": (3, 4),
+        "scale": 0.5,
+    }
+    restored = decode_entry(*encode_entry(value))
+
+    assert restored["size"] == "1024*704" and restored["scale"] == 0.5
+    assert restored["shape"] == (3, 4)
+    np.testing.assert_array_equal(restored["frames"][0], np.ones((2, 2)))
+    assert restored["frames"][0].dtype == np.float16
+    assert restored["frames"][1:] == [b'\x00\x01', None]
+
+
+def test_unstorable_values_stay_memory_only(tmp_path, capsys):
+    cache = AssetCache(disk_dir=str(tmp_path))
+    encoder = object()
+    cache.put('odd', {"encoder": encoder})
+
+    assert cache.get('odd')["encoder"] is encoder
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.npz')]
+    assert "Could not write asset cache entry odd" in capsys.readouterr().out
+
+
+def test_pickled_entry_is_dropped_without_loading(tmp_path):
+    path = tmp_path / 'evil.npz'
+    layout = np.frombuffer(b'{"t": "array", "k": "a0"}', dtype=np.uint8)
+    with open(str(path), 'wb') as f:
+        np.savez(f, __layout__=layout, a0=np.array([{"x": 1}], dtype=object))
+
+    cache = AssetCache(disk_dir=str(tmp_path))
+    assert cache.get('evil') is None
+    assert not path.exists()
+    assert cache.stats["misses"] == 1
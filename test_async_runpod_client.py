@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Async client tests against a scripted stand-in for the aiohttp session
+Run: python -m pytest -q test_async_runpod_client.py
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from async_runpod_client import AsyncRunPodClient, RetryBudget, backoff_delay
+
+BASE = "https://api.runpod.ai/v2/endpoint"
+
+
+class StubResponse:
+    def __init__(self, session, status, body):
+        self.session = session
+        self.status = status
+        self.body = body
+
+    async def __aenter__(self):
+        self.session.in_flight += 1
+        self.session.max_in_flight = max(self.session.max_in_flight, self.session.in_flight)
+        await asyncio.sleep(self.session.latency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.session.in_flight -= 1
+        return False
+
+    async def text(self):
+        return self.body if isinstance(self.body, str) else json.dumps(self.body)
+
+    async def json(self, content_type=None):
+        return self.body
+
+
+class StubSession:
+    """
+    Answers each (method, path) from a script of (status, body) pairs or
+    exceptions, repeating the last entry once the script runs out
+    """
+
+    def __init__(self, routes, latency=0):
+        self.routes = {key: list(answers) for key, answers in routes.items()}
+        self.latency = latency
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def request(self, method, url, **kwargs):
+        path = url[len(BASE):]
+        self.calls.append((method, path))
+        route = path if path == '/run' else path.rsplit('/', 1)[0]
+        answers = self.routes[(method, route)]
+        answer = answers.pop(0) if len(answers) > 1 else answers[0]
+        if isinstance(answer, Exception):
+            raise answer
+        return StubResponse(self, *answer)
+
+    async def close(self):
+        pass
+
+
+def _client(routes, **options):
+    options.setdefault('poll_interval', 0.001)
+    options.setdefault('max_poll_interval', 0.004)
+    client = AsyncRunPodClient(BASE + '/runsync', **options)
+    client.session = StubSession(routes)
+    return client
+
+
+def test_submit_retries_transient_answers_until_accepted():
+    client = _client({('POST', '/run'): [(503, "busy"), ConnectionResetError("reset"), (200, {"id": "j1"})]})
+
+    assert asyncio.run(client.submit({"input": {}})) == {"id": "j1"}
+    assert len(client.session.calls) == 3
+    assert client.retry_budget.retries == 2
+
+
+def test_submit_gives_up_on_a_client_error():
+    client = _client({('POST', '/run'): [(400, "bad input")]})
+
+    result = asyncio.run(client.submit({"input": {}}))
+    assert result == {"status": "FAILED", "error": "HTTP 400: bad input"}
+    assert len(client.session.calls) == 1
+
+
+def test_exhausted_retry_budget_stops_retries():
+    client = _client({('POST', '/run'): [(429, "slow down")]},
+                     retry_budget=RetryBudget(ratio=0, min_retries=1), max_attempts=10)
+
+    result = asyncio.run(client.submit({"input": {}}))
+    assert result["status"] == "FAILED"
+    assert len(client.session.calls) == 2
+
+
+def test_wait_for_job_polls_through_failed_polls_until_terminal():
+    client = _client({('GET', '/status'): [
+        (200, {"id": "j1", "status": "IN_QUEUE"}),
+        (502, "bad gateway"),
+        (200, {"id": "j1", "status": "IN_PROGRESS"}),
+        (200, {"id": "j1", "status": "COMPLETED", "output": {"success": True}}),
+    ]})
+
+    result = asyncio.run(client.wait_for_job("j1"))
+    assert result["status"] == "COMPLETED"
+    assert client.session.calls == [('GET', '/status/j1')] * 4
+
+
+def test_wait_for_job_cancels_when_the_timeout_runs_out():
+    client = _client({
+        ('GET', '/status'): [(200, {"id": "j1", "status": "IN_PROGRESS"})],
+        ('POST', '/cancel'): [(200, {"id": "j1", "status": "CANCELLED"})],
+    })
+
+    result = asyncio.run(client.wait_for_job("j1", timeout=0.02))
+    assert result["status"] == "TIMED_OUT"
+    assert client.session.calls[-1] == ('POST', '/cancel/j1')
+
+
+@pytest.mark.parametrize("first, attempts", [
+    ({"id": "j1", "status": "FAILED", "error": "CUDA OOM"}, 2),
+    ({"id": "j1", "status": "COMPLETED", "output": {"success": False, "error": "decode"}}, 2),
+    ({"id": "j1", "status": "CANCELLED"}, 1),
+])
+def test_run_job_retries_failed_but_not_cancelled_jobs(first, attempts):
+    client = _client({
+        ('POST', '/run'): [(200, {"id": "j1"})],
+        ('GET', '/status'): [(200, first), (200, {"id": "j1", "status": "COMPLETED", "output": {"success": True}})],
+    })
+
+    result = asyncio.run(client.run_job({"input": {}}))
+    assert result["attempts"] == attempts
+    assert result["status"] == ("CANCELLED" if attempts == 1 else "COMPLETED")
+
+
+def test_generate_many_bounds_jobs_in_flight():
+    client = _client({('POST', '/run'): [(200, {"id": "j"})],
+                      ('GET', '/status'): [(200, {"id": "j", "status": "COMPLETED", "output": {"success": True}})]},
+                     max_concurrency=3)
+    client.session.latency = 0.002
+
+    async def collect():
+        return [index async for index, _ in client.generate_many({"input": {"n": i}} for i in range(10))]
+
+    assert sorted(asyncio.run(collect())) == list(range(10))
+    assert client.session.max_in_flight == 3
+
+
+def test_backoff_stays_within_half_and_full_delay():
+    for attempt in range(8):
+        delay = backoff_delay(attempt, 1.0, 10.0)
+        cap = min(10.0, 2 ** attempt)
+        assert cap / 2 <= delay <= cap
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Checkpoint manifest tests on a tiny synthetic checkpoint directory
+Run: python -m pytest -q test_checkpoint_manifest.py
+"""
+
+import json
+import os
+import shutil
+import struct
+
+import pytest
+
+from checkpoint_manifest import CheckpointError, get_manifest, read_manifest, stale_entries, verify_manifest
+
+
+def safetensors_bytes(tensors):
+    """{name: payload bytes} as a safetensors file of U8 tensors"""
+    header, offset = {}, 0
+    for name, payload in tensors.items():
+        header[name] = {"dtype": 'U8', "shape": [len(payload)], "data_offsets": [offset, offset + len(payload)]}
+        offset += len(payload)
+    data = json.dumps(header).encode('utf-8')
+    return struct.pack('<Q', len(data)) + data + b''.join(tensors.values())
+
+
+@pytest.fixture
+def ckpt_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('WAN_MANIFEST_DIR', str(tmp_path / 'manifests'))
+    root = tmp_path / 'ckpt'
+    (root / 'vae').mkdir(parents=True)
+    (root / 'model-00001.safetensors').write_bytes(safetensors_bytes({"a": b'\1' * 64, "b": b'\2' * 32}))
+    (root / 'vae' / 'vae.pth').write_bytes(b'\3' * 256)
+    (root / 'config.json').write_text('{}')
+    return str(root)
+
+
+def test_manifest_indexes_shards_and_tensors(ckpt_dir):
+    manifest = get_manifest(ckpt_dir)
+    assert [entry["path"] for entry in manifest["shards"]] == ['model-00001.safetensors', 'vae/vae.pth']
+    assert manifest["tensors"]["a"] == {"shard": 'model-00001.safetensors', "dtype": 'U8', "shape": [64], "bytes": 64}
+    assert verify_manifest(manifest) == [] and verify_manifest(manifest, full=True) == []
+
+
+def test_unchanged_checkpoint_reuses_the_stored_manifest(ckpt_dir):
+    built = get_manifest(ckpt_dir)
+    assert get_manifest(ckpt_dir)["built_at"] == built["built_at"]
+
+
+def test_copied_checkpoint_with_new_mtimes_is_not_rebuilt(ckpt_dir, tmp_path):
+    built = get_manifest(ckpt_dir)
+    for name in ('model-00001.safetensors', 'vae/vae.pth'):
+        path = os.path.join(ckpt_dir, name)
+        os.utime(path, ns=(10 ** 18, 10 ** 18))
+
+    refreshed = []
+    assert stale_entries(read_manifest(ckpt_dir), refreshed) == []
+    assert sorted(refreshed) == ['model-00001.safetensors', 'vae/vae.pth']
+
+    manifest = get_manifest(ckpt_dir)
+    assert manifest["built_at"] == built["built_at"]
+    # The new mtimes are stored, so the next check is stat-only
+    assert all(entry["mtime_ns"] == 10 ** 18 for entry in read_manifest(ckpt_dir)["shards"])
+
+
+def test_edited_shard_of_the_same_size_is_detected(ckpt_dir):
+    built = get_manifest(ckpt_dir)
+    path = os.path.join(ckpt_dir, 'vae', 'vae.pth')
+    with open(path, 'r+b') as f:
+        f.write(b'\4' * 16)
+
+    assert stale_entries(read_manifest(ckpt_dir)) == ['vae/vae.pth']
+    rebuilt = get_manifest(ckpt_dir)
+    assert rebuilt["hash"] != built["hash"]
+    # The untouched shard's entry is carried over
+    assert rebuilt["shards"][0] == built["shards"][0]
+
+
+def test_resized_shard_is_detected(ckpt_dir):
+    get_manifest(ckpt_dir)
+    with open(os.path.join(ckpt_dir, 'vae', 'vae.pth'), 'ab') as f:
+        f.write(b'\0')
+    assert stale_entries(read_manifest(ckpt_dir)) == ['vae/vae.pth']
+
+
+def test_missing_shard_is_reported(ckpt_dir):
+    manifest = get_manifest(ckpt_dir)
+    os.remove(os.path.join(ckpt_dir, 'vae', 'vae.pth'))
+    assert 'vae/vae.pth (missing)' in stale_entries(read_manifest(ckpt_dir))
+    assert verify_manifest(manifest) == ['vae/vae.pth: missing']
+
+
+def test_truncated_shard_cannot_be_indexed(ckpt_dir):
+    get_manifest(ckpt_dir)
+    path = os.path.join(ckpt_dir, 'model-00001.safetensors')
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 8)
+
+    assert stale_entries(read_manifest(ckpt_dir)) == ['model-00001.safetensors']
+    with pytest.raises(CheckpointError, match='partial download'):
+        get_manifest(ckpt_dir)
+
+
+def test_interrupted_download_fails_verification(ckpt_dir):
+    get_manifest(ckpt_dir)
+    open(os.path.join(ckpt_dir, 'model-00002.safetensors.incomplete'), 'wb').close()
+
+    assert stale_entries(read_manifest(ckpt_dir)) == ['./']
+    assert verify_manifest(get_manifest(ckpt_dir)) == ['model-00002.safetensors.incomplete: partial download']
+
+
+def test_missing_directory_has_no_manifest(ckpt_dir):
+    shutil.rmtree(ckpt_dir)
+    assert get_manifest(ckpt_dir) is None
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Device pool placement tests on simulated CPU devices
+Run: python -m pytest -q test_device_pool.py
+"""
+
+import threading
+
+import pytest
+
+from device_pool import Device, DevicePool, enumerate_devices
+
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def pool():
+    pool = DevicePool([Device('cpu', i, 24 * GB) for i in range(3)])
+    yield pool
+    pool.shutdown()
+
+
+def test_cpu_spec_enumerates_simulated_devices():
+    devices = enumerate_devices('cpu:2', cpu_memory_bytes=8 * GB)
+    assert [d.name for d in devices] == ['cpu:0', 'cpu:1']
+    assert all(d.memory_bytes == 8 * GB for d in devices)
+    with pytest.raises(ValueError):
+        enumerate_devices('tpu:0')
+
+
+def test_jobs_spread_over_the_least_loaded_devices(pool):
+    placed = [pool.place(4 * GB).device.name for _ in range(6)]
+    assert sorted(placed[:3]) == ['cpu:0', 'cpu:1', 'cpu:2']
+    assert sorted(placed) == ['cpu:0', 'cpu:0', 'cpu:1', 'cpu:1', 'cpu:2', 'cpu:2']
+
+
+def test_placement_skips_devices_without_headroom(pool):
+    big = pool.place(20 * GB)
+    assert big.headroom() == 4 * GB
+    # Jobs that no longer fit there go to the devices that still have room
+    others = {pool.place(22 * GB).device.name for _ in range(2)}
+    assert big.device.name not in others and len(others) == 2
+
+
+def test_equal_queues_prefer_the_most_headroom(pool):
+    pool.place(10 * GB)
+    pool.place(5 * GB)
+    pool.place(1 * GB)
+    assert pool.place(1 * GB).device.name == pool.workers[2].device.name
+
+
+def test_no_room_anywhere_queues_on_the_shortest_queue(pool):
+    for worker in pool.workers[:2]:
+        worker.queued += 1
+    assert pool.place(100 * GB) is pool.workers[2]
+
+
+def test_finished_jobs_release_their_reservation(pool):
+    release = threading.Event()
+    worker, future = pool.submit(lambda worker: release.wait(5), bytes_needed=20 * GB)
+    assert pool.place(20 * GB) is not worker
+    release.set()
+    future.result(timeout=5)
+    assert (worker.queued, worker.active, worker.active_bytes, worker.jobs) == (0, 0, 0, 1)
+    assert worker.headroom() == 24 * GB
+
+
+def test_counters_balance_under_concurrent_submits(pool):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def job(worker, fail):
+        if fail:
+            raise RuntimeError("boom")
+
+    def submit(index):
+        return pool.submit(job, index % 5 == 0, bytes_needed=GB)[1]
+
+    with ThreadPoolExecutor(8) as callers:
+        futures = list(callers.map(submit, range(300)))
+    for future in futures:
+        future.exception(timeout=10)
+
+    stats = pool.stats()
+    assert sum(s["jobs"] for s in stats.values()) == 300
+    assert sum(s["failures"] for s in stats.values()) == 60
+    for worker in pool.workers:
+        assert (worker.queued, worker.queued_bytes, worker.active, worker.active_bytes) == (0, 0, 0, 0)
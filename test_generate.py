@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+S2VPipeline tests on mock generation (no GPU or checkpoint needed)
+Run: python -m pytest -q test_generate.py
+"""
+
+import os
+
+import pytest
+
+from deadline import Deadline
+from generate import S2VPipeline, write_silent_wav, write_blank_png
+from metrics import StageTimings
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    pipeline = S2VPipeline(str(tmp_path / 'no_checkpoint')).load()
+    pipeline.MOCK_STEP_SECONDS = 0.005
+    return pipeline
+
+
+@pytest.fixture
+def media(tmp_path):
+    audio = str(tmp_path / 'audio.wav')
+    image = str(tmp_path / 'image.png')
+    write_silent_wav(audio, seconds=12)  # 3 clips of 5 s
+    write_blank_png(image)
+    return audio, image
+
+
+def batch_request(tmp_path, media, name, **extra):
+    audio, image = media
+    events = []
+    request = {"prompt": name, "image": image, "audio": audio, "output": str(tmp_path / f"{name}.mp4"),
+               "size": '512*512', "progress": events.append, "timings": StageTimings(), **extra}
+    return request, events
+
+
+def test_batch_reports_every_step_of_every_sample(pipeline, media, tmp_path):
+    segment_dir = tmp_path / 'segments'
+    segment_dir.mkdir()
+    first, first_events = batch_request(tmp_path, media, 'first', segment_dir=str(segment_dir))
+    second, second_events = batch_request(tmp_path, media, 'second')
+
+    assert pipeline.generate_batch([first, second]) == [(True, None)] * 2
+
+    assert len(os.listdir(segment_dir)) == 3
+    assert [event["type"] for event in second_events].count('segment') == 0
+    for events in (first_events, second_events):
+        steps = [event for event in events if event["type"] == 'step']
+        assert len(steps) == 3 * pipeline.SAMPLE_STEPS
+        assert [event["stage"] for event in events if event["type"] == 'stage'] == [
+            'validate', 'encode_image', 'encode_audio', 'denoise', 'write_video']
+
+
+def test_batch_denoises_every_sample_in_one_pass(pipeline, media, tmp_path, monkeypatch):
+    passes = []
+    denoise = pipeline._denoise
+    monkeypatch.setattr(pipeline, '_denoise', lambda samples: passes.append(len(samples)) or denoise(samples))
+    requests = [batch_request(tmp_path, media, f"job{i}")[0] for i in range(3)]
+
+    assert pipeline.generate_batch(requests) == [(True, None)] * 3
+    assert passes == [3]
+
+
+def test_invalid_request_fails_only_its_sample(pipeline, media, tmp_path):
+    ok, _ = batch_request(tmp_path, media, 'ok')
+    missing, _ = batch_request(tmp_path, media, 'missing', image=str(tmp_path / 'missing.png'))
+
+    results = pipeline.generate_batch([ok, missing])
+
+    assert results[0] == (True, None)
+    assert results[1][0] is False
+
+
+def test_batch_keeps_single_job_semantics(pipeline, media, tmp_path):
+    segment_dir = tmp_path / 'segments'
+    segment_dir.mkdir()
+    full, full_events = batch_request(tmp_path, media, 'full', segment_dir=str(segment_dir))
+    partial, partial_events = batch_request(tmp_path, media, 'partial', deadline=Deadline(0.3), allow_partial=True)
+    cancelled_deadline = Deadline()
+    cancelled_deadline.cancel()
+    cancelled, _ = batch_request(tmp_path, media, 'cancelled', deadline=cancelled_deadline)
+
+    results = pipeline.generate_batch([full, partial, cancelled])
+
+    assert results[0] == (True, None)
+    steps = [event for event in full_events if event["type"] == 'step']
+    assert len(steps) == 3 * pipeline.SAMPLE_STEPS
+    assert len(os.listdir(segment_dir)) == 3
+    assert len(full["timings"].samples["denoise_step"]) == 3 * pipeline.SAMPLE_STEPS
+
+    assert results[1] == (True, None)
+    truncated = [event for event in partial_events if event["type"] == 'truncated']
+    assert truncated and truncated[0]["clips_done"] < 3
+
+    assert results[2][0] is False and 'cancelled' in results[2][1]
+
+
+def test_batch_steps_run_once_for_all_samples(pipeline, media, tmp_path):
+    requests = [batch_request(tmp_path, media, f"job{i}")[0] for i in range(3)]
+    single = batch_request(tmp_path, media, 'single')[0]
+
+    pipeline.generate_batch([single])
+    pipeline.generate_batch(requests)
+
+    single_seconds = sum(single["timings"].samples["denoise_step"])
+    batch_seconds = sum(requests[0]["timings"].samples["denoise_step"])
+    # Three samples share each step instead of taking three times as long
+    assert batch_seconds < 2 * single_seconds
+
+
+def test_deadline_without_partial_fails_only_that_sample(pipeline, media, tmp_path):
+    ok, _ = batch_request(tmp_path, media, 'ok')
+    late, _ = batch_request(tmp_path, media, 'late', deadline=Deadline(0.3))
+
+    results = pipeline.generate_batch([ok, late])
+
+    assert results[0] == (True, None)
+    assert results[1][0] is False and 'cannot fit' in results[1][1]
+
+
+def test_deadline_expiring_between_clips_keeps_finished_clips(pipeline, media, tmp_path):
+    deadline = Deadline(60)
+    request, events = batch_request(tmp_path, media, 'expired', deadline=deadline, allow_partial=True)
+
+    def expire_after_first_clip(event):
+        events.append(event)
+        if event["type"] == 'step' and event["clip"] == 1 and event["step"] == pipeline.SAMPLE_STEPS:
+            deadline.expires_at = deadline.started_at
+
+    request["progress"] = expire_after_first_clip
+    assert pipeline.generate_batch([request]) == [(True, None)]
+    truncated = [event for event in events if event["type"] == 'truncated']
+    assert truncated == [{"type": 'truncated', "clips_done": 1, "num_clips": 3}]
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Handler regression tests (mock generation, no GPU)
+Run: python -m pytest -q test_handler.py
+"""
+
+import os
+import tempfile
+
+import pytest
+
+pytest.importorskip("runpod")
+
+# Keep the worker's caches and profiles out of /tmp's shared locations
+_WORKDIR = tempfile.mkdtemp(prefix='wan_handler_test_')
+os.environ.setdefault('WAN_RESULT_CACHE_DIR', os.path.join(_WORKDIR, 'results'))
+os.environ.setdefault('WAN_METRICS_JSONL', os.path.join(_WORKDIR, 'metrics.jsonl'))
+os.environ.setdefault('WAN_METRICS_PROMETHEUS', os.path.join(_WORKDIR, 'metrics.prom'))
+os.environ.setdefault('WAN_GENERATE_SCRIPT', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generate.py'))
+
+import runpod_handler
+
+
+def test_short_client_deadline_is_not_cut_by_the_delivery_margin():
+    deadline = runpod_handler.job_deadline({"input": {"deadline_seconds": 10}})
+    assert 9.0 < deadline.remaining() <= 10.0
+
+
+def test_client_deadline_is_capped_by_the_worker_budget():
+    cap = runpod_handler.JOB_TIMEOUT_SECONDS - runpod_handler.DEADLINE_MARGIN_SECONDS
+    deadline = runpod_handler.job_deadline({"input": {"deadline_seconds": 10 ** 6}})
+    assert cap - 1.0 < deadline.remaining() <= cap
+
+
+@pytest.mark.parametrize("value", [0, -5, "soon", None])
+def test_invalid_client_deadline_falls_back_to_the_worker_budget(value):
+    cap = runpod_handler.JOB_TIMEOUT_SECONDS - runpod_handler.DEADLINE_MARGIN_SECONDS
+    deadline = runpod_handler.job_deadline({"input": {"deadline_seconds": value}})
+    assert deadline.remaining() > cap - 1.0
+
+
+def _media_event(**extra):
+    """A job event with a short silent WAV and a blank PNG"""
+    from generate import write_silent_wav, write_blank_png
+    import base64
+    with tempfile.TemporaryDirectory() as temp_dir:
+        audio_path = os.path.join(temp_dir, 'a.wav')
+        image_path = os.path.join(temp_dir, 'i.png')
+        write_silent_wav(audio_path)
+        write_blank_png(image_path)
+        with open(audio_path, 'rb') as f:
+            audio = base64.b64encode(f.read()).decode()
+        with open(image_path, 'rb') as f:
+            image = base64.b64encode(f.read()).decode()
+    return {"id": None, "input": {"audio_file": audio, "image_file": image,
+                                  "prompt": "test", "resolution": "512*512", **extra}}
+
+
+def _stream(event):
+    import asyncio
+
+    async def collect():
+        return [item async for item in runpod_handler.streaming_handler(event)]
+    return asyncio.run(collect())
+
+
+def test_repeated_streamed_request_still_emits_segments():
+    event = _media_event(prompt="streamed twice", stream_segments=True)
+    for _ in range(2):
+        events = _stream(event)
+        assert events[-1]["type"] == "result" and "error" not in events[-1]
+        segments = [item for item in events if item.get("type") == "segment"]
+        assert segments and all(item["data"] for item in segments)
+        assert events[-1]["cache"]["hit"] is False
+
+
+def test_unstreamed_request_hits_the_cache_a_streamed_one_filled():
+    _stream(_media_event(prompt="streamed then plain", stream_segments=True))
+    response = runpod_handler.handler(_media_event(prompt="streamed then plain"))
+    assert response["cache"]["hit"] is True
+
+
+def _concurrently(fn, count=8):
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(count) as pool:
+        return list(pool.map(lambda _: fn(), range(count)))
+
+
+def test_concurrent_first_jobs_load_one_pipeline(monkeypatch):
+    import time
+    loads = []
+
+    def slow_pipeline(module, import_seconds, device='cuda', memory_budget=None):
+        loads.append(device)
+        time.sleep(0.05)
+        return object()
+
+    monkeypatch.setattr(runpod_handler, '_pipeline', None)
+    monkeypatch.setattr(runpod_handler, 'new_pipeline', slow_pipeline)
+    pipelines = _concurrently(lambda: runpod_handler.get_pipeline(os.environ['WAN_GENERATE_SCRIPT']))
+    assert len(loads) == 1 and len({id(p) for p in pipelines}) == 1
+
+
+def test_concurrent_first_jobs_build_one_device_pool(monkeypatch):
+    from device_pool import Device
+    built = []
+
+    class CountingPool:
+        def __init__(self, devices, pipeline_factory):
+            built.append(devices)
+
+    monkeypatch.setattr(runpod_handler, '_device_pool', None)
+    monkeypatch.setattr(runpod_handler, '_devices', [Device('cpu', 0), Device('cpu', 1)])
+    monkeypatch.setattr(runpod_handler, 'WORKER_MODE', 'subprocess')
+    monkeypatch.setattr(runpod_handler, 'DevicePool', CountingPool)
+    pools = _concurrently(lambda: runpod_handler.get_device_pool(None))
+    assert len(built) == 1 and len({id(p) for p in pools}) == 1
+
+
+def test_concurrent_first_jobs_share_one_result_cache_and_registry(monkeypatch):
+    monkeypatch.setattr(runpod_handler, '_result_cache', None)
+    monkeypatch.setattr(runpod_handler, '_metrics_registry', None)
+    caches = _concurrently(runpod_handler.get_result_cache)
+    registries = _concurrently(runpod_handler.get_metrics_registry)
+    assert len({id(c) for c in caches}) == 1 and caches[0] is not None
+    assert len({id(r) for r in registries}) == 1
+
+
+def test_concurrent_first_batched_jobs_share_one_scheduler(monkeypatch):
+    monkeypatch.setattr(runpod_handler, '_batch_scheduler', None)
+    schedulers = _concurrently(lambda: runpod_handler.get_batch_scheduler(pipeline=None))
+    assert len({id(s) for s in schedulers}) == 1
+
+
+def test_delivery_fields_do_not_change_the_cache_key():
+    runpod_handler.handler(_media_event(prompt="delivery fields"))
+    response = runpod_handler.handler(_media_event(prompt="delivery fields", deadline_seconds=120,
+                                                   allow_partial=True, output_sink='inline'))
+    assert response["cache"]["hit"] is True
+    response = runpod_handler.handler(_media_event(prompt="delivery fields", seed=7))
+    assert response["cache"]["hit"] is False
+
+
+def test_clients_unwrap_the_aggregated_stream():
+    from runpod_client_examples import job_output
+    events = _stream(_media_event(prompt="aggregated stream"))
+    assert len(events) > 1
+    output = job_output({"status": "COMPLETED", "output": events})
+    assert output["success"] is True and output["video_base64"]
+    assert job_output({"output": [{"output": item} for item in events]}) == output
+    assert job_output({"output": {"success": True}}) == {"success": True}
+    assert job_output({"status": "FAILED"}) == {}
+
+
+def test_subprocess_gets_the_remaining_deadline_and_reports_truncation(monkeypatch):
+    import subprocess
+    from deadline import Deadline
+    calls = []
+
+    def fake_run(cmd, timeout=None, **kwargs):
+        calls.append((cmd, timeout))
+        return subprocess.CompletedProcess(cmd, 0, stdout="⏰ Deadline reached, keeping 2/5 clips\n", stderr='')
+
+    monkeypatch.setattr(runpod_handler.subprocess, 'run', fake_run)
+    progress = runpod_handler.ProgressTracker()
+    success, _ = runpod_handler.run_generation_subprocess(
+        'generate.py', 'p', 'i.png', 'a.wav', 'o.mp4', '512*512', deadline=Deadline(30),
+        allow_partial=True, progress=progress)
+
+    cmd, timeout = calls[0]
+    assert success and '--allow_partial' in cmd
+    assert 29 < float(cmd[cmd.index('--timeout') + 1]) <= 30
+    assert timeout > 30 + runpod_handler.SUBPROCESS_KILL_MARGIN_SECONDS - 1
+    assert progress.truncated == {"clips_done": 2, "num_clips": 5}
+
+    expired = Deadline(0)
+    assert runpod_handler.run_generation_subprocess(
+        'generate.py', 'p', 'i.png', 'a.wav', 'o.mp4', '512*512', deadline=expired)[0] is False
+    assert len(calls) == 1
+
+
+def test_device_pool_falls_back_to_subprocess_when_the_pipeline_cannot_load(monkeypatch):
+    from device_pool import Device
+
+    def broken_import(script):
+        raise ImportError("no module named torch")
+
+    monkeypatch.setattr(runpod_handler, '_device_pool', None)
+    monkeypatch.setattr(runpod_handler, '_devices', [Device('cpu', 0), Device('cpu', 1)])
+    monkeypatch.setattr(runpod_handler, 'WORKER_MODE', 'inprocess')
+    monkeypatch.setattr(runpod_handler, 'load_generate_module', broken_import)
+    pool = runpod_handler.get_device_pool('generate.py')
+    try:
+        assert [worker.pipeline for worker in pool.workers] == [None, None]
+    finally:
+        pool.shutdown()
+
+
+def test_truncated_mp3_header_is_a_validation_error():
+    import base64
+    truncated_xing = b'\xff\xfb\x90\x00' + b'\0' * 32 + b'Xing' + b'\0\0'
+    event = _media_event(prompt="truncated mp3")
+    event["input"]["audio_file"] = base64.b64encode(truncated_xing).decode()
+    response = runpod_handler.handler(event)
+    assert "error" in response and not response["error"].startswith("Internal")
+
+
+def _decode(text, chunk_chars, max_bytes=None):
+    import io
+    output = io.BytesIO()
+    runpod_handler.stream_decode_base64(text, output, max_bytes=max_bytes, chunk_chars=chunk_chars)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("chunk_chars", [1, 3, 4, 5, 7, 4096])
+@pytest.mark.parametrize("text, expected", [
+    ("QUJD", b'ABC'),
+    ("QUI=", b'AB'),
+    ("QQ==", b'A'),
+    ("QUJDRA==", b'ABCD'),
+    ("QUJD====", b'ABC'),
+    ("QUJD\nREVG\r\n", b'ABCDEF'),
+    ("  QU JD RE VG SA ==\n", b'ABCDEFH'),
+    ("QU!J*D", b'ABC'),
+    ("data:audio/wav;base64,QUJDREVG", b'ABCDEF'),
+    ("data:image/png;base64,\nQUJD\nREVG", b'ABCDEF'),
+    ("", b''),
+])
+def test_base64_blocks_decode_like_b64decode(text, expected, chunk_chars):
+    assert _decode(text, chunk_chars) == expected
+
+
+@pytest.mark.parametrize("chunk_chars", [1, 4, 5, 4096])
+@pytest.mark.parametrize("text", ["Q", "QUJDR", "QUJDRA", "QUJDRA=", "QQ==QUFB", "QUI=\nQQ=="])
+def test_malformed_base64_is_rejected(text, chunk_chars):
+    import binascii
+    with pytest.raises(binascii.Error):
+        _decode(text, chunk_chars)
+
+
+def test_decoded_size_limit_stops_the_decode(tmp_path):
+    import base64
+    text = base64.b64encode(b'\0' * 100).decode()
+    with pytest.raises(runpod_handler.InputTooLargeError):
+        _decode(text, chunk_chars=8, max_bytes=99)
+    assert len(_decode(text, chunk_chars=8, max_bytes=100)) == 100
+
+    path = str(tmp_path / 'input.bin')
+    with pytest.raises(runpod_handler.InputTooLargeError):
+        runpod_handler.decode_base64_file(text, path, max_bytes=10)
+    assert not os.path.exists(path)
+    assert runpod_handler.decode_base64_file("QUJDR", path) is False
+
+
+def test_job_timeout_comes_from_the_runpod_config(tmp_path):
+    import subprocess
+    import sys
+    config = tmp_path / 'runpod.toml'
+    config.write_text('[timeout]\nhandler_timeout = 42\n')
+    env = {key: value for key, value in os.environ.items() if key != 'WAN_JOB_TIMEOUT_SECONDS'}
+    env['WAN_RUNPOD_CONFIG'] = str(config)
+    script = 'import runpod_handler; print(runpod_handler.JOB_TIMEOUT_SECONDS)'
+
+    result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.stdout.split()[-1] == '42.0'
+
+    env['WAN_JOB_TIMEOUT_SECONDS'] = '90'
+    result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.stdout.split()[-1] == '90.0'
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Local RunPod endpoint emulator command-line tests
+Run: python -m pytest -q test_local_runpod_server.py
+"""
+
+from local_runpod_server import parse_args
+
+CONFIG = """
+[server]
+port = 9123
+
+[scaling]
+max_workers = 3
+
+[timeout]
+max_execution_time = 42
+"""
+
+
+def test_defaults_come_from_the_config_file(tmp_path):
+    path = tmp_path / "runpod.toml"
+    path.write_text(CONFIG)
+    args, config = parse_args(['--config', str(path)])
+    assert (args.port, args.workers, args.execution_timeout) == (9123, 3, 42)
+    assert config['server']['port'] == 9123
+
+
+def test_flags_override_the_config_file(tmp_path):
+    path = tmp_path / "runpod.toml"
+    path.write_text(CONFIG)
+    args, _ = parse_args(['--port', '8001', '--config', str(path)])
+    assert (args.port, args.workers) == (8001, 3)
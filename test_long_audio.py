@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Long-audio segment planning and stitching tests (mock workers, CPU only)
+Run: python -m pytest -q test_long_audio.py
+"""
+
+import wave
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from long_audio import (MODEL_FPS, LongAudioError, MockWorker, crossfade_weights, generate_long,
+                        plan_segments, stitch_frames)
+
+
+def _write_wav(path, seconds, rate=16000):
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b'\0\0' * int(seconds * rate))
+    return str(path)
+
+
+def test_segments_cover_the_audio_without_gaps():
+    segments = plan_segments(60.0, 19.0, overlap_seconds=1.0)
+    assert len(segments) == 4
+    assert segments[0].start == 0.0 and segments[-1].end == 60.0
+    for previous, segment in zip(segments, segments[1:]):
+        assert segment.start == previous.end
+        assert segment.lead_in == 1.0 and segment.depends_on == previous.index
+    assert all(s.end - s.start <= 19.0 for s in segments)
+    assert segments[0].lead_in == 0.0 and segments[0].depends_on is None
+
+
+def test_chains_start_from_the_image_and_are_contiguous():
+    segments = plan_segments(100.0, 10.0, chains=3)
+    heads = [s.index for s in segments if s.depends_on is None]
+    assert heads == [0, 3, 7]
+    assert [s.chain for s in segments] == [0, 0, 0, 1, 1, 1, 1, 2, 2, 2]
+    # More chains than segments collapse to one chain per segment
+    assert [s.chain for s in plan_segments(20.0, 10.0, chains=5)] == [0, 1]
+
+
+def test_boundaries_snap_to_a_pause_within_the_slack():
+    window = 0.05
+    loudness = np.ones(int(30 / window))
+    loudness[int(14.6 / window)] = 0.0
+    segments = plan_segments(30.0, 16.0, envelope=(window, loudness))
+    assert segments[0].end == pytest.approx(14.625)
+    # A pause farther than the slack allows is ignored
+    segments = plan_segments(30.0, 15.2, envelope=(window, loudness))
+    assert segments[0].end == pytest.approx(15.0, abs=0.1)
+    assert all(s.end - s.start <= 15.2 for s in segments)
+
+
+@pytest.mark.parametrize("duration, segment_seconds", [(0, 10), (10, 0)])
+def test_plan_rejects_empty_input(duration, segment_seconds):
+    with pytest.raises(LongAudioError):
+        plan_segments(duration, segment_seconds)
+
+
+def test_stitch_crossfades_the_lead_in():
+    first = np.zeros((32, 2, 2, 3), dtype=np.float32)
+    second = np.full((24, 2, 2, 3), 10.0, dtype=np.float32)
+    video = stitch_frames([first, second], [0.0, 0.5])
+    overlap = int(0.5 * MODEL_FPS)
+    assert len(video) == len(first) + len(second) - overlap
+    assert np.all(video[:32 - overlap] == 0) and np.all(video[32:] == 10)
+    blended = video[32 - overlap:32, 0, 0, 0]
+    assert np.allclose(blended, 10 * crossfade_weights(overlap))
+    assert np.all(np.diff(blended) > 0)
+
+
+def test_long_audio_renders_every_frame_once(tmp_path):
+    audio = _write_wav(tmp_path / 'talk.wav', 20.0)
+    output = str(tmp_path / 'talk.npy')
+    workers = [MockWorker('a'), MockWorker('b')]
+    report = generate_long(audio, output, workers, segment_seconds=6.0, work_dir=str(tmp_path / 'work'))
+    assert len(report["segments"]) == 4
+    assert {item["worker"] for item in report["segments"]} == {'a', 'b'}
+    assert len(np.load(output)) == 20 * MODEL_FPS
+
+
+def test_failed_segment_is_retried_then_gives_up(tmp_path):
+    audio = _write_wav(tmp_path / 'talk.wav', 8.0)
+    calls = []
+
+    class FlakyWorker(MockWorker):
+        def __call__(self, segment, audio_path, motion_path, output_path):
+            calls.append(segment.index)
+            if segment.index == 1 and calls.count(1) < self.failures + 1:
+                raise RuntimeError("worker lost")
+            return super().__call__(segment, audio_path, motion_path, output_path)
+
+    worker = FlakyWorker()
+    worker.failures = 1
+    generate_long(audio, str(tmp_path / 'ok.npy'), [worker], segment_seconds=5.0, attempts=2)
+    assert calls == [0, 1, 1]
+
+    worker.failures = 2
+    calls.clear()
+    with pytest.raises(LongAudioError):
+        generate_long(audio, str(tmp_path / 'fail.npy'), [worker], segment_seconds=5.0, attempts=2)
+
+
+def test_failing_segment_does_not_wait_for_the_other_chains(tmp_path):
+    import threading
+    import time
+    audio = _write_wav(tmp_path / 'talk.wav', 12.0)
+    release = threading.Event()
+
+    class StuckOrBrokenWorker(MockWorker):
+        def __call__(self, segment, audio_path, motion_path, output_path):
+            if segment.chain == 0:
+                raise RuntimeError("worker lost")
+            release.wait(10)
+            return super().__call__(segment, audio_path, motion_path, output_path)
+
+    workers = [StuckOrBrokenWorker('a'), StuckOrBrokenWorker('b')]
+    start = time.perf_counter()
+    try:
+        with pytest.raises(LongAudioError, match="segment 0 failed"):
+            generate_long(audio, str(tmp_path / 'fail.npy'), workers, segment_seconds=5.0,
+                          chains=2, work_dir=str(tmp_path / 'work'), attempts=1)
+        assert time.perf_counter() - start < 5
+    finally:
+        release.set()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Header probe tests on small synthetic WAV/FLAC/MP3/PNG/JPEG files
+Run: python -m pytest -q test_media_probe.py
+"""
+
+import struct
+import wave
+
+import pytest
+
+from media_probe import MediaProbeError, probe_audio, probe_image, sniff_format
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo: 417-byte frames
+MP3_FRAME_HEADER = b'\xff\xfb\x90\x00'
+MP3_FRAME_BYTES = 417
+MP3_SIDE_INFO = 32
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def wav_file(tmp_path, seconds=2.0, rate=16000, channels=1):
+    path = str(tmp_path / 'audio.wav')
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b'\0\0' * channels * int(seconds * rate))
+    return path
+
+
+def flac_bytes(rate=44100, channels=2, bits=16, samples=441000):
+    packed = (rate << 44) | ((channels - 1) << 41) | ((bits - 1) << 36) | samples
+    streaminfo = b'\0' * 10 + packed.to_bytes(8, 'big') + b'\0' * 16
+    return b'fLaC' + bytes([0x80, 0, 0, 34]) + streaminfo
+
+
+def xing_frame(frames):
+    body = b'\0' * MP3_SIDE_INFO + b'Xing' + struct.pack('>II', 0x1, frames)
+    return MP3_FRAME_HEADER + body + b'\0' * (MP3_FRAME_BYTES - 4 - len(body))
+
+
+def png_bytes(width, height):
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr + b'\0' * 4
+
+
+def jpeg_bytes(width, height, sof=0xC0):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\0' + b'\0' * 9
+    frame = b'\xff' + bytes([sof]) + struct.pack('>HBHHB', 17, 8, height, width, 3) + b'\0' * 9
+    return b'\xff\xd8' + app0 + frame + b'\xff\xda' + b'\0' * 16 + b'\xff\xd9'
+
+
+def test_wav_duration_from_the_data_chunk(tmp_path):
+    info = probe_audio(wav_file(tmp_path, seconds=2.5, rate=22050, channels=2))
+    assert (info["format"], info["codec"], info["sample_rate"], info["channels"]) == ('wav', 'pcm', 22050, 2)
+    assert info["duration_seconds"] == pytest.approx(2.5)
+
+
+def test_wav_with_extra_chunks_and_a_streaming_size(tmp_path):
+    fmt = struct.pack('<HHIIHH', 1, 1, 8000, 16000, 2, 16)
+    data = b'\0' * 16000
+    body = (b'WAVE' + b'LIST' + struct.pack('<I', 3) + b'abc\0'
+            + b'fmt ' + struct.pack('<I', 16) + fmt
+            + b'data' + struct.pack('<I', 0xFFFFFFFF) + data)
+    path = write(tmp_path, 'stream.wav', b'RIFF' + struct.pack('<I', 0) + body)
+    assert probe_audio(path)["duration_seconds"] == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("data, message", [
+    (b'RIFF\0\0\0\0WAVE', 'no fmt chunk'),
+    (b'RIFF\0\0\0\0WAVEfmt ' + struct.pack('<I', 8) + b'\0' * 8, 'too short'),
+    (b'RIFF\0\0\0\0WAVEfmt ' + struct.pack('<I', 16) + b'\0' * 6, 'truncated'),
+])
+def test_broken_wav_is_rejected(tmp_path, data, message):
+    with pytest.raises(MediaProbeError, match=message):
+        probe_audio(write(tmp_path, 'bad.wav', data))
+
+
+def test_flac_streaminfo(tmp_path):
+    info = probe_audio(write(tmp_path, 'a.flac', flac_bytes()))
+    assert (info["sample_rate"], info["channels"], info["bits_per_sample"]) == (44100, 2, 16)
+    assert info["duration_seconds"] == pytest.approx(10.0)
+
+
+def test_truncated_flac_is_rejected(tmp_path):
+    with pytest.raises(MediaProbeError, match='truncated'):
+        probe_audio(write(tmp_path, 'a.flac', flac_bytes()[:20]))
+
+
+def test_cbr_mp3_duration_from_the_bitrate(tmp_path):
+    frame = MP3_FRAME_HEADER + b'\0' * (MP3_FRAME_BYTES - 4)
+    id3 = b'ID3\x03\x00\x00' + bytes([0, 0, 0, 20]) + b'\0' * 20
+    info = probe_audio(write(tmp_path, 'a.mp3', id3 + frame * 100))
+    assert (info["sample_rate"], info["channels"], info["bitrate"]) == (44100, 2, 128000)
+    assert info["duration_seconds"] == pytest.approx(100 * MP3_FRAME_BYTES * 8 / 128000)
+
+
+def test_xing_mp3_duration_from_the_frame_count(tmp_path):
+    info = probe_audio(write(tmp_path, 'a.mp3', xing_frame(1000) + MP3_FRAME_HEADER + b'\0' * 413))
+    assert info["duration_seconds"] == pytest.approx(1000 * 1152 / 44100)
+
+
+@pytest.mark.parametrize("size", [42, 46, 4 + MP3_SIDE_INFO + 4])
+def test_truncated_xing_header_is_a_probe_error(tmp_path, size):
+    with pytest.raises(MediaProbeError):
+        probe_audio(write(tmp_path, 'a.mp3', xing_frame(1000)[:size]))
+
+
+def test_truncated_vbri_header_is_a_probe_error(tmp_path):
+    data = MP3_FRAME_HEADER + b'\0' * 32 + b'VBRI' + b'\0' * 6
+    with pytest.raises(MediaProbeError):
+        probe_audio(write(tmp_path, 'a.mp3', data))
+
+
+def test_mp3_without_a_frame_is_rejected(tmp_path):
+    with pytest.raises(MediaProbeError, match='no MPEG Layer III frame'):
+        probe_audio(write(tmp_path, 'a.mp3', b'ID3\x03\x00\x00\0\0\0\0' + b'\xff\x00' * 50))
+
+
+def test_png_dimensions(tmp_path):
+    info = probe_image(write(tmp_path, 'a.png', png_bytes(1024, 704)))
+    assert (info["format"], info["width"], info["height"]) == ('png', 1024, 704)
+    with pytest.raises(MediaProbeError, match='truncated'):
+        probe_image(write(tmp_path, 'b.png', png_bytes(1024, 704)[:20]))
+
+
+@pytest.mark.parametrize("sof, progressive", [(0xC0, False), (0xC2, True)])
+def test_jpeg_dimensions_from_the_frame_header(tmp_path, sof, progressive):
+    info = probe_image(write(tmp_path, 'a.jpg', jpeg_bytes(640, 480, sof)))
+    assert (info["width"], info["height"], info["progressive"]) == (640, 480, progressive)
+
+
+@pytest.mark.parametrize("data, message", [
+    (jpeg_bytes(640, 480)[:24], 'truncated'),
+    (b'\xff\xd8\xff\xda' + b'\0' * 16, 'no frame header'),
+    (b'\xff\xd8\xff\xe0\x00\x01', 'segment length'),
+    (b'\xff\xd8\xff\xe0\x00\x04\0\0\x00', 'corrupt JPEG marker'),
+])
+def test_broken_jpeg_is_rejected(tmp_path, data, message):
+    with pytest.raises(MediaProbeError, match=message):
+        probe_image(write(tmp_path, 'bad.jpg', data))
+
+
+@pytest.mark.parametrize("data", [b'', b'garbage bytes!', b'\x00' * 64])
+def test_garbage_is_an_unsupported_format(tmp_path, data):
+    path = write(tmp_path, 'garbage', data)
+    assert sniff_format(path) is None
+    with pytest.raises(MediaProbeError, match='unsupported'):
+        probe_audio(path)
+    with pytest.raises(MediaProbeError, match='unsupported'):
+        probe_image(path)
+
+
+def test_an_image_is_not_accepted_as_audio(tmp_path):
+    with pytest.raises(MediaProbeError, match='unsupported audio'):
+        probe_audio(write(tmp_path, 'a.png', png_bytes(8, 8)))
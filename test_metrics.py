@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Stage timing, histogram and metrics export tests
+Run: python -m pytest -q test_metrics.py
+"""
+
+import json
+
+from metrics import NULL_TIMINGS, Histogram, MetricsRegistry, StageTimings, stage_timer
+
+
+class TestHistogram:
+    def test_each_value_lands_in_its_smallest_bucket(self):
+        histogram = Histogram(buckets=(1, 5, 10))
+        for value in (0.5, 1, 3, 7, 50):
+            histogram.observe(value)
+
+        assert histogram.counts == [2, 1, 1]
+        assert list(histogram.cumulative()) == [(1, 2), (5, 3), (10, 4)]
+        assert histogram.count == 5
+        assert histogram.sum == 61.5
+
+
+class TestStageTimings:
+    def test_repeated_stages_are_summed_and_counted(self):
+        timings = StageTimings()
+        timings.add('denoise_step', 0.25)
+        timings.add('denoise_step', 0.5)
+        with timings.stage('encode'):
+            pass
+
+        result = timings.as_dict()
+        assert result["stages"]["denoise_step"] == 0.75
+        assert list(result["stages"]) == ['denoise_step', 'encode']
+        assert result["counts"] == {"denoise_step": 2}
+
+    def test_stage_is_recorded_when_it_raises(self):
+        timings = StageTimings()
+        try:
+            with timings.stage('decode'):
+                raise ValueError("bad input")
+        except ValueError:
+            pass
+        assert len(timings.samples['decode']) == 1
+
+    def test_null_timings_and_missing_timings_record_nothing(self):
+        with stage_timer(None, 'decode'), stage_timer(NULL_TIMINGS, 'decode'):
+            NULL_TIMINGS.add('decode', 1.0)
+        assert NULL_TIMINGS.as_dict() is None
+        assert NULL_TIMINGS.samples == {}
+
+
+class TestMetricsRegistry:
+    def _timings(self, **stages):
+        timings = StageTimings()
+        for name, seconds in stages.items():
+            timings.add(name, seconds)
+        return timings
+
+    def test_prometheus_export_counts_jobs_and_stage_buckets(self, tmp_path):
+        path = tmp_path / 'metrics.prom'
+        registry = MetricsRegistry(prometheus_path=str(path), buckets=(0.1, 1))
+        registry.record(self._timings(decode=0.05, denoise=0.5))
+        registry.record(self._timings(decode=2.0), status='error')
+
+        lines = path.read_text().splitlines()
+        assert 'wan_jobs_total{status="error"} 1' in lines
+        assert 'wan_jobs_total{status="success"} 1' in lines
+        assert 'wan_stage_duration_seconds_bucket{stage="decode",le="0.1"} 1' in lines
+        assert 'wan_stage_duration_seconds_bucket{stage="decode",le="1"} 1' in lines
+        assert 'wan_stage_duration_seconds_bucket{stage="decode",le="+Inf"} 2' in lines
+        assert 'wan_stage_duration_seconds_count{stage="denoise"} 1' in lines
+        assert 'wan_job_duration_seconds_count 2' in lines
+        assert not list(tmp_path.glob('*.tmp'))
+
+    def test_jsonl_export_appends_one_record_per_job(self, tmp_path):
+        path = tmp_path / 'metrics.jsonl'
+        registry = MetricsRegistry(jsonl_path=str(path))
+        registry.record(self._timings(decode=0.5), labels={"job_id": "a"})
+        registry.record(self._timings(decode=0.25), status='cancelled', labels={"job_id": "b"})
+
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [(r["job_id"], r["status"]) for r in records] == [("a", "success"), ("b", "cancelled")]
+        assert records[1]["stages"] == {"decode": 0.25}
+
+    def test_disabled_timings_are_not_recorded(self, tmp_path):
+        registry = MetricsRegistry(jsonl_path=str(tmp_path / 'metrics.jsonl'))
+        registry.record(NULL_TIMINGS)
+        assert registry.jobs == {}
+        assert not (tmp_path / 'metrics.jsonl').exists()
+
+    def test_unwritable_export_does_not_fail_the_job(self, tmp_path, capsys):
+        registry = MetricsRegistry(jsonl_path=str(tmp_path / 'missing' / 'metrics.jsonl'))
+        registry.record(self._timings(decode=0.5))
+        assert registry.jobs == {"success": 1}
+        assert "Could not write metrics" in capsys.readouterr().out
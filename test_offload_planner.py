@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Offload planner tests with simulated memory budgets (CPU only)
+Run: python -m pytest -q test_offload_planner.py
+"""
+
+import pytest
+
+from offload_planner import (GB, ModuleSpec, OffloadPlanError, OffloadPlanner, Prefetcher,
+                             peak_bytes, successor)
+
+# Wan-S2V-14B-like sizes in bfloat16
+ACTIVATIONS = {'dit': int(3.4 * GB), 'vae': int(2.1 * GB)}
+
+
+def wan_modules(blocks=40):
+    names = [('text_encoder', 'text_encoder', 11.4), ('audio_encoder', 'audio_encoder', 1.2),
+             ('vae', 'vae', 0.5), ('dit.patch_embedding', 'dit', 0.2)]
+    names += [(f"dit.blocks.{i}", 'dit', 0.68) for i in range(blocks)]
+    names += [('dit.head', 'dit', 0.01)]
+    return [ModuleSpec(name, component, int(gb * GB), order) for order, (name, component, gb) in enumerate(names)]
+
+
+def planner(mode='auto'):
+    return OffloadPlanner(wan_modules(), mode=mode, host_limit_bytes=128 * GB)
+
+
+def by_name(modules, name):
+    return next(module for module in modules if module.name == name)
+
+
+def test_large_card_keeps_everything_resident():
+    plan = planner().plan('sim', '1024*704', 80 * GB, ACTIVATIONS)
+    assert not plan.offloaded
+    assert plan.transfer_bytes_per_clip() == 0
+
+
+@pytest.mark.parametrize("budget_gb", [16, 24, 40])
+def test_plan_fits_the_budget(budget_gb):
+    plan = planner().plan('sim', '1024*704', budget_gb * GB, ACTIVATIONS)
+    assert plan.peak_bytes + plan.reserve_bytes <= budget_gb * GB
+    assert plan.offloaded
+    # Encoders go before any DiT block
+    offloaded = set(plan.prefetch_order)
+    assert 'text_encoder' in offloaded and 'audio_encoder' in offloaded
+
+
+def test_more_memory_keeps_more_resident():
+    resident = [planner().plan('sim', '1024*704', gb * GB, ACTIVATIONS).resident_bytes for gb in (16, 24, 40, 80)]
+    assert resident == sorted(resident) and resident[0] < resident[-1]
+
+
+def test_24gb_card_is_not_limited_by_a_wrap_around_prefetch():
+    plan = planner().plan('sim', '1024*704', 24 * GB, ACTIVATIONS)
+    # The text encoder phase (11.4 + 1.2 GB prefetched) is the real limit, not
+    # a text encoder copy prefetched after the last DiT block
+    encoder_phase = int((11.4 + 1.2) * GB)
+    room = 24 * GB - plan.reserve_bytes - encoder_phase
+    # Filled up to within one block of the room the encoder phase leaves
+    assert room - int(0.68 * GB) <= plan.resident_bytes <= room
+
+
+def test_too_small_budget_raises():
+    with pytest.raises(OffloadPlanError):
+        planner().plan('sim', '1024*704', 8 * GB, ACTIVATIONS)
+
+
+def test_pipeline_falls_back_to_full_residency_when_nothing_fits(tmp_path, capsys):
+    from generate import S2VPipeline
+    pipeline = S2VPipeline(str(tmp_path), memory_budget=8 * GB)
+    pipeline.planner = planner()
+
+    plan = pipeline.offload_plan('1024*704')
+    assert not plan.offloaded and len(plan.resident) == len(wan_modules())
+    assert "keeping every module resident" in capsys.readouterr().out
+    # The fallback is cached, so later jobs at this size do not re-plan or warn
+    assert pipeline.offload_plan('1024*704') is plan
+    assert "resident" not in capsys.readouterr().out
+
+
+def test_forced_modes():
+    assert not planner(True).plan('sim', '512*512', 80 * GB, ACTIVATIONS).resident
+    assert not planner(False).plan('sim', '512*512', 8 * GB, ACTIVATIONS).offloaded
+
+
+def test_plans_are_cached_per_device_and_resolution():
+    p = planner()
+    plan = p.plan('cuda:0', '1024*704', 24 * GB, ACTIVATIONS)
+    assert p.plan('cuda:0', '1024*704', 80 * GB, ACTIVATIONS) is plan
+    assert p.plan('cuda:1', '1024*704', 80 * GB, ACTIVATIONS) is not plan
+    assert p.plan('cuda:0', '512*512', 24 * GB, ACTIVATIONS) is not plan
+
+
+def test_successor_follows_the_step_loop():
+    modules = wan_modules(blocks=4)
+    offloaded = [by_name(modules, name) for name in
+                 ('text_encoder', 'audio_encoder', 'vae', 'dit.blocks.2', 'dit.blocks.3')]
+    names = lambda module: module.name if module else None
+    assert names(successor(offloaded, 'text_encoder')) == 'audio_encoder'
+    assert names(successor(offloaded, 'vae')) == 'dit.blocks.2'
+    # The last offloaded block prefetches the next step's first one, not the text encoder
+    assert names(successor(offloaded, 'dit.blocks.3')) == 'dit.blocks.2'
+    # The decode ends the job
+    assert successor(offloaded, 'vae', decoding=True) is None
+
+
+def test_peak_has_no_text_encoder_wrap_around():
+    modules = wan_modules(blocks=4)
+    offloaded = [by_name(modules, name) for name in ('text_encoder', 'dit.blocks.3')]
+    resident = [module for module in modules if module not in offloaded]
+    base = sum(module.weight_bytes for module in resident)
+    text_encoder = by_name(modules, 'text_encoder').weight_bytes
+    block = by_name(modules, 'dit.blocks.3').weight_bytes
+    # The text encoder phase prefetches the block; the block phase prefetches only itself again
+    assert peak_bytes(resident, offloaded, ACTIVATIONS) == max(
+        base + ACTIVATIONS['dit'], base + text_encoder + block, base + block + ACTIVATIONS['dit'])
+
+
+def test_prefetcher_streams_in_step_order():
+    torch = pytest.importorskip("torch")
+    modules = wan_modules(blocks=3)
+    layers = {module.name: torch.nn.Linear(4, 4) for module in modules}
+    plan = OffloadPlanner(modules, mode=True, host_limit_bytes=128 * GB).plan('cpu', '512*512', 80 * GB, ACTIVATIONS)
+
+    prefetcher = Prefetcher(layers, 'cpu')
+    prefetcher.apply(plan)
+    fetched = []
+    prefetch = prefetcher.prefetch
+    prefetcher.prefetch = lambda name: (fetched.append(name), prefetch(name))
+
+    x = torch.zeros(1, 4)
+    for name in ('text_encoder', 'audio_encoder', 'vae'):
+        layers[name](x)
+    for _ in range(2):
+        for name in ('dit.patch_embedding', 'dit.blocks.0', 'dit.blocks.1', 'dit.blocks.2', 'dit.head'):
+            layers[name](x)
+    prefetcher.before_decode()
+    layers['vae'](x)
+
+    assert 'text_encoder' not in fetched[1:]
+    assert fetched.count('dit.patch_embedding') >= 2
+    assert fetched[-1] == 'vae'
+    assert not prefetcher.inflight and not prefetcher.decoding
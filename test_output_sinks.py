@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Output sink tests; S3 uploads go to an in-memory S3 stand-in, or to a real
+moto server through boto3 when both are installed
+Run: python -m pytest -q test_output_sinks.py
+"""
+
+import base64
+
+import pytest
+
+from output_sinks import MIN_PART_SIZE, InlineBase64Sink, LocalFileSink, S3Sink, get_output_sink
+
+
+class FakeS3:
+    """The multipart-upload subset of a boto3 S3 client, kept in memory like a local MinIO"""
+
+    def __init__(self, fail_on_part=None, fail_abort=False):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.fail_on_part = fail_on_part
+        self.fail_abort = fail_abort
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.fail_on_part:
+            raise ConnectionError("connection reset")
+        self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        for part in MultipartUpload["Parts"][:-1]:
+            assert len(parts[part["PartNumber"]]) >= MIN_PART_SIZE
+        self.objects[(Bucket, Key)] = b''.join(parts[p["PartNumber"]] for p in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        if self.fail_abort:
+            raise TimeoutError("abort timed out")
+        self.uploads.pop(UploadId)
+        self.aborted.append(Key)
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://s3.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+def _video(tmp_path, size):
+    path = tmp_path / 'out.mp4'
+    path.write_bytes(bytes(range(256)) * (size // 256) + b'\1' * (size % 256))
+    return str(path)
+
+
+def test_inline_sink_matches_a_one_shot_encode(tmp_path):
+    video = _video(tmp_path, 3 * 256 * 1024 + 1000)
+    with open(video, 'rb') as f:
+        expected = base64.b64encode(f.read()).decode('ascii')
+    assert InlineBase64Sink().deliver(video, 'req')["video_base64"] == expected
+
+
+def test_local_sink_moves_the_video(tmp_path):
+    video = _video(tmp_path, 1000)
+    result = LocalFileSink(str(tmp_path / 'volume'), url_prefix='https://files/').deliver(video, 'req')
+    assert result == {"video_path": str(tmp_path / 'volume' / 'req.mp4'), "video_url": "https://files/req.mp4"}
+
+
+def test_s3_upload_is_split_into_parts(tmp_path):
+    video = _video(tmp_path, 2 * MIN_PART_SIZE + 123)
+    s3 = FakeS3()
+    sink = S3Sink('bucket', prefix='/wan/', part_size=1, client=s3)
+    result = sink.deliver(video, 'req')
+    with open(video, 'rb') as f:
+        assert s3.objects[('bucket', 'wan/req.mp4')] == f.read()
+    assert result["video_key"] == 'wan/req.mp4'
+    assert result["video_url"].startswith('https://s3.local/bucket/wan/req.mp4')
+
+
+def test_s3_upload_of_an_empty_video_sends_one_part(tmp_path):
+    s3 = FakeS3()
+    assert S3Sink('bucket', client=s3).upload(_video(tmp_path, 0), 'empty.mp4') == 1
+    assert s3.objects[('bucket', 'empty.mp4')] == b''
+
+
+def test_failed_s3_upload_is_aborted(tmp_path):
+    s3 = FakeS3(fail_on_part=2)
+    sink = S3Sink('bucket', public_url='https://cdn/', part_size=1, client=s3)
+    with pytest.raises(ConnectionError):
+        sink.deliver(_video(tmp_path, MIN_PART_SIZE + 1), 'req')
+    assert s3.aborted == ['req.mp4'] and not s3.uploads and not s3.objects
+
+
+def test_failed_abort_keeps_the_upload_error(tmp_path, capsys):
+    s3 = FakeS3(fail_on_part=2, fail_abort=True)
+    sink = S3Sink('bucket', part_size=1, client=s3)
+    with pytest.raises(ConnectionError, match="connection reset"):
+        sink.upload(_video(tmp_path, MIN_PART_SIZE + 1), 'req.mp4')
+    assert "Could not abort multipart upload upload-0" in capsys.readouterr().out
+
+
+def test_s3_sink_needs_a_bucket(monkeypatch):
+    monkeypatch.delenv('S3_BUCKET', raising=False)
+    with pytest.raises(ValueError):
+        get_output_sink('s3')
+    with pytest.raises(ValueError):
+        get_output_sink('ftp')
+
+
+def test_s3_upload_through_boto3(tmp_path):
+    boto3 = pytest.importorskip("boto3")
+    server = pytest.importorskip("moto.server")
+    moto = server.ThreadedMotoServer(ip_address='127.0.0.1', port=0)
+    moto.start()
+    try:
+        host, port = moto.get_host_and_port()
+        client = boto3.client('s3', endpoint_url=f"http://{host}:{port}", region_name='us-east-1',
+                              aws_access_key_id='test', aws_secret_access_key='test')
+        client.create_bucket(Bucket='videos')
+        video = _video(tmp_path, MIN_PART_SIZE + 4096)
+        result = S3Sink('videos', prefix='wan', client=client).deliver(video, 'req')
+        with open(video, 'rb') as f:
+            assert client.get_object(Bucket='videos', Key=result["video_key"])['Body'].read() == f.read()
+    finally:
+        moto.stop()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Result cache tests: content-addressed keys and size-bounded LRU eviction
+Run: python -m pytest -q test_result_cache.py
+"""
+
+import os
+
+from result_cache import ResultCache, cache_key
+
+
+def _video(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b'\0' * size)
+    return str(path)
+
+
+def _age(cache, key, seconds_ago):
+    path = cache.path_for(key)
+    mtime = os.stat(path).st_mtime - seconds_ago
+    os.utime(path, (mtime, mtime))
+
+
+def test_key_ignores_digest_order_but_not_values():
+    params = {"prompt": "hi", "resolution": "1024*704"}
+    key = cache_key({"audio": "a", "image": "i"}, params)
+    assert key == cache_key({"image": "i", "audio": "a"}, dict(reversed(params.items())))
+    assert key != cache_key({"audio": "a", "image": "j"}, params)
+    assert key != cache_key({"audio": "a", "image": "i"}, {**params, "prompt": "hello"})
+
+
+def test_put_evicts_least_recently_used_videos(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=250)
+    source = _video(tmp_path, 'v.mp4', 100)
+    cache.put('old', source)
+    cache.put('newer', source)
+    _age(cache, 'old', 20)
+    _age(cache, 'newer', 10)
+
+    cache.put('newest', source)
+
+    assert sorted(os.path.basename(p) for _, _, p in cache.entries()) == ['newer.mp4', 'newest.mp4']
+
+
+def test_hit_refreshes_recency(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=250)
+    source = _video(tmp_path, 'v.mp4', 100)
+    cache.put('old', source)
+    cache.put('newer', source)
+    _age(cache, 'old', 20)
+    _age(cache, 'newer', 10)
+
+    assert cache.get('old', str(tmp_path / 'out.mp4'))
+    cache.put('newest', source)
+
+    assert not os.path.exists(cache.path_for('newer'))
+    assert os.path.exists(cache.path_for('old'))
+    assert cache.stats() == {"hits": 1, "misses": 0}
+
+
+def test_video_larger_than_the_cache_is_not_kept(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=50)
+    cache.put('big', _video(tmp_path, 'v.mp4', 100))
+    assert cache.entries() == []
+    assert not cache.get('big', str(tmp_path / 'out.mp4'))
+    assert cache.stats() == {"hits": 0, "misses": 1}
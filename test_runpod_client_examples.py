@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Client module tests
+Run: python -m pytest -q test_runpod_client_examples.py
+"""
+
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Repo modules RunPodClient must not need when copied into another project
+OPTIONAL_MODULES = ['autoscale_simulator', 'runpod_config', 'output_sinks',
+                       'input_normalizer', 'media_probe']
+
+
+def test_client_imports_without_the_other_repo_modules():
+    # A None entry in sys.modules makes any import of that module fail
+    script = (
+        f"import sys\n"
+        f"for name in {OPTIONAL_MODULES!r}:\n"
+        f"    sys.modules[name] = None\n"
+        f"from runpod_client_examples import RunPodClient\n"
+        f"RunPodClient('http://localhost:8000/runsync')\n"
+    )
+    result = subprocess.run([sys.executable, '-c', script], cwd=HERE, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+runpod.toml loading tests
+Run: python -m pytest -q test_runpod_config.py
+"""
+
+import os
+
+from runpod_config import config_value, load_runpod_config
+
+REPO_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runpod.toml')
+
+
+def test_repo_config_parses_with_comments_and_multiline_arrays():
+    config = load_runpod_config(REPO_CONFIG)
+
+    assert config_value(config, 'timeout', 'handler_timeout') == 300
+    assert config_value(config, 'scaling', 'min_replicas') == 0
+    assert config_value(config, 'billing', 'max_cost_per_hour') == 5.0
+    assert config_value(config, 'monitoring', 'enable_metrics') is True
+    assert config["build"]["commands"] == ["pip install --upgrade pip", "pip install -r requirements.txt"]
+
+
+def test_missing_file_gives_an_empty_config(tmp_path):
+    config = load_runpod_config(str(tmp_path / 'absent.toml'))
+
+    assert config == {}
+    assert config_value(config, 'timeout', 'handler_timeout', 300) == 300
+
+
+def test_missing_key_falls_back_to_the_default(tmp_path):
+    path = tmp_path / 'runpod.toml'
+    path.write_text('[timeout]\nrequest_timeout = 10  # seconds\n')
+    config = load_runpod_config(str(path))
+
+    assert config_value(config, 'timeout', 'request_timeout') == 10
+    assert config_value(config, 'timeout', 'handler_timeout', 300) == 300
+    assert config_value(config, 'queue', 'max_queue_size') is None
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Converted-weights snapshot tests that need no torch: the safetensors file
+format, cache lookup and eviction, and the fallbacks on unusable files
+Run: python -m pytest -q test_weight_cache.py
+"""
+
+import json
+import os
+import struct
+import zipfile
+
+import pytest
+
+from checkpoint_manifest import CheckpointError, read_safetensors_header
+from weight_cache import (WeightCache, dtype_info, load_snapshot, load_torch_shard, snapshot_header,
+                          write_snapshot)
+
+SPECS = [("blocks.0.weight", 'BF16', [2, 3], 12), ("blocks.0.bias", 'F32', [3], 12), ("empty", 'I8', [0], 0)]
+DATA = {"blocks.0.weight": bytes(range(12)), "blocks.0.bias": b'\x01' * 12, "empty": b''}
+
+MANIFEST = {"hash": 'ab' * 32, "ckpt_dir": '/ckpt', "shards": []}
+
+
+class FakeTorch:
+    """Records torch.load calls; the snapshot loader must not get as far as building tensors"""
+
+    def __init__(self, mmap_supported=True):
+        self.mmap_supported = mmap_supported
+        self.loads = []
+
+    def load(self, path, map_location=None, weights_only=False, **kwargs):
+        if 'mmap' in kwargs and not self.mmap_supported:
+            raise TypeError("load() got an unexpected keyword argument 'mmap'")
+        self.loads.append(kwargs.get('mmap', False))
+        return {}
+
+
+def test_header_aligns_tensor_data_to_8_bytes():
+    header = snapshot_header(SPECS)
+    assert len(header) % 8 == 0
+    assert struct.unpack('<Q', header[:8])[0] == len(header) - 8
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'w.safetensors')
+    write_snapshot(path, SPECS, DATA.__getitem__)
+
+    size = os.path.getsize(path)
+    table = read_safetensors_header(path, size)
+    assert table["blocks.0.weight"] == {"dtype": 'BF16', "shape": [2, 3], "data_offsets": [0, 12]}
+    assert table["blocks.0.bias"]["data_offsets"] == [12, 24]
+    with open(path, 'rb') as f:
+        f.seek(len(snapshot_header(SPECS)))
+        assert f.read() == DATA["blocks.0.weight"] + DATA["blocks.0.bias"]
+
+
+def test_snapshot_is_readable_by_safetensors(tmp_path):
+    numpy_io = pytest.importorskip("safetensors.numpy")
+    np = pytest.importorskip("numpy")
+    specs = [("x", 'F32', [2, 2], 16)]
+    path = str(tmp_path / 'w.safetensors')
+    write_snapshot(path, specs, lambda name: np.arange(4, dtype=np.float32).tobytes())
+    assert numpy_io.load_file(path)["x"].tolist() == [[0, 1], [2, 3]]
+
+
+def test_short_tensor_leaves_no_file(tmp_path):
+    path = str(tmp_path / 'w.safetensors')
+    with pytest.raises(CheckpointError, match='expected 12'):
+        write_snapshot(path, SPECS, lambda name: b'\0')
+    assert os.listdir(tmp_path) == []
+
+
+def test_unknown_dtype_code_is_a_checkpoint_error(tmp_path):
+    assert dtype_info('BF16') == ('bfloat16', 2)
+    with pytest.raises(CheckpointError, match="'F8_E4M3'"):
+        dtype_info('F8_E4M3')
+
+    path = str(tmp_path / 'w.safetensors')
+    write_snapshot(path, [("x", 'F8_E4M3', [4], 4)], lambda name: b'\0' * 4)
+    with pytest.raises(CheckpointError):
+        load_snapshot(path, torch=FakeTorch())
+
+
+def _cache_snapshot(cache, specs, data, dtype='bfloat16'):
+    snapshot, marker, _ = cache.paths(cache.key(MANIFEST, dtype))
+    os.makedirs(cache.cache_dir, exist_ok=True)
+    write_snapshot(snapshot, specs, data.__getitem__)
+    with open(marker, 'w') as f:
+        json.dump({"size": os.path.getsize(snapshot)}, f)
+    return snapshot
+
+
+def test_lookup_needs_a_marker_of_the_right_size(tmp_path):
+    cache = WeightCache(str(tmp_path))
+    assert cache.lookup(MANIFEST, 'bfloat16') is None
+
+    snapshot = _cache_snapshot(cache, SPECS, DATA)
+    assert cache.lookup(MANIFEST, 'bfloat16') == snapshot
+    assert cache.lookup(MANIFEST, 'float16') is None
+
+    with open(snapshot, 'ab') as f:
+        f.write(b'\0')
+    assert cache.lookup(MANIFEST, 'bfloat16') is None
+
+
+def test_unusable_snapshot_falls_back_to_the_checkpoint(tmp_path):
+    cache = WeightCache(str(tmp_path))
+    _cache_snapshot(cache, [("x", 'F8_E4M3', [4], 4)], {"x": b'\0' * 4})
+    assert cache.load(MANIFEST, 'bfloat16', torch=FakeTorch()) == ({}, False)
+
+
+def test_eviction_keeps_the_most_recent_snapshots(tmp_path):
+    cache = WeightCache(str(tmp_path), keep=2)
+    for age, dtype in enumerate(['float32', 'float16', 'bfloat16']):
+        marker = cache.paths(cache.key(MANIFEST, dtype))[1]
+        _cache_snapshot(cache, SPECS, DATA, dtype)
+        os.utime(marker, (1000 + age, 1000 + age))
+
+    cache.evict(exclude=cache.key(MANIFEST, 'bfloat16'))
+
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(p) for dtype in ('float16', 'bfloat16')
+        for p in cache.paths(cache.key(MANIFEST, dtype))[:2])
+
+
+def test_only_zip_checkpoints_are_memory_mapped(tmp_path):
+    zipped = str(tmp_path / 'new.pt')
+    with zipfile.ZipFile(zipped, 'w') as archive:
+        archive.writestr('archive/data.pkl', b'')
+    legacy = str(tmp_path / 'legacy.bin')
+    with open(legacy, 'wb') as f:
+        f.write(b'\x80\x02legacy pickle')
+
+    torch = FakeTorch()
+    load_torch_shard(zipped, torch)
+    load_torch_shard(legacy, torch)
+    assert torch.loads == [True, False]
+
+    old_torch = FakeTorch(mmap_supported=False)
+    load_torch_shard(zipped, old_torch)
+    assert old_torch.loads == [False]
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Cache of dtype-converted model weights
+The first load with --convert_model_dtype streams every tensor of the
+checkpoint through the conversion, one tensor at a time, into a safetensors
+snapshot on the volume. The snapshot is keyed by the checkpoint manifest
+hash and the target dtype. Later loads, including every cold start under
+min_replicas = 0, memory-map the snapshot instead of converting again, and
+pages are only read when a weight is first touched (e.g. copied to the GPU).
+
+A snapshot counts only once its marker file exists, and it is written
+under a lock file, so workers sharing a volume never read a half-written
+snapshot or convert the same checkpoint twice at once.
+
+Usage:
+    python weight_cache.py /workspace/wan-s2v-14b/Wan2.2/Wan2.2-S2V-14B --dtype bfloat16
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import shutil
+import zipfile
+import argparse
+
+from checkpoint_manifest import CheckpointError, get_manifest, read_safetensors_header
+
+# safetensors dtype codes: torch dtype name and bytes per element
+SAFETENSORS_DTYPES = {
+    'F64': ('float64', 8), 'F32': ('float32', 4), 'F16': ('float16', 2), 'BF16': ('bfloat16', 2),
+    'I64': ('int64', 8), 'I32': ('int32', 4), 'I16': ('int16', 2), 'I8': ('int8', 1),
+    'U8': ('uint8', 1), 'BOOL': ('bool', 1),
+}
+DTYPE_CODES = {name: code for code, (name, _) in SAFETENSORS_DTYPES.items()}
+# Only floating-point tensors are converted, as model.to(dtype) does
+FLOAT_CODES = {'F64', 'F32', 'F16', 'BF16'}
+
+# Snapshots kept per cache directory (older checkpoints and dtypes are evicted)
+DEFAULT_KEEP_SNAPSHOTS = int(os.environ.get('WAN_WEIGHT_CACHE_KEEP', 2))
+
+# A lock older than this belongs to a worker that died mid-write
+STALE_LOCK_SECONDS = 3600
+
+# Free space kept on the volume beyond the snapshot itself
+DISK_HEADROOM_BYTES = 2 * 1024 ** 3
+
+
+def default_cache_dir():
+    """WAN_WEIGHT_CACHE_DIR, else the network volume when one is mounted (survives cold starts), else /tmp"""
+    override = os.environ.get('WAN_WEIGHT_CACHE_DIR')
+    if override:
+        return override
+    if os.path.isdir('/runpod-volume'):
+        return '/runpod-volume/wan_weight_cache'
+    return '/tmp/wan_weight_cache'
+
+
+def require_torch():
+    try:
+        import torch
+    except ImportError:
+        raise RuntimeError("converting weights requires torch")
+    return torch
+
+
+def dtype_info(code):
+    """(torch dtype name, bytes per element) of a safetensors dtype code"""
+    try:
+        return SAFETENSORS_DTYPES[code]
+    except KeyError:
+        raise CheckpointError(f"unsupported safetensors dtype {code!r}")
+
+
+def dtype_name(dtype):
+    """'bfloat16' for torch.bfloat16 or 'bfloat16'"""
+    return str(dtype).replace('torch.', '')
+
+
+# Snapshot file format (safetensors: u64 header length, JSON header, raw tensor data)
+
+def snapshot_header(specs):
+    """
+    Header bytes for specs [(name, dtype code, shape, nbytes)], padded with
+    spaces so the tensor data starts 8-byte aligned
+    """
+    header = {}
+    offset = 0
+    for name, code, shape, nbytes in specs:
+        header[name] = {"dtype": code, "shape": list(shape), "data_offsets": [offset, offset + nbytes]}
+        offset += nbytes
+    data = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    data += b' ' * (-(8 + len(data)) % 8)
+    return struct.pack('<Q', len(data)) + data
+
+
+def write_snapshot(path, specs, produce):
+    """
+    Stream a safetensors file: the header from specs, then produce(name) for
+    each tensor in order (a bytes-like of exactly nbytes). Written to a
+    temporary name and renamed into place.
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(snapshot_header(specs))
+            for name, _, _, nbytes in specs:
+                data = produce(name)
+                if memoryview(data).nbytes != nbytes:
+                    raise CheckpointError(f"tensor {name}: {memoryview(data).nbytes} bytes, expected {nbytes}")
+                f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def load_snapshot(path, torch=None):
+    """
+    {name: tensor} backed by a private memory map of the snapshot: nothing is
+    read until a tensor is used, and the page cache is shared between loads
+    """
+    torch = torch or require_torch()
+    header = read_safetensors_header(path, os.path.getsize(path))
+    with open(path, 'rb') as f:
+        header_len = struct.unpack('<Q', f.read(8))[0]
+        # ACCESS_COPY is writable (torch.frombuffer needs that) but never writes back
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    base = 8 + header_len
+    tensors = {}
+    for name, info in header.items():
+        start, end = info["data_offsets"]
+        torch_name, itemsize = dtype_info(info["dtype"])
+        dtype = getattr(torch, torch_name)
+        if end == start:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        count = (end - start) // itemsize
+        tensors[name] = torch.frombuffer(mapped, dtype=dtype, count=count, offset=base + start) \
+            .reshape(info["shape"])
+    return tensors
+
+
+# Reading the source checkpoint
+
+def source_tensors(manifest, torch):
+    """
+    Yield (shard, {name: tensor}) for every shard of the checkpoint, lazily:
+    safetensors shards through safe_open, others through a memory-mapped
+    torch.load, so no shard is read whole before its tensors are used
+    """
+    for shard in manifest["shards"]:
+        path = os.path.join(manifest["ckpt_dir"], shard["path"])
+        if shard["format"] == 'safetensors':
+            try:
+                from safetensors import safe_open
+            except ImportError:
+                raise RuntimeError("converting safetensors shards requires safetensors (pip install safetensors)")
+            # Not a with block: the handle stays open while its LazyTensors are referenced
+            handle = safe_open(path, framework='pt')
+            yield shard, {name: LazyTensor(handle, name) for name in handle.keys()}
+        else:
+            state = load_torch_shard(path, torch)
+            for key in ('state_dict', 'model', 'module'):
+                if isinstance(state, dict) and isinstance(state.get(key), dict):
+                    state = state[key]
+            yield shard, {name: value for name, value in state.items() if isinstance(value, torch.Tensor)}
+
+
+def load_torch_shard(path, torch):
+    """
+    torch.load of a .pt/.bin shard, memory-mapped when it is in the zip
+    format; legacy (non-zip) files, and torch without mmap support, load whole
+    """
+    if zipfile.is_zipfile(path):
+        try:
+            return torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+        except TypeError:  # torch < 2.1 has no mmap argument
+            pass
+    return torch.load(path, map_location='cpu', weights_only=True)
+
+
+class LazyTensor:
+    """A safetensors tensor read only when get() is called"""
+
+    def __init__(self, handle, name):
+        self.handle = handle
+        self.name = name
+        self.slice = handle.get_slice(name)
+
+    @property
+    def code(self):
+        return self.slice.get_dtype()
+
+    @property
+    def shape(self):
+        return self.slice.get_shape()
+
+    def get(self):
+        return self.handle.get_tensor(self.name)
+
+
+def tensor_spec(name, tensor, target_code):
+    """(name, code, shape, nbytes) of a tensor after conversion"""
+    if isinstance(tensor, LazyTensor):
+        code, shape = tensor.code, list(tensor.shape)
+    else:
+        code = DTYPE_CODES.get(dtype_name(tensor.dtype))
+        if code is None:
+            raise CheckpointError(f"tensor {name}: unsupported dtype {dtype_name(tensor.dtype)}")
+        shape = list(tensor.shape)
+    if code in FLOAT_CODES:
+        code = target_code
+    count = 1
+    for dim in shape:
+        count *= dim
+    return name, code, shape, count * dtype_info(code)[1]
+
+
+def tensor_bytes(tensor, dtype, torch):
+    """Raw bytes of a tensor converted to dtype (floating-point tensors only)"""
+    if isinstance(tensor, LazyTensor):
+        tensor = tensor.get()
+    if tensor.is_floating_point():
+        tensor = tensor.to(dtype)
+    # A uint8 view of the contiguous data; numpy shares the memory, nothing is copied
+    return tensor.contiguous().reshape(-1).view(torch.uint8).numpy()
+
+
+# The cache
+
+class WeightCache:
+    """Converted snapshots in cache_dir, keyed by checkpoint manifest hash and dtype"""
+
+    def __init__(self, cache_dir=None, keep=DEFAULT_KEEP_SNAPSHOTS):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.keep = keep
+
+    def key(self, manifest, dtype):
+        return f"{manifest['hash'][:32]}-{dtype_name(dtype)}"
+
+    def paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.safetensors", f"{base}.json", f"{base}.lock"
+
+    def lookup(self, manifest, dtype):
+        """Path of a complete snapshot for this checkpoint and dtype, or None"""
+        snapshot, marker, _ = self.paths(self.key(manifest, dtype))
+        try:
+            with open(marker) as f:
+                info = json.load(f)
+            if os.path.getsize(snapshot) != info["size"]:
+                raise CheckpointError("size changed")
+            read_safetensors_header(snapshot, info["size"])
+        except (OSError, ValueError, KeyError, CheckpointError):
+            return None
+        os.utime(marker)  # recency for eviction
+        return snapshot
+
+    def load(self, manifest, dtype, torch=None):
+        """
+        {name: tensor} in dtype: memory-mapped from the snapshot when there is
+        one, otherwise converted now and written to the cache on the way.
+        Returns (state dict, True when it came from the cache).
+        """
+        torch = torch or require_torch()
+        try:
+            snapshot = self.lookup(manifest, dtype)
+            if snapshot is not None:
+                print(f"♻️ Memory-mapping converted weights from {snapshot}")
+                return load_snapshot(snapshot, torch), True
+
+            snapshot = self.convert(manifest, dtype, torch)
+            if snapshot is not None:
+                return load_snapshot(snapshot, torch), False
+        except CheckpointError as e:
+            print(f"⚠️ Converted weights unusable ({e}), loading the original checkpoint")
+
+        # No room, another worker is writing it, or an unreadable snapshot: convert in memory as before
+        print(f"🔁 Converting weights to {dtype_name(dtype)} in memory")
+        state = {}
+        for _, tensors in source_tensors(manifest, torch):
+            for name, tensor in tensors.items():
+                tensor = tensor.get() if isinstance(tensor, LazyTensor) else tensor
+                state[name] = tensor.to(dtype) if tensor.is_floating_point() else tensor
+        return state, False
+
+    def convert(self, manifest, dtype, torch=None):
+        """
+        Write the converted snapshot; returns its path, or None when another
+        worker holds the lock or the volume lacks space
+        """
+        torch = torch or require_torch()
+        target = getattr(torch, dtype_name(dtype))
+        key = self.key(manifest, dtype)
+        snapshot, marker, lock = self.paths(key)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        if not self._acquire(lock):
+            print(f"⏳ Another worker is writing {key}, not caching this conversion")
+            return None
+        try:
+            start = time.perf_counter()
+            specs = []
+            sources = {}
+            for _, tensors in source_tensors(manifest, torch):
+                for name, tensor in tensors.items():
+                    specs.append(tensor_spec(name, tensor, DTYPE_CODES[dtype_name(target)]))
+                    sources[name] = tensor
+            size = len(snapshot_header(specs)) + sum(spec[3] for spec in specs)
+
+            self.evict(exclude=key)
+            free = shutil.disk_usage(self.cache_dir).free
+            if free < size + DISK_HEADROOM_BYTES:
+                print(f"⚠️ {free / 1024 ** 3:.1f} GB free in {self.cache_dir}, "
+                      f"converted weights need {size / 1024 ** 3:.1f} GB; not caching")
+                return None
+
+            print(f"💾 Writing {len(specs)} converted tensors ({size / 1024 ** 3:.1f} GB) to {snapshot}")
+            write_snapshot(snapshot, specs, lambda name: tensor_bytes(sources[name], target, torch))
+            with open(marker, 'w') as f:
+                json.dump({"manifest_hash": manifest["hash"], "ckpt_dir": manifest["ckpt_dir"],
+                           "dtype": dtype_name(target), "size": size, "tensors": len(specs),
+                           "created_at": time.time(),
+                           "convert_seconds": round(time.perf_counter() - start, 3)}, f)
+            return snapshot
+        finally:
+            os.remove(lock)
+
+    def _acquire(self, lock):
+        try:
+            if time.time() - os.path.getmtime(lock) > STALE_LOCK_SECONDS:
+                os.remove(lock)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def evict(self, exclude=None):
+        """Drop the least recently used snapshots beyond keep - 1, making room for a new one"""
+        try:
+            markers = [name for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+        except OSError:
+            return
+        markers = [name for name in markers if name[:-5] != exclude]
+        markers.sort(key=lambda name: os.path.getmtime(os.path.join(self.cache_dir, name)))
+        for name in markers[:max(0, len(markers) - (self.keep - 1))]:
+            key = name[:-5]
+            snapshot, marker, _ = self.paths(key)
+            print(f"🧹 Evicting converted weights {key}")
+            for path in (marker, snapshot):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Pre-build the converted-weights snapshot of a checkpoint')
+    parser.add_argument('ckpt_dir')
+    parser.add_argument('--dtype', default='bfloat16')
+    parser.add_argument('--cache-dir', default=default_cache_dir())
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP_SNAPSHOTS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    manifest = get_manifest(args.ckpt_dir)
+    if not manifest or not manifest["shards"]:
+        print(f"❌ No model files in {args.ckpt_dir}")
+        return 1
+
+    cache = WeightCache(args.cache_dir, keep=args.keep)
+    existing = cache.lookup(manifest, args.dtype)
+    if existing:
+        print(f"✅ Already cached: {existing}")
+        return 0
+    snapshot = cache.convert(manifest, args.dtype)
+    if snapshot is None:
+        return 1
+    print(f"✅ Converted weights written to {snapshot}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())